@@ -1,10 +1,17 @@
+import os
+import copy
 import yaml
 import pathlib
-from docker_generator import docker_generator
+from rosdistro_cache import getCacheDir
 
 class RosEnvParam:
 
-    def generate(name:str, gen: docker_generator) -> None:
+    _cache = {} # resolved path -> (mtime, size, parsed file), kept between the commands by the daemon
+
+    def generate(name:str, gen: "docker_generator") -> None:
+        # docker_generator imports docker_tools, only the commands which write the param file pay for it
+        from docker_generator import writeIfChanged
+
         # Define your data as a Python dictionary
         data = {
             "image_name": gen.iname,
@@ -14,9 +21,23 @@ class RosEnvParam:
                 "type": gen.ros_type
             },
             "option":{
+                "image profile": gen.image_profile.name,
                 "gazebo": gen.isGazebo,
                 "volume shared": gen.isShared,
                 "volume path list": gen.volumes_path_list,
+                "layered": gen.isLayered,
+                "colcon cache": gen.isCache,
+                "package deps": gen.isPackageDeps,
+                "resources": gen.resources.toDict(),
+                "transport":{
+                    "mode": gen.dds_profile.transport,
+                    "dds": gen.dds_profile.dds,
+                    "shm size": gen.dds_profile.shm_size
+                },
+                "base image":{
+                    "status": gen.isBaseImage,
+                    "tag": gen.base_image.tag if gen.isBaseImage else None
+                },
                 "additionnal":{
                     "dependencies":{
                         "status": gen.isDependencies,
@@ -30,10 +51,25 @@ class RosEnvParam:
             }
         }
 
+        # The snapshots of the container are not generated, keep them while the image is the same
+        if os.path.isfile(name):
+            previous = RosEnvParam.load(name)
+            if isinstance(previous, dict) and previous.get("image_name") == gen.iname and previous.get("snapshots"):
+                data["snapshots"] = previous["snapshots"]
+
         # Write the dictionary to a YAML file
-        with open(name, "w") as file:
-            yaml.dump(data, file, sort_keys=False, default_flow_style=False)
-        print(name," file created")
+        status = writeIfChanged(name, yaml.dump(data, sort_keys=False, default_flow_style=False))
+        print(name, f" file {status}")
+        RosEnvParam.register(name)
+
+    def setSnapshots(path: str, snapshots: list[dict]) -> None:
+        """
+        Save the list of the snapshots of the environment in its param file.
+        """
+        from docker_generator import writeIfChanged
+        data = RosEnvParam.load(path)
+        data["snapshots"] = snapshots
+        writeIfChanged(pathlib.Path(path), yaml.dump(data, sort_keys=False, default_flow_style=False))
 
     def exist(path: str) -> pathlib.Path:
         target = pathlib.Path(path)
@@ -42,7 +78,43 @@ class RosEnvParam:
         raise FileExistsError(f"This path {path} doesn't lead to a .txt file.")
 
 
+    def register(path: str) -> None:
+        """
+        Add the param file to the list of the known environments (used by the status command).
+        """
+        known = RosEnvParam.known()
+        path = pathlib.Path(path).resolve()
+        if path in known:
+            return
+        registry = getCacheDir() / "environments.yaml"
+        registry.parent.mkdir(parents=True, exist_ok=True)
+        tmp = registry.with_suffix(".tmp")
+        with open(tmp, "w") as file:
+            yaml.safe_dump([str(param) for param in known + [path]], file)
+        os.replace(tmp, registry)
+
+    def known() -> list[pathlib.Path]:
+        """
+        :return: the param files created on this computer which still exist
+        """
+        try:
+            with open(getCacheDir() / "environments.yaml", "r") as file:
+                paths = yaml.safe_load(file) or []
+        except (OSError, yaml.YAMLError):
+            return []
+        return [pathlib.Path(path) for path in paths if pathlib.Path(path).is_file()]
+
     def load(path: pathlib.Path):
-        with open(path, "r") as param_file:
-            ros_env_param = yaml.safe_load(param_file)
-        return ros_env_param
\ No newline at end of file
+        """
+        Parse the param file, or take it from the cache if it didn't change since it was parsed.
+
+        :return: a copy the caller can modify
+        """
+        path = pathlib.Path(path).resolve()
+        stat = path.stat()
+        cached = RosEnvParam._cache.get(path)
+        if cached == None or cached[:2] != (stat.st_mtime_ns, stat.st_size):
+            with open(path, "r") as param_file:
+                cached = (stat.st_mtime_ns, stat.st_size, yaml.safe_load(param_file))
+            RosEnvParam._cache[path] = cached
+        return copy.deepcopy(cached[2])
\ No newline at end of file
@@ -0,0 +1,165 @@
+import io
+import os
+import sys
+import json
+import shutil
+import hashlib
+import pathlib
+from docker_api import docker_api
+from docker_tools import runProcess, printLine, QUERY_TIMEOUT
+from rosdistro_cache import getCacheDir
+
+
+BASE_LABEL = "ros-env.base"
+BASE_IMAGE_LABEL = "ros-env.base-image" # Set on the project images, give the base they are built on
+REPOSITORY = "ros-env-base"
+
+
+class base_image:
+    """
+    Image shared by every environment with the same distro, image profile, Gazebo option and default dependencies. The tag
+    contain the hash of its Dockerfile, so two environments asking for the same base get the same image and a
+    change of the default dependencies give a new base.
+    """
+
+    def __init__(self, gen):
+        """
+        :param gen: the generator of the environment, only its ROS/Gazebo part is used.
+        :type gen: docker_generator
+        """
+        Dockerfile = io.StringIO()
+        if gen.isLayered:
+            Dockerfile.write("# syntax=docker/dockerfile:1\n")
+        gen.write_base(Dockerfile, withUserDeps=False)
+        Dockerfile.write("\n")
+        self.dockerfile = Dockerfile.getvalue()
+
+        digest = hashlib.sha256(self.dockerfile.encode()).hexdigest()[:12]
+        profile = "" if gen.image_profile.name == "desktop" else f"{gen.image_profile.name}-"
+        self.tag = f"{REPOSITORY}:{gen.ros_distro}-{profile}{'gazebo' if gen.isGazebo else 'nogazebo'}-{digest}"
+        self.labels = {BASE_LABEL: "1", f"{BASE_LABEL}.distro": gen.ros_distro, f"{BASE_LABEL}.gazebo": str(gen.isGazebo).lower(),
+                       f"{BASE_LABEL}.profile": gen.image_profile.name}
+
+    def save(self) -> pathlib.Path:
+        """
+        Keep the Dockerfile of the base in the cache, so it can be built or rebuilt without the environment.
+
+        :return: the directory used as build context
+        """
+        context = getContextDir(self.tag)
+        context.mkdir(parents=True, exist_ok=True)
+        with open(context / "Dockerfile", "w") as Dockerfile:
+            Dockerfile.write(self.dockerfile)
+        with open(context / "labels.json", "w") as labels:
+            json.dump(self.labels, labels)
+        return context
+
+    def build(tag: str) -> bool:
+        """
+        Build a base image from its cached Dockerfile.
+        """
+        context = getContextDir(tag)
+        if not (context / "Dockerfile").is_file():
+            print(f"No Dockerfile saved for the base image {tag}. Run create or create_from again.")
+            return False
+        labels = {}
+        if (context / "labels.json").is_file():
+            with open(context / "labels.json", "r") as labels_file:
+                labels = json.load(labels_file)
+
+        print(f"Building base image {tag} ... ", end="", flush=True)
+        command = ["docker", "build", "-t", tag] + [f"--label={key}={value}" for key, value in labels.items()] + [str(context)]
+        result = runProcess(command, onStdout=printLine, onStderr=lambda line: printLine(line, sys.stderr),
+                            env=dict(os.environ, DOCKER_BUILDKIT="1"))
+        if result.returncode == 0:
+            print("Done")
+            return True
+        else:
+            print("Failed")
+            return False
+
+    def listBases() -> list[dict]:
+        """
+        :return: the base images of the host with the number of project images built on each of them.
+        """
+        bases = listImages(f"{BASE_LABEL}=1") # The project images inherit the label with 0
+        users = {}
+        for image in listImages(BASE_IMAGE_LABEL):
+            base = image["Labels"][BASE_IMAGE_LABEL]
+            users[base] = users.get(base, 0) + 1
+
+        res = []
+        for image in bases:
+            for tag in image.get("RepoTags") or []:
+                res.append({"tag": tag, "id": image["Id"], "size": image.get("Size", 0), "users": users.get(tag, 0)})
+        # Base which are saved but never built
+        for context in sorted(getCacheDir().glob("bases/*")):
+            tag = context.name.replace("_", ":", 1)
+            if not any(base["tag"] == tag for base in res):
+                res.append({"tag": tag, "id": None, "size": 0, "users": users.get(tag, 0)})
+        return res
+
+    def gc() -> list[str]:
+        """
+        Remove the base images and the saved Dockerfiles which are used by no project image.
+
+        :return: the removed tags
+        """
+        removed = []
+        for base in base_image.listBases():
+            # A base never built may be waiting for the first build of its environment
+            if base["users"] != 0 or base["id"] == None:
+                continue
+            error = removeImage(base["tag"])
+            if error != None:
+                print(f"Can't remove {base['tag']}: {error}")
+                continue
+            shutil.rmtree(getContextDir(base["tag"]), ignore_errors=True)
+            removed.append(base["tag"])
+        return removed
+
+
+def listImages(label: str) -> list[dict]:
+    """
+    List the images with a label on the Docker Engine API, or else with the CLI.
+
+    :param label: key or key=value
+    :return: the images as listed by the API: {"Id", "RepoTags", "Size", "Labels"}
+    """
+    client = docker_api.client()
+    if client.available():
+        try:
+            return client.listImages(label=label)
+        except OSError:
+            pass
+    result = runProcess(["docker", "images", "-q", "--no-trunc", "--filter", f"label={label}"], timeout=QUERY_TIMEOUT)
+    ids = sorted(set(result.stdout.split()))
+    if result.returncode != 0 or not ids:
+        return []
+    # The CLI list give human sizes and no labels, inspect give both
+    result = runProcess(["docker", "image", "inspect", *ids], timeout=QUERY_TIMEOUT)
+    if result.returncode != 0:
+        return []
+    return [{"Id": image["Id"], "RepoTags": image.get("RepoTags"), "Size": image.get("Size", 0), "Labels": image["Config"].get("Labels") or {}}
+            for image in json.loads(result.stdout)]
+
+
+def removeImage(tag: str) -> str:
+    """
+    :return: the error of the Docker daemon, None if the image is removed or was already gone
+    """
+    client = docker_api.client()
+    if client.available():
+        try:
+            status, body = client.request("DELETE", f"/images/{tag}")
+            return None if status in (200, 404) else body.decode(errors="replace")
+        except OSError:
+            pass
+    result = runProcess(["docker", "rmi", tag], timeout=QUERY_TIMEOUT)
+    if result.returncode != 0 and "No such image" not in result.stderr:
+        return result.stderr.strip()
+    return None
+
+
+def getContextDir(tag: str) -> pathlib.Path:
+    return getCacheDir() / "bases" / tag.replace(":", "_", 1)
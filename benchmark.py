@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+Benchmark of the ros-env.py lifecycle: create -> build -> start -> stop -> kill -> delete.
+
+Two measures are done:
+    - end to end: each subcommand run as a new ros-env.py process, like a user or a script would.
+    - phases: the functions of docker_generator and docker_tools called in this process, to see where the time goes.
+
+By default the docker CLI is replaced by fake_docker.py and the rosdistro index by a cached copy, so it run in CI
+without Docker nor network. Use --real to benchmark against the Docker daemon.
+
+    ./benchmark.py --repeat 5 --json bench.json
+    ./benchmark.py --baseline bench.json --threshold 1.3   # exit 1 if a measure is 30% slower than the baseline
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import pathlib
+import statistics
+import subprocess
+import contextlib
+
+
+ROOT = pathlib.Path(__file__).resolve().parent
+COMMANDS = ["create", "build", "start", "stop", "kill", "delete"]
+FAKE_DISTRIBUTIONS = {"humble": "ros2", "jazzy": "ros2", "rolling": "ros2", "noetic": "ros1"}
+
+
+def setupFakeBackend(folder: pathlib.Path, latency: float) -> dict:
+    """
+    Put fake docker and xhost executables first in PATH and seed the rosdistro cache.
+
+    :return: the environment variables to use
+    """
+    bin_dir = folder / "bin"
+    bin_dir.mkdir()
+    with open(bin_dir / "docker", "w") as docker:
+        docker.write(f"#!/bin/sh\nexec {sys.executable} {ROOT / 'fake_docker.py'} \"$@\"\n")
+    with open(bin_dir / "xhost", "w") as xhost:
+        xhost.write("#!/bin/sh\nexit 0\n")
+    for executable in ("docker", "xhost"):
+        (bin_dir / executable).chmod(0o755)
+
+    cache_dir = folder / "cache"
+    env = dict(os.environ,
+               PATH=f"{bin_dir}{os.pathsep}{os.environ.get('PATH', '')}",
+               XDG_CACHE_HOME=str(cache_dir),
+               DOCKER_HOST=f"unix://{folder / 'no_daemon.sock'}", # No socket: docker_tools use the (fake) CLI
+               FAKE_DOCKER_STATE=str(folder / "fake_docker_state.json"),
+               FAKE_DOCKER_LATENCY=str(latency))
+    os.environ.update(env)
+
+    from rosdistro_cache import rosdistro_cache
+    cache = rosdistro_cache()
+    cache.data = {"fetched": time.time(), "etag": None, "last_modified": None, "distributions": FAKE_DISTRIBUTIONS}
+    cache.write()
+    return env
+
+
+def timeit(function, repeat: int) -> list[float]:
+    durations = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        function()
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+def runCommand(command: list[str], env: dict, cwd: pathlib.Path) -> None:
+    result = subprocess.run([sys.executable, str(ROOT / "ros-env.py")] + command, env=env, cwd=cwd,
+                            stdin=subprocess.DEVNULL, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"ros-env.py {' '.join(command)} failed:\n{result.stdout}{result.stderr}")
+
+
+def benchEndToEnd(env: dict, workdir: pathlib.Path, repeat: int, offline: bool, commands: list[str]) -> dict:
+    """
+    Run the whole lifecycle repeat times, each subcommand in a new process.
+    """
+    options = ["--offline"] if offline else []
+    arguments = {"create": ["create", "-v", "./ros_ws"]}
+    results = {command: [] for command in commands}
+    for i in range(repeat):
+        for command in commands:
+            start = time.perf_counter()
+            runCommand(options + arguments.get(command, [command]), env, workdir)
+            results[command].append(time.perf_counter() - start)
+    return results
+
+
+def benchPhases(workdir: pathlib.Path, repeat: int, offline: bool) -> dict:
+    """
+    Time the generation and docker queries in this process.
+    """
+    from rosdistro_cache import rosdistro_cache
+    from docker_generator import docker_generator
+    from docker_tools import docker_tools, buildHash, contextSize
+    from RosEnvParam import RosEnvParam
+
+    results = {}
+    with contextlib.chdir(workdir), open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        gen = docker_generator("bench", None, True, ["./ros_ws"], False, ros_distro="humble", offline=offline)
+        results["rosdistro lookup (cold)"] = timeit(lambda: rosdistro_cache(offline=offline).getType("humble"), repeat)
+        cache = rosdistro_cache(offline=offline)
+        results["rosdistro lookup (warm)"] = timeit(lambda: cache.getType("humble"), repeat)
+        results["generate Dockerfile"] = timeit(gen.generate_Dockerfile, repeat)
+        results["generate .env"] = timeit(gen.generate_env_file, repeat)
+        results["generate .dockerignore"] = timeit(gen.generate_dockerignore, repeat)
+        results["generate docker-compose.yaml"] = timeit(gen.generate_docker_compose, repeat)
+        results["write param file"] = timeit(lambda: RosEnvParam.generate(".ros_env_param.yaml", gen), repeat)
+        results["build hash"] = timeit(buildHash, repeat)
+        results["build context size"] = timeit(lambda: contextSize("."), repeat)
+        results["docker isRunning"] = timeit(lambda: docker_tools.isRunning("bench"), repeat)
+        results["docker exist"] = timeit(lambda: docker_tools.exist("bench"), repeat)
+        results["docker imageExist"] = timeit(lambda: docker_tools.imageExist("bench"), repeat)
+    return results
+
+
+def summarize(results: dict) -> dict:
+    return {name: {"median": statistics.median(durations), "min": min(durations), "max": max(durations), "runs": len(durations)}
+            for name, durations in results.items() if durations}
+
+
+def compare(summary: dict, baseline: dict, threshold: float) -> list[str]:
+    """
+    :return: the measures whose median is more than threshold times the one of the baseline
+    """
+    regressions = []
+    for section, measures in summary.items():
+        for name, measure in measures.items():
+            reference = baseline.get(section, {}).get(name)
+            # Below a millisecond the noise is bigger than any regression
+            if reference != None and measure["median"] > 1e-3 and measure["median"] > threshold * reference["median"]:
+                regressions.append(f"{section}/{name}: {measure['median']*1e3:.1f} ms instead of {reference['median']*1e3:.1f} ms")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the create -> build -> start -> stop -> kill -> delete lifecycle of ros-env.py.")
+    parser.add_argument("--real", action="store_true", help="Use the Docker daemon instead of the fake docker CLI. Builds will really run.")
+    parser.add_argument("--online", action="store_true", help="Fetch the rosdistro index (only with --real, the fake backend is always offline)")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of runs of each measure. By default 3")
+    parser.add_argument("--latency", type=float, default=0, help="Milliseconds added to each fake docker call. By default 0")
+    parser.add_argument("--commands", nargs="+", choices=COMMANDS, default=COMMANDS, help="Subcommands of the end to end lifecycle, in order")
+    parser.add_argument("--skip-end-to-end", action="store_true", help="Only measure the phases")
+    parser.add_argument("--json", help="Write the results in this file", required=False)
+    parser.add_argument("--baseline", help="Results of a previous run (--json) to compare with", required=False)
+    parser.add_argument("--threshold", type=float, default=1.5, help="Ratio to the baseline from which a measure is a regression. By default 1.5")
+    args = parser.parse_args()
+
+    folder = pathlib.Path(tempfile.mkdtemp(prefix="ros-env-bench-"))
+    try:
+        offline = not (args.real and args.online)
+        env = dict(os.environ) if args.real else setupFakeBackend(folder, args.latency)
+        workdir = folder / "work"
+        (workdir / "ros_ws" / "src").mkdir(parents=True)
+
+        summary = {"phases": summarize(benchPhases(workdir, args.repeat, offline))}
+        if not args.skip_end_to_end:
+            for generated in ("Dockerfile", ".env", ".dockerignore", "docker-compose.yaml", ".ros_env_param.yaml"):
+                (workdir / generated).unlink(missing_ok=True)
+            summary["end to end"] = summarize(benchEndToEnd(env, workdir, args.repeat, offline, args.commands))
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+    print(f"backend: {'docker daemon' if args.real else 'fake docker'}, runs: {args.repeat}")
+    for section, measures in summary.items():
+        print(f"{section}:")
+        for name, measure in measures.items():
+            print(f"\t{name:32} median {measure['median']*1e3:9.2f} ms   min {measure['min']*1e3:9.2f} ms   max {measure['max']*1e3:9.2f} ms")
+
+    if args.json != None:
+        with open(args.json, "w") as json_file:
+            json.dump(summary, json_file, indent=2)
+
+    if args.baseline != None:
+        with open(args.baseline, "r") as baseline_file:
+            regressions = compare(summary, json.load(baseline_file), args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        sys.exit(1 if regressions else 0)
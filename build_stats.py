@@ -0,0 +1,195 @@
+import re
+import json
+import time
+import base64
+import datetime
+import statistics
+from rosdistro_cache import getCacheDir
+
+
+class build_stats:
+    """
+    Follow the BuildKit rawjson progress of a build (one SolveStatus per line) and keep, for each Dockerfile
+    step, its duration and if the cache was used. The builds are saved in a history file per image.
+    """
+
+    def __init__(self, image: str, build_hash: str = None, profile: str = None):
+        self.image = image
+        self.build_hash = build_hash
+        self.profile = profile
+        self.vertexes = {} # digest -> step
+        self.logs = {} # digest -> last lines, printed when the step fail
+        self.start = time.time()
+
+    def feed(self, line: str) -> bool:
+        """
+        Read one line of the progress output.
+
+        :return: False if the line is not BuildKit json (it should be printed as is)
+        """
+        try:
+            status = json.loads(line)
+        except json.JSONDecodeError:
+            return False
+        if not isinstance(status, dict):
+            return False
+
+        for vertex in status.get("vertexes") or []:
+            step = self.vertexes.setdefault(vertex["digest"], {"name": vertex.get("name", ""), "cached": False, "started": None, "completed": None})
+            was_completed = step["completed"] != None
+            for key in ("started", "completed"):
+                if vertex.get(key):
+                    step[key] = parseTime(vertex[key])
+            step["cached"] = step["cached"] or vertex.get("cached", False)
+            if vertex.get("error"):
+                step["error"] = vertex["error"]
+            if step["completed"] != None and not was_completed:
+                self.printStep(vertex["digest"], step)
+
+        for log in status.get("logs") or []:
+            lines = self.logs.setdefault(log["vertex"], [])
+            lines += base64.b64decode(log.get("data", "")).decode(errors="replace").splitlines()
+            del lines[:-20]
+        return True
+
+    def printStep(self, digest: str, step: dict) -> None:
+        if isInternal(step["name"]):
+            return
+        if step.get("error"):
+            print(f"\n{step['name']}: ERROR {step['error']}")
+            for line in self.logs.get(digest, []):
+                print(f"\t{line}")
+        elif step["cached"]:
+            print(f"\n{step['name']}: CACHED", end="")
+        else:
+            print(f"\n{step['name']}: {getDuration(step):.1f}s", end="")
+
+    def getSteps(self) -> list[dict]:
+        steps = []
+        for step in self.vertexes.values():
+            if isInternal(step["name"]):
+                continue
+            steps.append({"name": step["name"], "instruction": getInstruction(step["name"]), "cached": step["cached"],
+                          "duration": round(getDuration(step), 3), "size": None})
+        return steps
+
+    def record(self, success: bool, history: list[dict] = None, size: int = None) -> dict:
+        """
+        Save the build in the history of the image.
+
+        :param history: the image history (docker API) to get the size of each layer
+        :param size: the size of the built image
+        :return: the saved build
+        """
+        steps = self.getSteps()
+        if history != None:
+            sizes = {normalize(layer.get("CreatedBy", "")): layer.get("Size", 0) for layer in history}
+            for step in steps:
+                step["size"] = sizes.get(normalize(step["instruction"]))
+
+        build = {
+            "time": datetime.datetime.fromtimestamp(self.start).isoformat(timespec="seconds"),
+            "image": self.image,
+            "hash": self.build_hash,
+            "profile": self.profile,
+            "success": success,
+            "size": size,
+            "duration": round(time.time() - self.start, 3),
+            "cache hits": sum(1 for step in steps if step["cached"]),
+            "steps": steps
+        }
+        path = getHistoryPath(self.image)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "a") as history_file:
+            history_file.write(json.dumps(build) + "\n")
+        return build
+
+    def load(image: str) -> list[dict]:
+        """
+        :return: the recorded builds of the image, the oldest first
+        """
+        path = getHistoryPath(image)
+        if not path.is_file():
+            return []
+        builds = []
+        with open(path, "r") as history_file:
+            for line in history_file:
+                try:
+                    builds.append(json.loads(line))
+                except json.JSONDecodeError:
+                    continue
+        return builds
+
+    def byProfile(builds: list[dict]) -> dict:
+        """
+        :return: {image profile: last successful build with this profile}, the builds recorded before the
+                 profiles are counted as desktop
+        """
+        res = {}
+        for build in builds:
+            if build["success"]:
+                res[build.get("profile") or "desktop"] = build
+        return res
+
+    def regressions(builds: list[dict], threshold: float = 1.5, minimum: float = 5.0) -> list[dict]:
+        """
+        Compare the steps of the last build with the median of the previous builds where they were not cached.
+
+        :param threshold: ratio from which a step is a regression
+        :param minimum: ignore the steps faster than this, in seconds
+        """
+        if len(builds) < 2:
+            return []
+        previous = {}
+        for build in builds[:-1]:
+            for step in build["steps"]:
+                if not step["cached"]:
+                    previous.setdefault(step["instruction"], []).append(step["duration"])
+
+        res = []
+        for step in builds[-1]["steps"]:
+            if step["cached"] or step["instruction"] not in previous or step["duration"] < minimum:
+                continue
+            median = statistics.median(previous[step["instruction"]])
+            if median > 0 and step["duration"] / median >= threshold:
+                res.append({"instruction": step["instruction"], "duration": step["duration"], "median": median})
+        return res
+
+
+def getHistoryPath(image: str):
+    return getCacheDir() / "builds" / (image.replace("/", "_").replace(":", "_") + ".jsonl")
+
+
+def parseTime(value: str) -> float:
+    # BuildKit give RFC 3339 timestamps with nanoseconds, python only parse microseconds
+    match = re.fullmatch(r"(.*T\d\d:\d\d:\d\d)(?:\.(\d+))?(Z|[+-]\d\d:\d\d)", value)
+    if match == None:
+        return None
+    date, fraction, zone = match.groups()
+    res = datetime.datetime.fromisoformat(date + ("+00:00" if zone == "Z" else zone)).timestamp()
+    return res + (float("0." + fraction) if fraction else 0.0)
+
+
+def getDuration(step: dict) -> float:
+    if step["started"] == None or step["completed"] == None:
+        return 0.0
+    return max(0.0, step["completed"] - step["started"])
+
+
+def isInternal(name: str) -> bool:
+    # BuildKit also report the context transfer, metadata loading and exporting steps
+    return name.startswith("[internal]") or not re.match(r"\[[^\]]*\d+/\d+\]", name)
+
+
+def getInstruction(name: str) -> str:
+    # "[stage-0  3/12] RUN apt-get update" -> "RUN apt-get update"
+    return re.sub(r"^\[[^\]]*\]\s*", "", name)
+
+
+def normalize(instruction: str) -> str:
+    # The image history write "RUN /bin/sh -c cmd # buildkit" for "RUN cmd"
+    instruction = re.sub(r"^RUN \|\d+ (?:\S+=\S*\s+)*", "RUN ", instruction) # Build args used by the step
+    instruction = instruction.replace("/bin/sh -c ", "").replace("\\\n", " ")
+    instruction = re.sub(r"\s*# buildkit$", "", instruction)
+    instruction = re.sub(r"--mount=\S+\s*", "", instruction)
+    return " ".join(instruction.split())
@@ -0,0 +1,89 @@
+import os
+import pathlib
+
+
+CGROUP_ROOT = pathlib.Path("/sys/fs/cgroup")
+
+
+def getCgroupPath(container_id: str) -> pathlib.Path:
+    """
+    Find the cgroup v2 folder of a container, with the systemd or the cgroupfs driver of docker.
+
+    :param container_id: full ID of the container
+    :return: the folder or None if it is not readable (cgroup v1, rootless, other host)
+    """
+    for path in (CGROUP_ROOT / "system.slice" / f"docker-{container_id}.scope", CGROUP_ROOT / "docker" / container_id):
+        if (path / "cpu.stat").is_file():
+            return path
+    return None
+
+
+def readCpuUsage(path: pathlib.Path) -> float:
+    """
+    :return: CPU time used by the container since it started, in seconds
+    """
+    with open(path / "cpu.stat", "r") as cpu_stat:
+        return parseCpuStat(cpu_stat.read())
+
+
+def readMemory(path: pathlib.Path) -> int:
+    """
+    :return: memory used by the container, in bytes
+    """
+    with open(path / "memory.current", "r") as memory:
+        return int(memory.read())
+
+
+def parseCpuStat(text: str) -> float:
+    for line in text.splitlines():
+        key, value = line.split()
+        if key == "usage_usec":
+            return int(value) / 1e6
+    return 0.0
+
+
+def parseIoStat(text: str) -> tuple[int, int]:
+    """
+    :return: the bytes read and written on all the devices ("8:0 rbytes=1 wbytes=2 rios=3 ...", one line per device)
+    """
+    read = write = 0
+    for line in text.splitlines():
+        for field in line.split()[1:]:
+            key, _, value = field.partition("=")
+            if key == "rbytes":
+                read += int(value)
+            elif key == "wbytes":
+                write += int(value)
+    return read, write
+
+
+class cgroup_reader:
+    """
+    Keep the stat files of a cgroup open: a sample is one pread per file, without path lookup nor open/close.
+    """
+
+    FILES = ["cpu.stat", "memory.current", "io.stat"]
+
+    def __init__(self, path: pathlib.Path):
+        self.fds = {}
+        for name in cgroup_reader.FILES:
+            try:
+                self.fds[name] = os.open(path / name, os.O_RDONLY)
+            except FileNotFoundError: # io.stat only exist when the io controller is enabled
+                if name != "io.stat":
+                    self.close()
+                    raise
+
+    def read(self, name: str) -> str:
+        return os.pread(self.fds[name], 65536, 0).decode() if name in self.fds else ""
+
+    def sample(self) -> tuple[float, int, int, int]:
+        """
+        :return: CPU seconds, memory bytes, bytes read and bytes written since the container started
+        """
+        return (parseCpuStat(self.read("cpu.stat")), int(self.read("memory.current")), *parseIoStat(self.read("io.stat")))
+
+    def close(self) -> None:
+        for fd in self.fds.values():
+            os.close(fd)
+        self.fds = {}
@@ -0,0 +1,81 @@
+import subprocess
+from docker_tools import docker_tools, runProcess, QUERY_TIMEOUT
+
+
+CCACHE_VOLUME = "ros-env-ccache" # Shared by every environment
+CCACHE_DIR = "/ccache"
+COLCON_FOLDERS = ("build", "install", "log")
+
+
+class colcon_cache:
+    """
+    Access to the ccache volume shared by the environments created with --colcon-cache. The ccache commands run in
+    the container when it is running, else in a throwaway container of its image.
+    """
+
+    def __init__(self, name: str, image: str):
+        self.name = name
+        self.image = image
+
+    def ccache(self, *args: str) -> subprocess.CompletedProcess:
+        if docker_tools.isRunning(self.name):
+            command = ["docker", "exec", self.name, "ccache", *args]
+        else:
+            command = ["docker", "run", "--rm", "--entrypoint", "ccache",
+                       "-v", f"{CCACHE_VOLUME}:{CCACHE_DIR}", "-e", f"CCACHE_DIR={CCACHE_DIR}",
+                       self.image, *args]
+        return runProcess(command, timeout=QUERY_TIMEOUT)
+
+    def stats(self) -> dict:
+        """
+        :return: the ccache counters (ccache --print-stats) with the hit rate and the size in bytes
+        """
+        result = self.ccache("--print-stats")
+        if result.returncode != 0:
+            raise RuntimeError(f"ccache failed: {result.stderr.strip()}")
+        stats = {}
+        for line in result.stdout.splitlines():
+            key, _, value = line.partition("\t")
+            if value.strip().isdigit():
+                stats[key] = int(value)
+
+        hits = stats.get("direct_cache_hit", 0) + stats.get("preprocessed_cache_hit", 0)
+        calls = hits + stats.get("cache_miss", 0)
+        stats["hits"] = hits
+        stats["hit_rate"] = hits / calls if calls != 0 else 0.0
+        stats["size"] = stats.get("cache_size_kibibyte", 0) * 1024
+        stats["max_size"] = stats.get("max_cache_size_kibibyte", 0) * 1024
+        return stats
+
+    def prune(self, max_size: str = None) -> bool:
+        """
+        Evict the oldest entries until the cache fit in its maximum size.
+
+        :param max_size: new maximum size of the cache (ex: 5G), kept in the ccache configuration
+        """
+        if max_size != None:
+            result = self.ccache("--max-size", max_size)
+            if result.returncode != 0:
+                print(result.stderr.strip())
+                return False
+        result = self.ccache("--cleanup")
+        if result.returncode != 0:
+            print(result.stderr.strip())
+        return result.returncode == 0
+
+    def clear(self) -> bool:
+        result = self.ccache("--clear", "--zero-stats")
+        if result.returncode != 0:
+            print(result.stderr.strip())
+        return result.returncode == 0
+
+
+def getColconVolumes(name: str, workspaces: list[str]) -> dict:
+    """
+    :return: {volume name: path in the container} of the build/install/log folders of each workspace
+    """
+    volumes = {}
+    for workspace in workspaces:
+        for folder in COLCON_FOLDERS:
+            volumes[f"{name}-{workspace}-{folder}"] = f"/home/${{USER}}/{workspace}/{folder}"
+    return volumes
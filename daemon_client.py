@@ -0,0 +1,121 @@
+"""
+Thin client of the ros-env daemon (env_daemon.py). Only a few small standard modules are imported, a command run
+by the daemon doesn't pay the import of yaml, requests, asyncio and the generators.
+"""
+import os
+import sys
+import json
+import stat
+import socket
+import signal
+
+
+# Sent to the command running in the daemon, the terminal only send them to this process
+FORWARDED_SIGNALS = [signal.SIGINT, signal.SIGTERM, signal.SIGHUP, signal.SIGWINCH]
+FALLBACK_DIR = "/tmp" # Without XDG_RUNTIME_DIR, the socket is in a private folder of it
+
+
+def getDaemonSocket() -> str:
+    """
+    Return the path of the socket of the daemon, in XDG_RUNTIME_DIR or else in a private folder of /tmp.
+
+    :raises PermissionError: if the folder in /tmp belongs to another user or other users can write in it
+    """
+    runtime = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime:
+        return os.path.join(runtime, "ros-env.sock")
+    folder = os.path.join(FALLBACK_DIR, f"ros-env-{os.getuid()}")
+    try:
+        os.mkdir(folder, 0o700)
+    except FileExistsError:
+        pass
+    # Another user could have created it first, with a socket of its own inside
+    info = os.lstat(folder)
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid() or info.st_mode & 0o077:
+        raise PermissionError(f"{folder} is not a private folder of the user, remove it")
+    return os.path.join(folder, "ros-env.sock")
+
+
+def getPeerUid(connection: socket.socket) -> int:
+    # struct ucred: pid, uid, gid
+    return int.from_bytes(connection.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, 12)[4:8], sys.byteorder)
+
+
+def connect(path: str = None) -> socket.socket:
+    """
+    :return: a connection to the daemon, None if it is not running or if the socket is not one of the daemon of
+             the user: the command, its terminal and its environment are never sent to another user
+    """
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        connection.connect(path if path != None else getDaemonSocket())
+        if getPeerUid(connection) != os.getuid():
+            connection.close()
+            return None
+    except OSError:
+        connection.close()
+        return None
+    return connection
+
+
+def sendMessage(connection: socket.socket, message: dict, fds: list[int] = None) -> None:
+    raw = json.dumps(message).encode() + b"\n"
+    if fds:
+        sent = socket.send_fds(connection, [raw], fds)
+        raw = raw[sent:]
+    connection.sendall(raw)
+
+
+def request(message: dict, path: str = None) -> dict:
+    """
+    Send a control message (status, stop) and wait for the answer.
+
+    :return: the answer, None if the daemon is not running
+    """
+    connection = connect(path)
+    if connection == None:
+        return None
+    with connection:
+        sendMessage(connection, message)
+        line = connection.makefile("rb").readline()
+    return json.loads(line) if line else None
+
+
+def forward(argv: list[str]) -> int:
+    """
+    Run a command of ros-env.py in the daemon, with the stdin, stdout and stderr of this process.
+
+    :param argv: the arguments of ros-env.py
+    :return: the exit code of the command. None if no daemon is running or it refused the command because the
+             sources changed since it started: run the command directly.
+    """
+    connection = connect()
+    if connection == None:
+        return None
+    with connection:
+        try:
+            sendMessage(connection, {"argv": argv, "cwd": os.getcwd(), "env": dict(os.environ)}, [0, 1, 2])
+        except OSError: # A closed stdin, a daemon which is stopping
+            return None
+        reader = connection.makefile("rb")
+        line = reader.readline()
+        if not line or json.loads(line).get("stale"):
+            return None
+
+        # The command is started, from now it can't be run again directly
+        def forwardSignal(sig, frame):
+            try:
+                sendMessage(connection, {"signal": sig})
+            except OSError:
+                pass
+
+        handlers = {sig: signal.signal(sig, forwardSignal) for sig in FORWARDED_SIGNALS}
+        try:
+            line = reader.readline()
+        finally:
+            for sig, handler in handlers.items():
+                signal.signal(sig, handler)
+    if not line:
+        print("The ros-env daemon stopped during the command.")
+        return 1
+    return json.loads(line)["exit"]
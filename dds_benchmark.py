@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Throughput/latency benchmark of the DDS transport, run inside the container:
+
+    python3 /etc/ros-env/dds/dds_benchmark.py --size 4000000 --count 200
+
+An echo node is started in an other process, so the messages go through the inter-process transport (shared
+memory or UDP loopback depending on the DDS profile). The ping node send a message, wait for its echo and
+measure the round trip.
+"""
+import sys
+import time
+import struct
+import argparse
+import subprocess
+import rclpy
+from rclpy.node import Node
+from rclpy.qos import QoSProfile, ReliabilityPolicy, HistoryPolicy
+from std_msgs.msg import UInt8MultiArray
+
+
+QOS = QoSProfile(depth=10, reliability=ReliabilityPolicy.RELIABLE, history=HistoryPolicy.KEEP_LAST)
+
+
+class echo(Node):
+
+    def __init__(self):
+        super().__init__("ros_env_bench_echo")
+        self.publisher = self.create_publisher(UInt8MultiArray, "ros_env_bench/pong", QOS)
+        self.create_subscription(UInt8MultiArray, "ros_env_bench/ping", self.publisher.publish, QOS)
+
+
+class ping(Node):
+
+    def __init__(self, size: int):
+        super().__init__("ros_env_bench_ping")
+        self.publisher = self.create_publisher(UInt8MultiArray, "ros_env_bench/ping", QOS)
+        self.create_subscription(UInt8MultiArray, "ros_env_bench/pong", self.onPong, QOS)
+        self.msg = UInt8MultiArray()
+        self.payload = bytearray(max(size, 8))
+        self.received = None
+
+    def onPong(self, msg: UInt8MultiArray) -> None:
+        self.received = struct.unpack_from("<Q", bytes(msg.data[:8]))[0]
+
+    def roundTrip(self, seq: int, timeout: float) -> float:
+        """
+        :return: the round trip time in seconds, None if the echo didn't come back in time
+        """
+        struct.pack_into("<Q", self.payload, 0, seq)
+        self.msg.data = self.payload
+        self.received = None
+        start = time.perf_counter()
+        self.publisher.publish(self.msg)
+        while self.received != seq:
+            rclpy.spin_once(self, timeout_sec=timeout)
+            if time.perf_counter() - start > timeout:
+                return None
+        return time.perf_counter() - start
+
+
+def percentile(values: list[float], p: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p / 100 * len(values)))]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Round trip latency and throughput of the DDS transport between two processes.")
+    parser.add_argument("--size", type=int, default=1000000, help="payload size in bytes. By default 1 MB (a small point cloud)")
+    parser.add_argument("--count", type=int, default=100, help="number of round trips")
+    parser.add_argument("--timeout", type=float, default=2.0, help="maximum time for one round trip in seconds")
+    parser.add_argument("--echo", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    rclpy.init()
+    if args.echo:
+        rclpy.spin(echo())
+        sys.exit(0)
+
+    echo_process = subprocess.Popen([sys.executable, __file__, "--echo"])
+    try:
+        node = ping(args.size)
+        # Wait for the discovery: the first round trip which come back
+        deadline = time.time() + 10
+        while node.roundTrip(0, 0.2) == None:
+            if time.time() > deadline:
+                print("The echo node never answered.")
+                sys.exit(1)
+
+        rtts = []
+        lost = 0
+        start = time.perf_counter()
+        for seq in range(1, args.count + 1):
+            rtt = node.roundTrip(seq, args.timeout)
+            if rtt == None:
+                lost += 1
+            else:
+                rtts.append(rtt)
+        elapsed = time.perf_counter() - start
+
+        if len(rtts) == 0:
+            print("All the messages were lost.")
+            sys.exit(1)
+        print(f"payload: {args.size} bytes, round trips: {len(rtts)}, lost: {lost}")
+        print(f"latency (one way): p50 {percentile(rtts, 50)/2*1e3:.3f} ms, p99 {percentile(rtts, 99)/2*1e3:.3f} ms")
+        print(f"throughput: {2*args.size*len(rtts)/elapsed/1e6:.1f} MB/s")
+    finally:
+        echo_process.terminate()
+        echo_process.wait()
+        rclpy.shutdown()
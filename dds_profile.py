@@ -0,0 +1,122 @@
+import re
+import pathlib
+
+
+DDS_DIR = "dds" # Folder generated next to the Dockerfile, mounted in the container
+CONTAINER_DDS_DIR = "/etc/ros-env/dds"
+TRANSPORTS = ["default", "shm", "host"]
+DDS_VENDORS = ["fastdds", "cyclonedds"]
+
+
+class dds_profile:
+    """
+    DDS configuration of a ROS 2 environment.
+
+    - default: docker bridge network, default /dev/shm and DDS configuration.
+    - shm: bigger /dev/shm and a DDS profile which use shared memory between the processes of the container.
+    - host: same profile with the host network and IPC namespace, shared memory also work with the ROS nodes of the host.
+
+    Only Fast DDS use shared memory, Cyclone DDS use UDP with bigger socket buffers.
+    """
+
+    def __init__(self, transport: str = "default", dds: str = "fastdds", shm_size: str = "2gb"):
+        if transport not in TRANSPORTS:
+            raise ValueError(f"{transport} transport is not supported. Choose one of {TRANSPORTS}")
+        if dds not in DDS_VENDORS:
+            raise ValueError(f"{dds} is not supported. Choose one of {DDS_VENDORS}")
+        self.transport = transport
+        self.dds = dds
+        self.shm_size = shm_size
+
+    def isEnabled(self) -> bool:
+        return self.transport != "default"
+
+    def getProfileName(self) -> str:
+        return "fastdds.xml" if self.dds == "fastdds" else "cyclonedds.xml"
+
+    def getSegmentSize(self) -> int:
+        # A quarter of /dev/shm per participant, a point cloud must fit in one segment
+        return min(toBytes(self.shm_size) // 4, 256*1024*1024)
+
+    def getDependencies(self, ros_distro: str) -> list[str]:
+        if self.dds == "cyclonedds":
+            return [f"ros-{ros_distro}-rmw-cyclonedds-cpp"]
+        return []
+
+    def getEnv(self) -> str:
+        if self.dds == "fastdds":
+            return ("RMW_IMPLEMENTATION=rmw_fastrtps_cpp\n"
+                    f"FASTRTPS_DEFAULT_PROFILES_FILE={CONTAINER_DDS_DIR}/{self.getProfileName()}\n")
+        return ("RMW_IMPLEMENTATION=rmw_cyclonedds_cpp\n"
+                f"CYCLONEDDS_URI=file://{CONTAINER_DDS_DIR}/{self.getProfileName()}\n")
+
+    def getCompose(self) -> dict:
+        """
+        :return: the keys to add to the compose service
+        """
+        service = {"shm_size": self.shm_size}
+        if self.transport == "host":
+            service["network_mode"] = "host"
+            service["ipc"] = "host"
+        return service
+
+    def getFiles(self) -> dict[str, str]:
+        """
+        :return: the content of the DDS profile and of the benchmark script, by path from the generated files
+        """
+        with open(pathlib.Path(__file__).parent / "dds_benchmark.py", "r") as benchmark:
+            return {f"{DDS_DIR}/{self.getProfileName()}": self.getFastDDSProfile() if self.dds == "fastdds" else self.getCycloneDDSProfile(),
+                    f"{DDS_DIR}/dds_benchmark.py": benchmark.read()}
+
+    def getFastDDSProfile(self) -> str:
+        return f"""<?xml version="1.0" encoding="UTF-8" ?>
+<!-- Generated by ros-env: shared memory first, UDP for the other hosts -->
+<profiles xmlns="http://www.eprosima.com/XMLSchemas/fastRTPS_Profiles">
+    <transport_descriptors>
+        <transport_descriptor>
+            <transport_id>shm_transport</transport_id>
+            <type>SHM</type>
+            <segment_size>{self.getSegmentSize()}</segment_size>
+            <maxMessageSize>{self.getSegmentSize()}</maxMessageSize>
+        </transport_descriptor>
+        <transport_descriptor>
+            <transport_id>udp_transport</transport_id>
+            <type>UDPv4</type>
+        </transport_descriptor>
+    </transport_descriptors>
+    <participant profile_name="ros_env_participant" is_default_profile="true">
+        <rtps>
+            <userTransports>
+                <transport_id>shm_transport</transport_id>
+                <transport_id>udp_transport</transport_id>
+            </userTransports>
+            <useBuiltinTransports>false</useBuiltinTransports>
+        </rtps>
+    </participant>
+</profiles>
+"""
+
+    def getCycloneDDSProfile(self) -> str:
+        # The shared memory of Cyclone DDS needs the iceoryx RouDi daemon, which nothing starts in the container:
+        # the processes use the loopback with big socket buffers. max is only asked, min would fail on a host
+        # whose net.core.rmem_max is smaller.
+        return f"""<?xml version="1.0" encoding="UTF-8" ?>
+<!-- Generated by ros-env: UDP with big socket buffers, the shared memory of Cyclone DDS needs iox-roudi -->
+<CycloneDDS xmlns="https://cdds.io/config">
+    <Domain Id="any">
+        <Internal>
+            <SocketReceiveBufferSize max="{toBytes(self.shm_size) // 64}"/>
+        </Internal>
+    </Domain>
+</CycloneDDS>
+"""
+
+
+def toBytes(size: str) -> int:
+    """
+    Convert a docker size (ex: 512m, 2gb) into bytes.
+    """
+    match = re.fullmatch(r"(\d+)\s*([bkmg]?)b?", str(size).strip().lower())
+    if match == None:
+        raise ValueError(f"{size} is not a valid size. ex: 512mb, 2gb")
+    return int(match.group(1)) * 1024**"bkmg".index(match.group(2) or "b")
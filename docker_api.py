@@ -0,0 +1,246 @@
+import os
+import json
+import time
+import socket
+import hashlib
+import http.client
+import urllib.parse
+
+
+DEFAULT_SOCKET = "/var/run/docker.sock"
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """
+    HTTP/1.1 connection over a unix socket. http.client keep the socket open between requests
+    as long as each response is fully read.
+    """
+
+    def __init__(self, socket_path: str, timeout: float = 10):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self) -> None:
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+def getSocketPath() -> str:
+    """
+    Return the path of the Docker Engine socket, like the docker CLI: DOCKER_HOST, else the endpoint of the current
+    docker context (DOCKER_CONTEXT or currentContext of ~/.docker/config.json), else the default socket.
+
+    :raises ConnectionError: if the host is not a unix socket (tcp://, ssh://), only the CLI can reach it
+    """
+    host = os.environ.get("DOCKER_HOST") or getContextHost()
+    if not host:
+        return DEFAULT_SOCKET
+    if host.startswith("unix://"):
+        return host[len("unix://"):]
+    raise ConnectionError(f"Docker host {host} is not a unix socket")
+
+
+def getContextHost() -> str:
+    """
+    :return: the docker endpoint of the current docker context, None for the default context
+    """
+    config_dir = os.environ.get("DOCKER_CONFIG") or os.path.expanduser("~/.docker")
+    context = os.environ.get("DOCKER_CONTEXT")
+    if not context:
+        try:
+            with open(os.path.join(config_dir, "config.json"), "r") as config_file:
+                context = json.load(config_file).get("currentContext")
+        except (OSError, ValueError):
+            return None
+    if not context or context == "default":
+        return None
+    # The CLI store the metadata of a context in a folder named by the sha256 of its name
+    meta_path = os.path.join(config_dir, "contexts", "meta", hashlib.sha256(context.encode()).hexdigest(), "meta.json")
+    try:
+        with open(meta_path, "r") as meta_file:
+            return json.load(meta_file)["Endpoints"]["docker"]["Host"]
+    except (OSError, ValueError, KeyError):
+        raise ConnectionError(f"Docker context {context} not found")
+
+
+class docker_api:
+    """
+    Minimal Docker Engine API client. One persistent connection is shared by every call of the process,
+    use docker_api.client() to get it.
+    """
+
+    _client = None
+
+    def __init__(self, socket_path: str = None):
+        if socket_path == None:
+            try:
+                socket_path = getSocketPath()
+            except ConnectionError:
+                socket_path = None # Not available, the callers use the docker CLI
+        self.socket_path = socket_path
+        self.connection = None
+        self.containers = None # {name: inspect data} of all the containers, given by the daemon of ros-env
+
+    def client() -> "docker_api":
+        if docker_api._client == None:
+            docker_api._client = docker_api()
+        return docker_api._client
+
+    def available(self) -> bool:
+        return self.socket_path != None and os.path.exists(self.socket_path)
+
+    def close(self) -> None:
+        if self.connection != None:
+            self.connection.close()
+            self.connection = None
+
+    def request(self, method: str, path: str, body=None, headers: dict = None) -> tuple[int, bytes]:
+        """
+        Send one request on the shared connection. The connection is opened again once if the daemon closed it.
+
+        :return: (status code, raw body)
+        """
+        headers = dict(headers) if headers != None else {}
+        if body != None and not isinstance(body, (bytes, bytearray)):
+            body = json.dumps(body).encode()
+            headers.setdefault("Content-Type", "application/json")
+
+        if self.socket_path == None:
+            raise ConnectionError("The Docker Engine API is only reachable through a unix socket")
+        for retry in (True, False):
+            if self.connection == None:
+                self.connection = UnixHTTPConnection(self.socket_path)
+            try:
+                self.connection.request(method, path, body=body, headers=headers)
+                response = self.connection.getresponse()
+                return response.status, response.read()
+            except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError):
+                self.close()
+                if not retry:
+                    raise
+
+    def get(self, path: str, **query) -> tuple[int, object]:
+        if query:
+            path += "?" + urllib.parse.urlencode(query)
+        status, raw = self.request("GET", path)
+        return status, json.loads(raw) if raw else None
+
+    def inspectContainer(self, name: str) -> dict:
+        """
+        :return: the container inspect data, None if no container have exactly this name
+        """
+        if self.containers != None:
+            if name in self.containers:
+                return self.containers[name]
+            return next((data for data in self.containers.values() if data["Id"] == name), None)
+        status, data = self.get(f"/containers/{urllib.parse.quote(name, safe='')}/json")
+        if status == 404:
+            return None
+        if status != 200:
+            raise ConnectionError(f"Docker API error {status}: {data}")
+        # The daemon also resolve ID prefixes, only keep an exact name or ID
+        if data["Name"].lstrip("/") != name and data["Id"] != name:
+            return None
+        return data
+
+    def inspectImage(self, name: str) -> dict:
+        """
+        :return: the image inspect data, None if the image doesn't exist
+        """
+        status, data = self.get(f"/images/{urllib.parse.quote(name, safe='')}/json")
+        if status == 404:
+            return None
+        if status != 200:
+            raise ConnectionError(f"Docker API error {status}: {data}")
+        return data
+
+    def listImages(self, label: str = None) -> list[dict]:
+        """
+        :param label: only keep the images with this label (key or key=value)
+        """
+        query = {"filters": json.dumps({"label": [label]})} if label != None else {}
+        status, data = self.get("/images/json", **query)
+        if status != 200:
+            raise ConnectionError(f"Docker API error {status}: {data}")
+        return data
+
+    def listContainers(self, all: bool = True, label: str = None) -> list[dict]:
+        query = {"all": "1" if all else "0"}
+        if label != None:
+            query["filters"] = json.dumps({"label": [label]})
+        status, data = self.get("/containers/json", **query)
+        if status != 200:
+            raise ConnectionError(f"Docker API error {status}: {data}")
+        return data
+
+    def imageHistory(self, name: str) -> list[dict]:
+        """
+        :return: the layers of the image, the newest first. None if the image doesn't exist
+        """
+        status, data = self.get(f"/images/{urllib.parse.quote(name, safe='')}/history")
+        if status == 404:
+            return None
+        if status != 200:
+            raise ConnectionError(f"Docker API error {status}: {data}")
+        return data
+
+    def events(self, filters: dict = None, until: float = None, since: float = None):
+        """
+        Subscribe to the events of the daemon on a dedicated connection, without timeout. The request is sent
+        before returning: no event is missed between this call and the first read.
+
+        :param filters: ex {"type": ["container"]}
+        :param since: unix time of the first past event sent, before the new ones
+        :param until: unix time at which the daemon end the stream. A read which still wait a second later raise
+                      TimeoutError.
+        :return: generator of the events, it ends when the daemon close the connection
+        """
+        query = {}
+        if filters != None:
+            query["filters"] = json.dumps(filters)
+        if since != None:
+            query["since"] = f"{since:.9f}"
+        if until != None:
+            query["until"] = f"{until:.9f}"
+        path = "/events" + ("?" + urllib.parse.urlencode(query) if query else "")
+        if self.socket_path == None:
+            raise ConnectionError("The Docker Engine API is only reachable through a unix socket")
+        connection = UnixHTTPConnection(self.socket_path, timeout=max(until - time.time(), 0) + 1 if until != None else None)
+        connection.request("GET", path)
+        response = connection.getresponse()
+        if response.status != 200:
+            connection.close()
+            raise ConnectionError(f"Docker API error {response.status}: {response.read()}")
+        return readEvents(connection, response)
+
+    def version(self) -> dict:
+        """
+        :return: the versions of the daemon, ApiVersion is the highest API version it supports
+        """
+        status, data = self.get("/version")
+        if status != 200:
+            raise ConnectionError(f"Docker API error {status}: {data}")
+        return data
+
+    def stats(self, container_id: str) -> dict:
+        """
+        :return: one sample of the CPU and memory usage of a running container, without waiting for a second sample
+        """
+        status, data = self.get(f"/containers/{urllib.parse.quote(container_id, safe='')}/stats", stream="false", **{"one-shot": "true"})
+        if status != 200:
+            return None
+        return data
+
+
+def readEvents(connection: http.client.HTTPConnection, response: http.client.HTTPResponse):
+    # One json object per line, the chunks of the stream don't follow the lines
+    try:
+        while True:
+            line = response.readline()
+            if not line:
+                return
+            if line.strip():
+                yield json.loads(line)
+    finally:
+        connection.close()
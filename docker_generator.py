@@ -1,12 +1,22 @@
 import pathlib
-import requests
 import yaml
 import os
+import io
+import pwd
+import difflib
+from rosdistro_cache import rosdistro_cache
+from base_image import base_image, BASE_LABEL, BASE_IMAGE_LABEL
+from colcon_cache import getColconVolumes, CCACHE_VOLUME, CCACHE_DIR
+from dds_profile import dds_profile, DDS_DIR, CONTAINER_DDS_DIR
+from image_profile import image_profile
+from resource_profile import resource_profile
+from package_deps import getWorkspaceDependencies
+from docker_tools import BUILD_HASH_LABEL
 
 
 
 class docker_generator():
-    def __init__(self, name:str, iname:str,isGazebo:bool, volumes_path_list: list[str], isShared:bool, env_path=None, dependencies_path=None, ros_distro=None, env_content=None, dep_content=None):
+    def __init__(self, name:str, iname:str,isGazebo:bool, volumes_path_list: list[str], isShared:bool, env_path=None, dependencies_path=None, ros_distro=None, env_content=None, dep_content=None, offline=False, isLayered=False, isBaseImage=False, isCache=False, transport="default", dds="fastdds", shm_size="2gb", resources=None, output_dir=".", ros_type=None, isPackageDeps=False, profile="desktop"):
         """
             This classe generate all necessary for a ros environment in a container.
     
@@ -20,38 +30,62 @@ class docker_generator():
         :param dependencies_path: The path to a .txt file which contain all additionnal dependencies you want to set up.
         :param ros_distro: The version of the ros distro ex: humble, galactic, melodic, noetic
         :type ros_distro: str
+        :param offline: If True the ROS distro is checked only against the cached rosdistro index, without network.
+        :type offline: bool
+        :param isLayered: If True the dependencies are installed in separate layers (base, ROS/Gazebo, user) with BuildKit cache mounts for apt and pip.
+        :type isLayered: bool
+        :param isBaseImage: If True the Dockerfile start from a base image shared by all environments with the same distro and Gazebo option.
+        :type isBaseImage: bool
+        :param isCache: If True the colcon build/install/log folders of each workspace are kept in named volumes and C/C++ builds use a ccache volume shared by all environments.
+        :type isCache: bool
+        :param transport: DDS transport profile: default, shm (shared memory in the container) or host (host network and IPC). ROS 2 only.
+        :type transport: str
+        :param dds: DDS implementation configured by the transport profile: fastdds or cyclonedds
+        :type dds: str
+        :param shm_size: Size of /dev/shm with the shm and host transports. ex: 512mb, 2gb
+        :type shm_size: str
+        :param resources: CPU, memory and real-time limits of the container.
+        :type resources: resource_profile
+        :param output_dir: Folder where the files are generated. The build context stay the current folder.
+        :type output_dir: str
+        :param ros_type: ros or ros2, already checked (ex: saved in the param file). If None the distro is checked against the rosdistro index.
+        :type ros_type: str
+        :param isPackageDeps: If True the dependencies of the package.xml files of the copied folders are resolved with rosdep and installed in the image.
+        :type isPackageDeps: bool
+        :param profile: Base image and default dependencies: desktop, base (no GUI), headless (build tools only) or sim (desktop-full and Gazebo).
+        :type profile: str
         """
         self.ros_distro=ros_distro if ros_distro!=None else "humble"
         self.name=name if name!=None else "ros-"+self.ros_distro
         self.iname=iname if iname != None else self.name
-        self.isGazebo=isGazebo
+        self.image_profile=image_profile(profile)
+        self.isGazebo=isGazebo or self.image_profile.isGazebo()
         self.isShared=isShared
+        self.isLayered=isLayered
+        self.isBaseImage=isBaseImage
+        self.isCache=isCache
+        self.resources=resources if resources != None else resource_profile()
+        self.output_dir=pathlib.Path(output_dir)
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        # Path of the build context (current folder) from the generated files
+        self.context=os.path.relpath(pathlib.Path.cwd(), self.output_dir.resolve())
+
+
+        if ros_type != None:
+            self.ros_type = ros_type
+        else:
+            print("Checking for ROS version ...",)
+            self.ros_type = rosdistro_cache(offline=offline).getType(self.ros_distro)
+            print(f"Distribution info :\n\tName: {self.ros_distro}\n\tType: {self.ros_type}")
+            if self.ros_type == "ros":
+                print(f"ROS 1 distribution are not fully tested. Sorry for that -_-")
 
+            print("ROS version checked!")
 
-        print("Checking for ROS version ...",)
-        # URL of the ROS distribution index
-        url = "https://raw.githubusercontent.com/ros/rosdistro/master/index-v4.yaml"
-
-        try:
-            response = requests.get(url)
-            response.raise_for_status()  # Raise an error for bad status codes
-            data = yaml.safe_load(response.text)
-
-        except requests.RequestException as e:
-            print(f"Error fetching ROS versions: {e}")
-        except yaml.YAMLError as e:
-            print(f"Error parsing ROS YAML: {e}")
-        
-                
-        if not self.ros_distro in data["distributions"]:
-            raise NameError(f"{self.ros_distro} distro is not supported")
-        # Get the type of the distro
-        self.ros_type = "ros2" if data['distributions'][self.ros_distro]['distribution_type'] == "ros2" else "ros"
-        print(f"Distribution info :\n\tName: {self.ros_distro}\n\tType: {self.ros_type}")
-        if self.ros_type == "ros":
-            print(f"ROS 1 distribution are not fully tested. Sorry for that -_-")
-
-        print("ROS version checked!")
+        self.dds_profile = dds_profile(transport, dds, shm_size)
+        if self.dds_profile.isEnabled() and self.ros_type != "ros2":
+            print(f"The {transport} transport profile is only available for ROS 2. The default one is used.")
+            self.dds_profile = dds_profile("default", dds, shm_size)
 
         # Check volumes
         self.isVolumes = volumes_path_list != None
@@ -109,117 +143,315 @@ class docker_generator():
         else: 
             self.isDependencies = False
             
+        self.isPackageDeps = isPackageDeps
+        self.package_deps = {"apt": [], "pip": []}
+        if self.isPackageDeps and self.isVolumes:
+            print("Resolving the dependencies of the package.xml files ... ", end="")
+            try:
+                self.package_deps, unresolved = getWorkspaceDependencies(self.volumes_path_list, self.ros_distro, self.ros_type, offline)
+                print(f"Done ({len(self.package_deps['apt'])} apt, {len(self.package_deps['pip'])} pip)")
+                if unresolved:
+                    print(f"\tNo rosdep rule for: {', '.join(unresolved)}")
+            except (ConnectionError, NameError) as e:
+                print(f"Skipped\n\t{e}")
+
+        if self.isBaseImage:
+            print("Generating base image Dockerfile ... ", end="")
+            self.base_image = base_image(self)
+            self.base_image.save()
+            print(f"Done ({self.base_image.tag})")
+
+        # Files are rendered in memory and only written when their content changed
+        self.changes = {}
+
         # Generate Dockerfile
         print("Generating Dockerfile ... ", end="")
-        self.generate_Dockerfile()
-        print("Done")
+        print(f"Done ({self.generate_Dockerfile()})")
 
         #generate .env file
         print("Generating .env file ... ", end="")
-        self.generate_env_file()
-        print("Done")
+        print(f"Done ({self.generate_env_file()})")
+
+        #generate .dockerignore file
+        print("Generating .dockerignore file ... ", end="")
+        print(f"Done ({self.generate_dockerignore()})")
+
+        if self.dds_profile.isEnabled():
+            print(f"Generating {self.dds_profile.dds} profile ... ", end="")
+            print(f"Done ({self.generate_dds_profile()})")
 
         #Generate docker-compose.yaml
         print("Generating docker-compose.yaml file ... ", end="")
-        self.generate_docker_compose()
-        print("Done")
-        
-    def generate_Dockerfile(self) -> None:
-        with open("Dockerfile", mode="w") as Dockerfile:
-            # Setting the based image
-            Dockerfile.write(f"FROM osrf/ros:{self.ros_distro}-desktop \n")
+        print(f"Done ({self.generate_docker_compose()})")
 
-            # Download all dependencies
-            Dockerfile.write("RUN apt-get update && apt-get install -y \\ \n")
-            
-            for DefaultDep in self.getDefaultDep():
-                Dockerfile.write(f"\t{DefaultDep} \\ \n")
-            
-            for rosDep in self.getRosDep():
-                Dockerfile.write(f"\t{rosDep} \\ \n")
-            
-            if self.isGazebo:
-                for gzDep in self.getGazeboDep():
-                    Dockerfile.write(f"\t{gzDep} \\ \n")
-            
-            if self.isDependencies:
-                for addDep in self.dependencies["apt"]:
-                    Dockerfile.write(f"\t{addDep} \\ \n")
+        changed = [name for name, status in self.changes.items() if status != "unchanged"]
+        print(f"{len(changed)} file(s) written, {len(self.changes) - len(changed)} unchanged")
 
-            Dockerfile.write("\t&& rm -rf /var/lib/apt/lists/*\n\n")
+    def write(self, name: str, content: str) -> str:
+        """
+        Write a generated file in the output folder if its content changed.
 
-            Dockerfile.write("RUN pip install --no-cache-dir \\ \n"
-                             "\tnetworkx \\ \n"
-                             "\tmatplotlib \\ \n"
-                              "\txacro ")
-            if self.isDependencies:
-                for addDep in self.dependencies["pip"]:
-                    Dockerfile.write(f"\\ \n\t{addDep}")
-
-            if self.isGazebo: # Need to add until we have sudo permision in the docker
-                if self.ros_type == "ros2":
-                    Dockerfile.write("\n# Installing Dynamic World Generator for Gazebo world generation\n")
-                    Dockerfile.write("RUN cd / && sudo git clone https://github.com/ali-pahlevani/Dynamic_World_Generator.git \n")
-                    Dockerfile.write("RUN pip3 install PyQt5 lxml\n")
-                    Dockerfile.write("# Remove .py extension to simplify the use\n")
-                    Dockerfile.write("RUN sudo mv /Dynamic_World_Generator/code/dwg_wizard.py /Dynamic_World_Generator/code/dwg_wizard\n")
-            
+        :param name: path of the file from the output folder
+        :return: created, unchanged or updated with the number of added and removed lines
+        """
+        self.changes[name] = writeIfChanged(self.output_dir / name, content)
+        return self.changes[name]
+        
+    def generate_Dockerfile(self) -> str:
+        with io.StringIO() as Dockerfile:
+            if self.isLayered:
+                Dockerfile.write("# syntax=docker/dockerfile:1\n")
+
+            if self.isBaseImage:
+                # Everything which doesn't depend on the project is in the shared base image
+                Dockerfile.write(f"FROM {self.base_image.tag}\n")
+                Dockerfile.write(f"LABEL {BASE_LABEL}=0 {BASE_IMAGE_LABEL}={self.base_image.tag}\n")
+            else:
+                self.write_base(Dockerfile, withUserDeps=not self.isLayered)
+
+            if self.isLayered:
+                self.write_user_layers(Dockerfile)
+            elif self.isBaseImage:
+                self.write_user_dependencies(Dockerfile)
+            self.write_package_dependencies(Dockerfile)
             
             Dockerfile.write("\n# Setting up the user of the docker\n")
             Dockerfile.write("ARG UID\n")
             Dockerfile.write("ARG GID\n")
             Dockerfile.write("ARG USER\n")
             Dockerfile.write("ARG GROUP\n")
-            Dockerfile.write("RUN echo '$USER ALL=(ALL) NOPASSWD:ALL' >> /etc/sudoers\n")
+            Dockerfile.write("RUN echo \"$USER ALL=(ALL) NOPASSWD:ALL\" >> /etc/sudoers\n")
             Dockerfile.write("RUN groupadd -g $GID $GROUP\n")
             Dockerfile.write("RUN useradd -ms /bin/bash -u $UID -g $GID $USER\n")
             Dockerfile.write("RUN adduser $USER dialout\n")
             Dockerfile.write("RUN addgroup $USER dialout\n")
             Dockerfile.write("RUN adduser $USER video\n")
             Dockerfile.write("RUN usermod -a -G video $USER\n")
+
+            if self.isCache:
+                # Docker copy the owner of these folders into the volumes when they are created. The workspaces
+                # are created here too, they would belong to root.
+                folders = [f"/home/${{USER}}/{name}" for name in self.getWorkspaces()] + [CCACHE_DIR] + list(getColconVolumes(self.name, self.getWorkspaces()).values())
+                Dockerfile.write("\n# Folders of the colcon and ccache volumes\n")
+                Dockerfile.write(f"RUN mkdir -p {' '.join(folders)} && chown $USER:$GROUP {' '.join(folders)}\n")
             Dockerfile.write("USER $USER\n")
 
             Dockerfile.write("\n# Add the source command to .bashrc\n")
             Dockerfile.write(f"RUN echo 'source /opt/ros/{self.ros_distro}"+"/setup.sh' >> /home/${USER}/.bashrc\n")
 
-            if self.isGazebo and self.ros_type == "ros2":
+            if self.isGazebo and self.ros_type == "ros2" and self.image_profile.hasGUI():
                     Dockerfile.write("RUN echo 'export PATH=$PATH:/Dynamic_World_Generator/code/' >> /home/${USER}/.bashrc\n")
             
-            if self.isVolumes:
+            if self.isVolumes and self.isShared:
+                # Mounted by docker-compose.yaml, nothing to send to the build
+                Dockerfile.write("\n# Folders where your shared workspaces are mounted\n")
+                Dockerfile.write(f"RUN mkdir -p {' '.join(f'/home/${{USER}}/{name}' for name in self.getWorkspaces())}\n")
+            elif self.isVolumes:
                 Dockerfile.write("\n# Copy your workspace into the home container\n")
                 for volume in self.volumes_path_list:
                     volume = pathlib.Path(volume)
-                    Dockerfile.write(f"COPY ./{volume.resolve().relative_to(pathlib.Path.cwd())} /home/${{USER}}/{volume.name}\n")
+                    Dockerfile.write(f"COPY --chown=${{USER}}:${{GROUP}} ./{volume.resolve().relative_to(pathlib.Path.cwd())} /home/${{USER}}/{volume.name}\n")
             else:
                 Dockerfile.write("\n# Create your workspace into the container\n")
-                Dockerfile.write(f"RUN mkdir /home/${{USER}}/{self.ros_type}_ws\n")
+                Dockerfile.write(f"RUN mkdir -p /home/${{USER}}/{self.ros_type}_ws\n")
 
             Dockerfile.write(f"WORKDIR /home/${{USER}}/\n")
+            return self.write("Dockerfile", Dockerfile.getvalue())
+
+    def write_base(self, Dockerfile, withUserDeps: bool) -> None:
+        """
+        Write the part of the Dockerfile which only depend on the distro, the image profile and Gazebo: the ROS
+        image and the default, ROS and Gazebo dependencies.
+
+        :param withUserDeps: Add the user dependencies to the default ones (single layer mode only).
+        """
+        # Setting the based image
+        Dockerfile.write(f"FROM {self.image_profile.getBaseImage(self.ros_distro)} \n")
+
+        if self.isLayered:
+            self.write_layered_dependencies(Dockerfile)
+        else:
+            # Download all dependencies
+            Dockerfile.write("RUN apt-get update && apt-get install -y \\ \n")
+            
+            for DefaultDep in self.getDefaultDep():
+                Dockerfile.write(f"\t{DefaultDep} \\ \n")
+            
+            for rosDep in self.getRosDep():
+                Dockerfile.write(f"\t{rosDep} \\ \n")
+            
+            if self.isGazebo:
+                for gzDep in self.getGazeboDep():
+                    Dockerfile.write(f"\t{gzDep} \\ \n")
+            
+            if withUserDeps and self.isDependencies:
+                for addDep in self.dependencies["apt"]:
+                    Dockerfile.write(f"\t{addDep} \\ \n")
+
+            Dockerfile.write("\t&& rm -rf /var/lib/apt/lists/*\n\n")
 
-    def generate_env_file(self) -> None:
+            pip_deps = self.image_profile.getPipDependencies() + (self.dependencies["pip"] if withUserDeps and self.isDependencies else [])
+            if pip_deps:
+                Dockerfile.write("RUN pip install --no-cache-dir")
+                for pipDep in pip_deps:
+                    Dockerfile.write(f" \\ \n\t{pipDep}")
+
+        if self.isGazebo and self.image_profile.hasGUI(): # Need to add until we have sudo permision in the docker
+            if self.ros_type == "ros2":
+                Dockerfile.write("\n# Installing Dynamic World Generator for Gazebo world generation\n")
+                Dockerfile.write("RUN cd / && sudo git clone https://github.com/ali-pahlevani/Dynamic_World_Generator.git \n")
+                Dockerfile.write("RUN pip3 install PyQt5 lxml\n")
+                Dockerfile.write("# Remove .py extension to simplify the use\n")
+                Dockerfile.write("RUN sudo mv /Dynamic_World_Generator/code/dwg_wizard.py /Dynamic_World_Generator/code/dwg_wizard\n")
+
+    def write_user_dependencies(self, Dockerfile) -> None:
+        if not self.isDependencies:
+            return
+        if self.dependencies["apt"]:
+            Dockerfile.write("\n# User dependencies\n")
+            Dockerfile.write("RUN apt-get update && apt-get install -y \\ \n")
+            for addDep in self.dependencies["apt"]:
+                Dockerfile.write(f"\t{addDep} \\ \n")
+            Dockerfile.write("\t&& rm -rf /var/lib/apt/lists/*\n")
+        if self.dependencies["pip"]:
+            Dockerfile.write("\nRUN pip install --no-cache-dir")
+            for addDep in self.dependencies["pip"]:
+                Dockerfile.write(f" \\ \n\t{addDep}")
+            Dockerfile.write("\n")
+
+    def write_package_dependencies(self, Dockerfile) -> None:
+        """
+        Install the dependencies of the workspace packages, resolved when the files are generated, so the
+        container doesn't need a rosdep install after it start.
+        """
+        if not self.package_deps["apt"] and not self.package_deps["pip"]:
+            return
+        Dockerfile.write("\n# Dependencies of the workspace packages (package.xml)\n")
+        if self.isLayered:
+            if self.package_deps["apt"]:
+                self.write_apt_layer(Dockerfile, self.package_deps["apt"])
+            if self.package_deps["pip"]:
+                self.write_pip_layer(Dockerfile, self.package_deps["pip"])
+            return
+        if self.package_deps["apt"]:
+            Dockerfile.write("RUN apt-get update && apt-get install -y \\ \n")
+            for package in self.package_deps["apt"]:
+                Dockerfile.write(f"\t{package} \\ \n")
+            Dockerfile.write("\t&& rm -rf /var/lib/apt/lists/*\n")
+        if self.package_deps["pip"]:
+            Dockerfile.write("RUN pip install --no-cache-dir")
+            for package in self.package_deps["pip"]:
+                Dockerfile.write(f" \\ \n\t{package}")
+            Dockerfile.write("\n")
+
+    def write_layered_dependencies(self, Dockerfile) -> None:
+        """
+        Write the dependencies from the most stable to the most changing one, each set in its own layer and
+        sorted, so editing the user dependencies only rebuild the last layers (see write_user_layers). The apt and pip caches are
+        BuildKit cache mounts, they are kept between builds but not stored in the image.
+        """
+        Dockerfile.write("\n# Keep downloaded packages in the apt cache mount\n")
+        Dockerfile.write("RUN rm -f /etc/apt/apt.conf.d/docker-clean \\ \n"
+                         "\t&& echo 'Binary::apt::APT::Keep-Downloaded-Packages \"true\";' > /etc/apt/apt.conf.d/keep-cache\n")
+
+        Dockerfile.write("\n# Base dependencies\n")
+        self.write_apt_layer(Dockerfile, self.getDefaultDep())
+
+        ros_deps = self.getRosDep() + (self.getGazeboDep() if self.isGazebo else [])
+        if ros_deps:
+            Dockerfile.write("\n# ROS dependencies\n")
+            self.write_apt_layer(Dockerfile, ros_deps)
+
+        if self.image_profile.getPipDependencies():
+            Dockerfile.write("\n")
+            self.write_pip_layer(Dockerfile, self.image_profile.getPipDependencies())
+
+    def write_user_layers(self, Dockerfile) -> None:
+        if self.isDependencies and self.dependencies["apt"]:
+            Dockerfile.write("\n# User dependencies\n")
+            self.write_apt_layer(Dockerfile, self.dependencies["apt"])
+        if self.isDependencies and self.dependencies["pip"]:
+            Dockerfile.write("\n# User pip dependencies\n")
+            self.write_pip_layer(Dockerfile, self.dependencies["pip"])
+
+    def write_apt_layer(self, Dockerfile, packages: list[str]) -> None:
+        Dockerfile.write("RUN --mount=type=cache,target=/var/cache/apt,sharing=locked \\ \n"
+                         "\t--mount=type=cache,target=/var/lib/apt/lists,sharing=locked \\ \n"
+                         "\tapt-get update && apt-get install -y")
+        for package in sorted(set(packages)):
+            Dockerfile.write(f" \\ \n\t{package}")
+        Dockerfile.write("\n")
+
+    def write_pip_layer(self, Dockerfile, packages: list[str]) -> None:
+        Dockerfile.write("RUN --mount=type=cache,target=/root/.cache/pip \\ \n"
+                         "\tpip install")
+        for package in sorted(set(packages)):
+            Dockerfile.write(f" \\ \n\t{package}")
+        Dockerfile.write("\n")
+
+    def generate_env_file(self) -> str:
         """
         Description :
             Generate a cached file named .env. This file contain all environment variable we want to define in a Docker.
-        returns: None
+        returns: the change done to the file
         """
-        username = os.getlogin()  # Gets the login name of the current user
+        try:
+            username = os.getlogin()  # Gets the login name of the current user
+        except OSError: # No controlling terminal (CI, scripts)
+            username = pwd.getpwuid(os.getuid()).pw_name
         uid = os.getuid()  # Gets the real user ID of the current process
         gid = os.getgid()  # Gets the real user group ID of the current process        
 
         # generate file
-        with open("./.env", mode="w") as env_file:
-            env_file.write("DISPLAY=:0\n"
-                           "QT_X11_NO_MITSHM=1\n"
-                           f"UID={uid}\n"
+        with io.StringIO() as env_file:
+            if self.image_profile.hasGUI():
+                env_file.write("DISPLAY=:0\n"
+                               "QT_X11_NO_MITSHM=1\n")
+            env_file.write(f"UID={uid}\n"
                            f"GID={gid}\n"
                            f"USER={username}\n"
                            f"GROUP={username}\n")
 
             
+            if self.isCache:
+                env_file.write(f"CCACHE_DIR={CCACHE_DIR}\n"
+                               "CMAKE_C_COMPILER_LAUNCHER=ccache\n"
+                               "CMAKE_CXX_COMPILER_LAUNCHER=ccache\n")
+
+            if self.dds_profile.isEnabled():
+                env_file.write(self.dds_profile.getEnv())
+
             if self.isEnv:
                 env_file.write(f"\n{self.env}")
+            return self.write(".env", env_file.getvalue())
 
-    def generate_docker_compose(self) -> None:
+    def generate_dockerignore(self) -> str:
+        """
+        Description :
+            Generate the .dockerignore file. Only the folders copied by the Dockerfile are sent to the docker daemon,
+            without the colcon build/install/log folders.
+        returns: the change done to the file
+        """
+        # Outside the build context BuildKit use the ignore file named after the Dockerfile
+        name = ".dockerignore" if self.context == "." else "Dockerfile.dockerignore"
+        with io.StringIO() as dockerignore:
+            dockerignore.write("# Generated by ros-env: only the copied workspaces are part of the build context\n"
+                               "*\n")
+            if self.isVolumes and not self.isShared:
+                for volume in self.volumes_path_list:
+                    volume = pathlib.Path(volume).resolve().relative_to(pathlib.Path.cwd())
+                    dockerignore.write(f"!{volume}\n")
+                    for artifact in ("build", "install", "log"):
+                        dockerignore.write(f"{volume}/{artifact}\n")
+                dockerignore.write("**/.git\n"
+                                   "**/__pycache__\n")
+            return self.write(name, dockerignore.getvalue())
+
+    def generate_dds_profile(self) -> str:
+        statuses = [self.write(name, content) for name, content in self.dds_profile.getFiles().items()]
+        return statuses[0] if len(set(statuses)) == 1 else "updated"
+
+    def generate_docker_compose(self) -> str:
         data = {
             "version": '3.8',
             "services":{
@@ -227,18 +459,22 @@ class docker_generator():
                     "container_name": self.name,
                     "image": self.name,
                     "build": {
-                        "context": ".",
-                        "dockerfile": "Dockerfile",
+                        "context": self.context,
+                        "dockerfile": os.path.relpath(self.output_dir.resolve() / "Dockerfile", pathlib.Path.cwd()),
                         "args": {
                             "UID": "${UID}",
                             "GID": "${GID}",
                             "USER": "${USER}",
                             "GROUP": "${GROUP}"
+                        },
+                        "labels": {
+                            BUILD_HASH_LABEL: "${ROS_ENV_BUILD_HASH:-}"
                         }
                     },
                     "env_file": [".env"],
+                    "healthcheck": self.getHealthcheck(),
 
-                    "volumes": ["/tmp/.X11-unix:/tmp/.X11-unix"],
+                    "volumes": ["/tmp/.X11-unix:/tmp/.X11-unix"] if self.image_profile.hasGUI() else [],
                     "stdin_open": True,
                     "tty": True
                 }
@@ -248,22 +484,61 @@ class docker_generator():
         if self.isShared:
             for volume in self.volumes_path_list:
                 volume = pathlib.Path(volume)
-                data["services"]["gz_test"]["volumes"].append(f"./{volume.resolve().relative_to(pathlib.Path.cwd())}:/home/${{USER}}/{volume.name}")
+                data["services"]["gz_test"]["volumes"].append(f"{self.context}/{volume.resolve().relative_to(pathlib.Path.cwd())}:/home/${{USER}}/{volume.name}")
+
+        if self.dds_profile.isEnabled():
+            data["services"]["gz_test"].update(self.dds_profile.getCompose())
+            data["services"]["gz_test"]["volumes"].append(f"./{DDS_DIR}:{CONTAINER_DDS_DIR}:ro")
+
+        if self.resources.isEnabled():
+            data["services"]["gz_test"].update(self.resources.getCompose())
 
-                # Write the dictionary to a YAML file
-        with open("docker-compose.yaml", "w") as file:
-            yaml.dump(data, file, sort_keys=False)
+        if self.isCache:
+            data["volumes"] = {CCACHE_VOLUME: {"name": CCACHE_VOLUME}}
+            data["services"]["gz_test"]["volumes"].append(f"{CCACHE_VOLUME}:{CCACHE_DIR}")
+            for volume, path in getColconVolumes(self.name, self.getWorkspaces()).items():
+                data["volumes"][volume] = {"name": volume}
+                data["services"]["gz_test"]["volumes"].append(f"{volume}:{path}")
+
+        return self.write("docker-compose.yaml", yaml.dump(data, sort_keys=False))
 
 
     
             
+    def getHealthcheck(self) -> dict:
+        """
+        Healthy once the ROS setup can be sourced and, with ROS 2, the ros2 daemon answer. The daemon is started
+        by the check, so the first ros2 command of a script doesn't wait for it. Checked every 30 s, docker_tools.up
+        add start_interval when the Docker Engine support it: the generated files don't depend on the host.
+        """
+        setup = f". /opt/ros/{self.ros_distro}/setup.sh"
+        if self.ros_type == "ros2":
+            test = f"{setup} && ros2 daemon start > /dev/null && ros2 daemon status"
+        else:
+            test = f"{setup} && rosversion -d"
+        return {"test": ["CMD-SHELL", test],
+                "interval": "30s",
+                "timeout": "20s",
+                "retries": 3,
+                "start_period": "120s"}
+
+    def getWorkspaces(self) -> list[str]:
+        """
+        :return: the name of the workspaces folders in the home of the container
+        """
+        if self.isVolumes:
+            return [pathlib.Path(volume).name for volume in self.volumes_path_list]
+        return [f"{self.ros_type}_ws"]
+
     def getRosDep(self) -> str:
+        if not self.image_profile.hasRosDependencies():
+            return self.dds_profile.getDependencies(self.ros_distro)
         return [f"ros-{self.ros_distro}-{self.ros_type}-control",
         f"ros-{self.ros_distro}-{self.ros_type}-controllers",
         f"ros-{self.ros_distro}-joint-state-publisher",
         f"ros-{self.ros_distro}-diagnostic-updater",
         f"ros-{self.ros_distro}-pcl-ros",
-        f"ros-{self.ros_distro}-xacro"]
+        f"ros-{self.ros_distro}-xacro"] + self.dds_profile.getDependencies(self.ros_distro)
     
     def getGazeboDep(self) -> str:
         if self.ros_type == "ros2":
@@ -289,20 +564,7 @@ class docker_generator():
         return {"apt": apt_dep, "pip": pip_dep}
                    
     def getDefaultDep(self) -> str:
-        return ["git",
-        "make",
-        "cmake",
-        "build-essential",
-        "python3",
-        "python3-pip",
-        "python3-rosdep",
-        "libglib2.0-0",
-        "libsm6",
-        "libxext6",
-        "libxrender-dev",
-        "libopencv-dev",
-        "ffmpeg",
-        "xterm"]
+        return self.image_profile.getAptDependencies() + (["ccache"] if self.isCache else [])
     
     def load(self, path:pathlib.Path) -> str:
         """
@@ -319,6 +581,38 @@ class docker_generator():
         return res
 
 
+def writeIfChanged(path: pathlib.Path, content: str) -> str:
+    """
+    Compare the content with the file on disk and only write it when it is different, so the modification time
+    of unchanged files is kept. The file is written next to the old one then renamed over it.
+
+    :return: created, unchanged or updated with the number of added and removed lines
+    """
+    path = pathlib.Path(path)
+    try:
+        with open(path, mode="r") as file:
+            old = file.read()
+    except FileNotFoundError:
+        old = None
+    if old == content:
+        return "unchanged"
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.tmp")
+    with open(tmp, mode="w") as file:
+        file.write(content)
+    if path.exists():
+        os.chmod(tmp, path.stat().st_mode)
+    os.replace(tmp, path)
+
+    if old == None:
+        return "created"
+    diff = list(difflib.unified_diff(old.splitlines(), content.splitlines(), lineterm="", n=0))
+    added = sum(1 for line in diff if line.startswith("+") and not line.startswith("+++"))
+    removed = sum(1 for line in diff if line.startswith("-") and not line.startswith("---"))
+    return f"updated, +{added} -{removed} lines"
+
+
 def isTXT(path: pathlib.Path) -> bool:
 
     if not path.is_file():
@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""
+Stand-in for the Docker Engine API on a unix socket. It answer the few endpoints used by docker_api from an
+in-memory state, so docker_tools can be exercised without a Docker daemon:
+
+    ./docker_stub.py /tmp/docker_stub.sock --state state.yaml &
+    DOCKER_HOST=unix:///tmp/docker_stub.sock ./ros-env.py stop
+
+The state file list the containers and images:
+
+    containers:
+        ros-humble: {running: true, image: ros-humble, usage: {cpu: 12.5, memory: 104857600}}
+    images:
+        ros-humble: {created: "2024-05-01T12:00:00Z"}
+"""
+import os
+import re
+import json
+import time
+import argparse
+import datetime
+import queue
+import threading
+import socketserver
+import http.server
+import urllib.parse
+import yaml
+
+
+class docker_stub:
+
+    def __init__(self, socket_path: str, containers: dict = None, images: dict = None, api_version: str = "1.45"):
+        self.socket_path = socket_path
+        self.api_version = api_version
+        self.containers = dict(containers) if containers != None else {}
+        self.images = dict(images) if images != None else {}
+        self.connections = 0 # Number of accepted connections, to check that clients reuse theirs
+        self.requests = 0
+        self.server = None
+        self.subscribers = [] # One queue of events per /events connection
+        self.history = [] # Every event sent, for the since parameter of /events
+
+    def containerData(self, name: str) -> dict:
+        container = self.containers[name]
+        running = container.get("running", False)
+        data = {
+            "Id": container.get("id", name + "-id"),
+            "Name": "/" + name,
+            "Image": container.get("image", name),
+            "Config": {"Image": container.get("image", name), "Labels": container.get("labels", {})},
+            "State": {"Status": "running" if running else "exited", "Running": running,
+                      "StartedAt": container.get("started_at", "0001-01-01T00:00:00Z")}
+        }
+        if "health" in container:
+            data["State"]["Health"] = {"Status": container["health"], "FailingStreak": 0, "Log": []}
+        return data
+
+    def imageData(self, name: str) -> dict:
+        image = self.images[name]
+        return {
+            "Id": image.get("id", "sha256:" + name),
+            "RepoTags": [name if ":" in name else name + ":latest"],
+            "Created": image.get("created", "0001-01-01T00:00:00Z"),
+            "Size": image.get("size", 0),
+            "Config": {"Labels": image.get("labels", {})}
+        }
+
+    def setRunning(self, name: str, running: bool) -> None:
+        """
+        Change the state of a container and send the event to the /events subscribers, like docker start/stop.
+        """
+        self.containers[name]["running"] = running
+        self.publish({"Type": "container", "Action": "start" if running else "die",
+                      "Actor": {"ID": self.containerData(name)["Id"], "Attributes": {"name": name}}})
+
+    def setHealth(self, name: str, health: str) -> None:
+        """
+        Change the health status of a container (starting, healthy, unhealthy) and send the health_status event.
+        """
+        self.containers[name]["health"] = health
+        self.publish({"Type": "container", "Action": f"health_status: {health}",
+                      "Actor": {"ID": self.containerData(name)["Id"], "Attributes": {"name": name}}})
+
+    def publish(self, event: dict) -> None:
+        now = time.time_ns()
+        event = dict(event, time=now // 10**9, timeNano=now)
+        self.history.append(event)
+        for subscriber in list(self.subscribers):
+            subscriber.put(event)
+
+    def findImage(self, name: str) -> str:
+        if name in self.images:
+            return name
+        if name.endswith(":latest") and name[:-len(":latest")] in self.images:
+            return name[:-len(":latest")]
+        return None
+
+    def matchLabels(self, labels: dict, query: dict) -> bool:
+        if "filters" not in query:
+            return True
+        for label in json.loads(query["filters"][0]).get("label", []):
+            key, _, value = label.partition("=")
+            if key not in labels or (value and labels[key] != value):
+                return False
+        return True
+
+    def handle(self, method: str, path: str, query: dict) -> tuple[int, object]:
+        """
+        :return: (status code, json body)
+        """
+        match = re.fullmatch(r"/(?:v[\d.]+/)?containers/([^/]+)/json", path)
+        if method == "GET" and match:
+            name = urllib.parse.unquote(match.group(1))
+            # Like the daemon, a container is found by name, by ID or by ID prefix
+            name = next((other for other in self.containers if name == other or self.containerData(other)["Id"].startswith(name)), name)
+            if name not in self.containers:
+                return 404, {"message": f"No such container: {name}"}
+            return 200, self.containerData(name)
+
+        match = re.fullmatch(r"/(?:v[\d.]+/)?images/([^/]+)/json", path)
+        if method == "GET" and match:
+            name = self.findImage(urllib.parse.unquote(match.group(1)))
+            if name == None:
+                return 404, {"message": f"No such image: {match.group(1)}"}
+            return 200, self.imageData(name)
+
+        if method == "GET" and re.fullmatch(r"/(?:v[\d.]+/)?images/json", path):
+            res = []
+            for name in self.images:
+                image = self.imageData(name)
+                if self.matchLabels(image["Config"]["Labels"], query):
+                    res.append({"Id": image["Id"], "RepoTags": image["RepoTags"], "Size": image["Size"],
+                                "Created": int(datetime.datetime.fromisoformat(image["Created"].replace("Z", "+00:00")).timestamp()), "Labels": image["Config"]["Labels"]})
+            return 200, res
+
+        if method == "GET" and re.fullmatch(r"/(?:v[\d.]+/)?containers/json", path):
+            res = []
+            for name in self.containers:
+                container = self.containerData(name)
+                if not container["State"]["Running"] and query.get("all", ["0"])[0] in ("0", "false"):
+                    continue
+                if self.matchLabels(container["Config"]["Labels"], query):
+                    res.append({"Id": container["Id"], "Names": [container["Name"]], "Image": container["Image"],
+                                "State": container["State"]["Status"], "Status": "Up" if container["State"]["Running"] else "Exited (0)",
+                                "Labels": container["Config"]["Labels"]})
+            return 200, res
+
+        match = re.fullmatch(r"/(?:v[\d.]+/)?containers/([^/]+)/stats", path)
+        if method == "GET" and match:
+            name = next((name for name in self.containers if self.containerData(name)["Id"] == match.group(1)), None)
+            if name == None:
+                return 404, {"message": f"No such container: {match.group(1)}"}
+            usage = self.containers[name].get("usage", {})
+            return 200, {"cpu_stats": {"cpu_usage": {"total_usage": int(usage.get("cpu", 0) * 1e9)}},
+                         "memory_stats": {"usage": usage.get("memory", 0)}}
+
+        match = re.fullmatch(r"/(?:v[\d.]+/)?images/(.+)", path)
+        if method == "DELETE" and match:
+            name = self.findImage(urllib.parse.unquote(match.group(1)))
+            if name == None:
+                return 404, {"message": f"No such image: {match.group(1)}"}
+            del self.images[name]
+            return 200, [{"Untagged": name}]
+
+        if method == "GET" and re.fullmatch(r"/(?:v[\d.]+/)?version", path):
+            return 200, {"ApiVersion": self.api_version, "MinAPIVersion": "1.24"}
+
+        if method == "GET" and re.fullmatch(r"/(?:v[\d.]+/)?_ping", path):
+            return 200, "OK"
+
+        return 404, {"message": f"page not found: {method} {path}"}
+
+    def start(self) -> None:
+        stub = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1" # Keep-alive, like the real daemon
+
+            def setup(self):
+                stub.connections += 1
+                super().setup()
+
+            def address_string(self):
+                return "unix"
+
+            def log_message(self, format, *args):
+                pass
+
+            def reply(self):
+                stub.requests += 1
+                length = int(self.headers.get("Content-Length", 0))
+                if length:
+                    self.rfile.read(length)
+                url = urllib.parse.urlsplit(self.path)
+                if self.command == "GET" and re.fullmatch(r"/(?:v[\d.]+/)?events", url.path):
+                    query = urllib.parse.parse_qs(url.query)
+                    return self.streamEvents(float(query["since"][0]) if "since" in query else None,
+                                             float(query["until"][0]) if "until" in query else None)
+                status, body = stub.handle(self.command, url.path, urllib.parse.parse_qs(url.query))
+                raw = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(raw)))
+                self.end_headers()
+                self.wfile.write(raw)
+
+            def streamEvents(self, since: float = None, until: float = None):
+                events = queue.Queue()
+                stub.subscribers.append(events)
+                # The past events first, like the daemon
+                for event in list(stub.history):
+                    if since != None and event["timeNano"] >= since * 1e9 and (until == None or event["timeNano"] <= until * 1e9):
+                        events.put(event)
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                try:
+                    while True:
+                        try:
+                            event = events.get(timeout=max(until - time.time(), 0) if until != None else None)
+                        except queue.Empty: # until reached, the daemon end the stream
+                            self.wfile.write(b"0\r\n\r\n")
+                            break
+                        raw = json.dumps(event).encode() + b"\n"
+                        self.wfile.write(f"{len(raw):x}\r\n".encode() + raw + b"\r\n")
+                        self.wfile.flush()
+                except OSError:
+                    pass
+                finally:
+                    stub.subscribers.remove(events)
+                    self.close_connection = True
+
+            do_GET = do_POST = do_DELETE = reply
+
+        class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+            daemon_threads = True
+
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+        self.server = Server(self.socket_path, Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def stop(self) -> None:
+        if self.server != None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Docker Engine API stand-in listening on a unix socket.")
+    parser.add_argument("socket", help="path of the unix socket to create")
+    parser.add_argument("--state", help="yaml file with the containers and images to serve", required=False)
+    args = parser.parse_args()
+
+    state = {}
+    if args.state != None:
+        with open(args.state, "r") as state_file:
+            state = yaml.safe_load(state_file) or {}
+
+    stub = docker_stub(args.socket, state.get("containers"), state.get("images"))
+    stub.start()
+    print(f"Docker stub listening on unix://{args.socket}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        stub.stop()
@@ -1,31 +1,39 @@
 import subprocess
+import hashlib
+import asyncio
+import collections
+import signal
+import re
+import pathlib
+import json
+import yaml
+import tempfile
 import sys
+import os
+from docker_api import docker_api
+from build_stats import build_stats
+
+BUILD_HASH_LABEL = "ros-env.build-hash"
+QUERY_TIMEOUT = 60 # Seconds, for the docker commands which only read the state of the daemon
+
 
 class docker_tools:
     def isRunning(name: str) -> bool:
         # Chech if the container exist and already running
-        result = subprocess.run(f"docker ps | grep {name}", shell=True, capture_output=True, text=True)
-        if result.stdout != "": # If is already running
-            return True
-        return False
+        container = inspectContainer(name)
+        return container != None and container["State"]["Running"]
 
     def exist(name: str) -> bool:
         # Check if it exist
-        result = subprocess.run(f"docker ps -a | grep {name}", shell=True, capture_output=True, text=True)
-        if result.stdout != "":
-            return True
-        return False
+        return inspectContainer(name) != None
     
     def imageExist(name: str) -> bool:
         # Check if it exist
-        result = subprocess.run(f"docker images | grep {name}", shell=True, capture_output=True, text=True)
-        if result.stdout != "":
-            return True
-        return False
+        return inspectImage(name) != None
 
     def stop(name: str) -> bool:
         print(f"Stopping docker {name} ... ", end="")
-        if executeSubProcess(f"docker stop {name}") == 0:
+        if executeSubProcess(f"docker stop {name}", QUERY_TIMEOUT) == 0:
             print("Done")
             return True
         else:
@@ -34,7 +42,7 @@ class docker_tools:
 
     def start(name: str) -> bool:
         print(f"Starting docker {name} ... ", end="")
-        if executeSubProcess(f"docker start {name}") == 0:
+        if executeSubProcess(f"docker start {name}", QUERY_TIMEOUT) == 0:
             print("Done")
             return True
         else:
@@ -43,7 +51,7 @@ class docker_tools:
 
     def rm(name: str) -> bool:
         print(f"removing docker {name} ... ", end="")
-        if executeSubProcess(f"docker rm {name}") == 0:
+        if executeSubProcess(f"docker rm {name}", QUERY_TIMEOUT) == 0:
             print("Done")
             return True
         else:
@@ -52,41 +60,473 @@ class docker_tools:
 
     def rmi(name) -> bool:
         print(f"Removing  image {name} ... ", end="")
-        if executeSubProcess(f"docker rmi {name}") == 0:
+        if executeSubProcess(f"docker rmi {name}", QUERY_TIMEOUT) == 0:
             print("Done")
             return True
         else:
             print("Failed")
             return False
 
-    def build() -> bool:
-        print("Building image ... ", end="")
-        process = subprocess.Popen(f"docker compose build",shell=True,stdin=sys.stdin.fileno(), stdout=sys.stdout.fileno(), stderr=sys.stderr.fileno())
-        # Wait for the process to complete
-        if process.wait() == 0:
-            print("Done ")
+    def build(force: bool = False, profile: str = "desktop") -> bool:
+        """
+        Build the image of docker-compose.yaml. The build is skipped when the image already carry the hash
+        of the current Dockerfile, build args and copied files.
+
+        :param force: build even if the image is up to date
+        :param profile: image profile of the environment, the size and build time are compared with the last
+                        builds of the other profiles
+        """
+        image, build_hash = buildHash()
+        if not force:
+            built = inspectImage(image)
+            if built != None and (built["Config"].get("Labels") or {}).get(BUILD_HASH_LABEL) == build_hash:
+                print(f"Image {image} is up to date ({build_hash[:12]}), nothing to build. Use --force to build anyway.")
+                return True
+
+        files, size = contextSize(*getBuildContext("docker-compose.yaml"))
+        print(f"Build context: {files} files, {size/1e6:.1f} MB")
+
+        print("Building image ... ", end="", flush=True)
+        # Bake understand BUILDKIT_PROGRESS, the steps are followed from the rawjson output instead of the tty one
+        env = dict(os.environ, ROS_ENV_BUILD_HASH=build_hash, BUILDKIT_PROGRESS="rawjson", COMPOSE_BAKE="true")
+        stats = build_stats(image, build_hash, profile)
+        result = runProcess("docker compose build", onStdout=printLine,
+                            onStderr=lambda line: stats.feed(line) or printLine(line, sys.stderr), env=env)
+        success = result.returncode == 0
+        built = inspectImage(image) if success else None
+        build = stats.record(success, getImageHistory(image) if success else None, built["Size"] if built != None else None)
+        if success:
+            print(f"\nDone in {build['duration']:.1f}s ({build['cache hits']}/{len(build['steps'])} steps cached)")
+            printProfiles(build, build_stats.byProfile(build_stats.load(image)))
             return True
         else:
+            print("\nFailed")
+            return False
+
+    def up(image: str = None) -> bool:
+        """
+        Create and start the container of docker-compose.yaml, without attaching to it. What depends on the Docker
+        daemon of this computer is given by a second compose file, not by the generated one: the healthcheck run
+        every second until healthy (start_interval) with Docker Engine 25 and newer (API 1.44), the older ones
+        refuse the option.
+
+        :param image: create the container from this image instead of the one of docker-compose.yaml (a snapshot),
+                      nothing is built
+        """
+        print("Doesn't exist ! Creation ... ", end="", flush=True)
+        with open("docker-compose.yaml", "r") as compose_file:
+            services = yaml.safe_load(compose_file)["services"]
+        overrides = {}
+        version = getApiVersion() if any("healthcheck" in service for service in services.values()) else None
+        for name, service in services.items():
+            if "build" not in service:
+                continue
+            if image != None:
+                overrides.setdefault(name, {})["image"] = image
+            if "healthcheck" in service and version != None and version >= (1, 44):
+                overrides.setdefault(name, {})["healthcheck"] = {"start_interval": "1s"}
+        if not overrides:
+            result = runProcess("docker compose up -d", onStdout=printLine, onStderr=printLine)
+        else:
+            with tempfile.NamedTemporaryFile("w", prefix="ros-env-", suffix=".yaml") as override:
+                yaml.safe_dump({"services": overrides}, override)
+                override.flush()
+                result = runProcess(["docker", "compose", "-f", "docker-compose.yaml", "-f", override.name, "up", "-d"] + (["--no-build"] if image != None else []),
+                                    onStdout=printLine, onStderr=printLine)
+        if result.returncode != 0:
             print("Failed")
+            print("return code: ", result.returncode)
+            print("Error: ", result.stderr)
             return False
+        print("Done")
+        return True
 
     def attachTerminal(name) -> bool:
-        executeSubProcess("xhost +") # Allow GUI interface from docker to be displayed
+        executeSubProcess("xhost +", QUERY_TIMEOUT) # Allow GUI interface from docker to be displayed
 
+        # Interactive: the terminal is given to docker, not piped
         process = subprocess.Popen(f"docker exec -it {name} bash",shell=True,stdin=sys.stdin.fileno(), stdout=sys.stdout.fileno(), stderr=sys.stderr.fileno())
         # Wait for the process to complete
         if process.wait() == 0: 
-            executeSubProcess("xhost -") # Disable GUI interface from docker to be displayed
+            executeSubProcess("xhost -", QUERY_TIMEOUT) # Disable GUI interface from docker to be displayed
             return True
         else:
-            executeSubProcess("xhost -") # Allow GUI interface from docker to be displayed
+            executeSubProcess("xhost -", QUERY_TIMEOUT) # Allow GUI interface from docker to be displayed
             return False
     
     
-def executeSubProcess(shell: str) -> int:
-    result = subprocess.run(shell, shell=True, capture_output=True, text=True)
+def executeSubProcess(shell: str, timeout: float = None) -> int:
+    try:
+        result = runProcess(shell, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        print(f"\nNo answer after {timeout} s, stopped.")
+        return -1
     if result.returncode != 0:
         print("\nStandard error:", result.stderr)
         print("return code:", result.returncode)
 
-    return result.returncode
\ No newline at end of file
+    return result.returncode
+
+
+def runProcess(command, onStdout=None, onStderr=None, timeout: float = None, env: dict = None, cwd=None, stdin=subprocess.DEVNULL, input: bytes = None) -> subprocess.CompletedProcess:
+    """
+    Run a command and read its stdout and stderr at the same time, line by line, so a process which write a lot
+    on one pipe never block on it. Ctrl+C or the timeout stop the process before returning.
+
+    :param command: a shell string or a list of arguments
+    :param onStdout: function called with each line of stdout (with its end of line)
+    :param onStderr: function called with each line of stderr
+    :param timeout: seconds before the process is stopped and subprocess.TimeoutExpired raised
+    :param stdin: file given as stdin, by default nothing
+    :param input: bytes written on stdin instead, while the output is read
+    :return: stdout and stderr contain the whole output of the pipes without callback, else only their last lines
+    """
+    return asyncio.run(runProcessAsync(command, onStdout, onStderr, timeout, env, cwd, stdin, input))
+
+
+async def runProcessAsync(command, onStdout=None, onStderr=None, timeout: float = None, env: dict = None, cwd=None, stdin=subprocess.DEVNULL, input: bytes = None) -> subprocess.CompletedProcess:
+    """
+    Coroutine of runProcess, to run many processes in the same event loop.
+    """
+    # The process may change the containers, the state given by the daemon is no longer sure
+    if docker_api._client != None:
+        docker_api._client.containers = None
+    # BuildKit rawjson lines carry whole logs, the default limit of a line is 64 KiB. The process has its own
+    # group so the shell and its children are stopped together.
+    if input != None:
+        stdin = asyncio.subprocess.PIPE
+    options = dict(stdin=stdin, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE, env=env, cwd=cwd, limit=2**24, process_group=0)
+    if isinstance(command, str):
+        process = await asyncio.create_subprocess_shell(command, **options)
+    else:
+        process = await asyncio.create_subprocess_exec(*command, **options)
+
+    async def drain(stream, callback) -> str:
+        lines = collections.deque(maxlen=None if callback == None else 20)
+        while True:
+            line = await stream.readline()
+            if not line:
+                return "".join(lines)
+            line = line.decode(errors="replace")
+            lines.append(line)
+            if callback != None:
+                callback(line)
+
+    async def feed() -> None:
+        if input == None:
+            return
+        try:
+            process.stdin.write(input)
+            await process.stdin.drain()
+            process.stdin.close()
+        except (BrokenPipeError, ConnectionResetError): # The process exited without reading everything
+            pass
+
+    readers = asyncio.gather(drain(process.stdout, onStdout), drain(process.stderr, onStderr), feed())
+    try:
+        stdout, stderr, _ = await asyncio.wait_for(readers, timeout)
+        returncode = await process.wait()
+    except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+        await stopProcess(process)
+        if isinstance(e, asyncio.TimeoutError):
+            raise subprocess.TimeoutExpired(command, timeout) from None
+        raise
+    return subprocess.CompletedProcess(command, returncode, stdout, stderr)
+
+
+async def stopProcess(process: asyncio.subprocess.Process, grace: float = 5) -> None:
+    """
+    Send SIGTERM to the process group, then SIGKILL if it is still running after grace seconds.
+    """
+    for sig in (signal.SIGTERM, signal.SIGKILL):
+        try:
+            os.killpg(process.pid, sig)
+        except ProcessLookupError:
+            pass
+        try:
+            await asyncio.wait_for(process.wait(), grace)
+            return
+        except asyncio.TimeoutError:
+            continue
+
+
+def printLine(line: str, stream=sys.stdout) -> None:
+    stream.write(line)
+    stream.flush()
+
+
+def printProfiles(build: dict, profiles: dict) -> None:
+    """
+    Print the size of the image and compare it with the last builds of the other image profiles.
+    """
+    if build["size"] == None:
+        return
+    print(f"Image size: {build['size']/1e9:.2f} GB ({build['profile']} profile)")
+    for profile, other in sorted(profiles.items()):
+        if profile == build["profile"] or other.get("size") == None:
+            continue
+        print(f"\t{profile}: {other['size']/1e9:.2f} GB ({(build['size'] - other['size'])/1e9:+.2f} GB), "
+              f"built in {other['duration']:.1f}s on {other['time']}")
+
+
+def buildHash(compose_path: str = "docker-compose.yaml") -> tuple[str, str]:
+    """
+    Hash everything the build of the compose file depend on: the build section, the Dockerfile, the .env
+    file which give the build args and the files sent by COPY/ADD.
+
+    :return: (image name, hex digest)
+    """
+    compose_path = pathlib.Path(compose_path)
+    with open(compose_path, "r") as compose_file:
+        compose = yaml.safe_load(compose_file)
+
+    sha = hashlib.sha256()
+    image = None
+    for service in compose["services"].values():
+        if "build" not in service:
+            continue
+        image = service.get("image", image)
+        build = {key: value for key, value in service["build"].items() if key != "labels"}
+        sha.update(json.dumps(build, sort_keys=True).encode())
+
+        context, dockerfile = getBuildContext(compose_path, service)
+        hashFile(sha, dockerfile)
+        if getDockerignore(context, dockerfile).is_file():
+            hashFile(sha, getDockerignore(context, dockerfile))
+        for env_file in service.get("env_file", []):
+            hashFile(sha, compose_path.parent / env_file)
+        for source in copySources(dockerfile):
+            hashTree(sha, context, context / source, dockerfile)
+
+    return image, sha.hexdigest()
+
+
+def getComposeImage(compose_path: str = "docker-compose.yaml") -> str:
+    """
+    :return: the image tagged by the build of the compose file, None without compose file or built service
+    """
+    try:
+        with open(compose_path, "r") as compose_file:
+            services = yaml.safe_load(compose_file)["services"].values()
+    except (OSError, yaml.YAMLError, KeyError, TypeError, AttributeError):
+        return None
+    return next((service.get("image") for service in services if "build" in service), None)
+
+
+def getBuildContext(compose_path: pathlib.Path, service: dict = None) -> tuple[pathlib.Path, pathlib.Path]:
+    """
+    :param service: the compose service, by default the first one with a build section
+    :return: (build context, Dockerfile) of the service
+    """
+    compose_path = pathlib.Path(compose_path)
+    if service == None:
+        with open(compose_path, "r") as compose_file:
+            services = yaml.safe_load(compose_file)["services"].values()
+        service = next(service for service in services if "build" in service)
+    context = compose_path.parent / service["build"].get("context", ".")
+    return context, context / service["build"].get("dockerfile", "Dockerfile")
+
+
+def getDockerignore(context: pathlib.Path, dockerfile: pathlib.Path = None) -> pathlib.Path:
+    # Like BuildKit, an ignore file named after the Dockerfile take precedence over the one of the context
+    if dockerfile != None:
+        specific = pathlib.Path(str(dockerfile) + ".dockerignore")
+        if specific.is_file():
+            return specific
+    return pathlib.Path(context) / ".dockerignore"
+
+
+def copySources(dockerfile: pathlib.Path) -> list[str]:
+    # Sources of the COPY/ADD instructions taken from the build context (not from an other stage)
+    sources = []
+    with open(dockerfile, "r") as file:
+        for line in file:
+            words = line.split()
+            if len(words) < 3 or words[0].upper() not in ("COPY", "ADD"):
+                continue
+            if any(word.startswith("--from") for word in words[1:]):
+                continue
+            sources += [word for word in words[1:-1] if not word.startswith("--")]
+    return sources
+
+
+def hashFile(sha, path: pathlib.Path) -> None:
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(1 << 20), b""):
+            sha.update(chunk)
+
+
+def hashTree(sha, context: pathlib.Path, root: pathlib.Path, dockerfile: pathlib.Path = None) -> None:
+    if root.is_file():
+        sha.update(root.name.encode())
+        hashFile(sha, root)
+        return
+    for relative, path in sorted(walkContext(context, root, dockerfile)):
+        sha.update(relative.encode())
+        sha.update(str(path.stat().st_mode & 0o777).encode())
+        hashFile(sha, path)
+
+
+def readDockerignore(context: pathlib.Path, dockerfile: pathlib.Path = None) -> list[tuple[bool, re.Pattern, str]]:
+    """
+    :return: the rules of the .dockerignore of the context as (exclude, regex, literal prefix), in file order
+    """
+    rules = []
+    path = getDockerignore(context, dockerfile)
+    if not path.is_file():
+        return rules
+    with open(path, "r") as dockerignore:
+        for line in dockerignore:
+            pattern = line.strip()
+            if pattern == "" or pattern.startswith("#"):
+                continue
+            exclude = not pattern.startswith("!")
+            pattern = pattern.lstrip("!").strip("/")
+            if pattern.startswith("./"):
+                pattern = pattern[2:]
+            regex = ""
+            i = 0
+            while i < len(pattern):
+                if pattern.startswith("**/", i):
+                    regex += "(?:.*/)?"
+                    i += 3
+                elif pattern.startswith("**", i):
+                    regex += ".*"
+                    i += 2
+                elif pattern[i] == "*":
+                    regex += "[^/]*"
+                    i += 1
+                elif pattern[i] == "?":
+                    regex += "[^/]"
+                    i += 1
+                else:
+                    regex += re.escape(pattern[i])
+                    i += 1
+            # Like docker, a pattern matching a folder also match everything inside it
+            prefix = re.split(r"[*?\[]", pattern, maxsplit=1)[0]
+            rules.append((exclude, re.compile(regex + "(?:/.*)?"), prefix))
+    return rules
+
+
+def isIgnored(rules: list, path: str) -> bool:
+    ignored = False
+    for exclude, regex, prefix in rules:
+        if regex.fullmatch(path):
+            ignored = exclude
+    return ignored
+
+
+def walkContext(context: pathlib.Path, root: pathlib.Path = None, dockerfile: pathlib.Path = None):
+    """
+    Iterate over the files of the build context which are not excluded by its .dockerignore.
+
+    :param root: only walk this folder of the context
+    :return: generator of (path relative to the context, path)
+    """
+    context = pathlib.Path(context)
+    rules = readDockerignore(context, dockerfile)
+    exceptions = [prefix for exclude, regex, prefix in rules if not exclude]
+    for dirpath, dirnames, filenames in os.walk(root if root != None else context):
+        relative = pathlib.Path(dirpath).relative_to(context).as_posix()
+        relative = "" if relative == "." else relative + "/"
+        # Don't walk into ignored folders unless an exception could bring back something inside
+        dirnames[:] = [dirname for dirname in dirnames
+                       if not isIgnored(rules, relative + dirname)
+                       or any(prefix == "" or prefix.startswith(relative + dirname + "/") for prefix in exceptions)]
+        for filename in filenames:
+            if not isIgnored(rules, relative + filename):
+                path = pathlib.Path(dirpath) / filename
+                if path.is_file():
+                    yield relative + filename, path
+
+
+def contextSize(context: str, dockerfile: str = None) -> tuple[int, int]:
+    """
+    Count what docker will send as build context, following the .dockerignore.
+
+    :return: (number of files, total size in bytes)
+    """
+    files = 0
+    size = 0
+    for relative, path in walkContext(context, dockerfile=dockerfile):
+        files += 1
+        size += path.stat().st_size
+    return files, size
+
+
+def inspectContainer(name: str) -> dict:
+    """
+    Inspect a container by its exact name. Use the Docker Engine API, the docker CLI is only used when
+    the socket is not reachable.
+
+    :return: the inspect data or None if the container doesn't exist
+    """
+    client = docker_api.client()
+    if client.available():
+        try:
+            return client.inspectContainer(name)
+        except OSError:
+            pass
+    return inspectCLI("container", name)
+
+
+def inspectImage(name: str) -> dict:
+    """
+    Inspect an image by its exact name.
+
+    :return: the inspect data or None if the image doesn't exist
+    """
+    client = docker_api.client()
+    if client.available():
+        try:
+            return client.inspectImage(name)
+        except OSError:
+            pass
+    return inspectCLI("image", name)
+
+
+def getImageHistory(name: str) -> list[dict]:
+    client = docker_api.client()
+    if client.available():
+        try:
+            return client.imageHistory(name)
+        except OSError:
+            pass
+    result = runProcess(["docker", "image", "history", "--no-trunc", "--format", "{{json .}}", name], timeout=QUERY_TIMEOUT)
+    if result.returncode != 0:
+        return None
+    # The CLI give human sizes, only the API give bytes
+    return [{"CreatedBy": json.loads(line)["CreatedBy"], "Size": None} for line in result.stdout.splitlines()]
+
+
+def getApiVersion() -> tuple[int, ...]:
+    """
+    :return: the highest Docker Engine API version supported by the daemon, ex (1, 44). None if the daemon can't be
+             reached
+    """
+    client = docker_api.client()
+    version = None
+    if client.available():
+        try:
+            version = client.version()["ApiVersion"]
+        except (OSError, KeyError):
+            pass
+    if version == None:
+        try:
+            result = runProcess(["docker", "version", "--format", "{{.Server.APIVersion}}"], timeout=QUERY_TIMEOUT)
+        except (OSError, subprocess.TimeoutExpired):
+            return None
+        if result.returncode != 0:
+            return None
+        version = result.stdout.strip()
+    try:
+        return tuple(int(part) for part in version.split("."))
+    except ValueError:
+        return None
+
+
+def inspectCLI(kind: str, name: str) -> dict:
+    result = runProcess(["docker", kind, "inspect", name], timeout=QUERY_TIMEOUT)
+    if result.returncode != 0:
+        return None
+    return json.loads(result.stdout)[0]
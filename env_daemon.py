@@ -0,0 +1,349 @@
+import os
+import sys
+import json
+import time
+import signal
+import socket
+import pathlib
+import builtins
+import importlib
+import warnings
+import threading
+import traceback
+import subprocess
+import socketserver
+from daemon_client import getDaemonSocket, getPeerUid, connect, request, sendMessage
+from docker_api import docker_api, getSocketPath
+from RosEnvParam import RosEnvParam
+from rosdistro_cache import getCacheDir
+
+
+SCRIPT = pathlib.Path(__file__).resolve().parent / "ros-env.py"
+# Actions which change the state of a container, the exec_* and health events don't
+CONTAINER_ACTIONS = ["create", "start", "restart", "die", "stop", "kill", "pause", "unpause", "rename", "update", "destroy"]
+
+
+class env_daemon:
+    """
+    Resident process running the commands of ros-env.py for daemon_client. Everything is imported once, the param
+    files stay parsed and the state of all the containers is kept from the Docker events stream. Each command runs
+    in a forked child with the stdin, stdout and stderr of the client, and the caches of the daemon.
+    """
+
+    def __init__(self, socket_path: str = None):
+        self.socket_path = socket_path if socket_path != None else getDaemonSocket()
+        self.lock = threading.Lock() # Held while the caches change and during fork, the child get a consistent copy
+        self.started = time.time()
+        self.commands = 0
+        self.containers = None
+        self.last_event = 0 # Unix time of the last Docker event applied to containers
+        self.resyncs = 0
+        self.server = None
+        try:
+            self.docker_socket = getSocketPath()
+        except ConnectionError:
+            self.docker_socket = None
+
+        # Import everything the commands of ros-env.py import (they only run as __main__, each branch imports its modules)
+        self.code = compile(SCRIPT.read_bytes(), str(SCRIPT), "exec")
+        script = {"__name__": "ros_env", "__file__": str(SCRIPT)}
+        exec(self.code, script)
+        for module in script["COMMAND_MODULES"]:
+            importlib.import_module(module)
+        try:
+            import requests
+        except ImportError:
+            pass
+        self.sources = self.getSources()
+
+    def getSources(self) -> dict:
+        """
+        :return: {file: modification time} of ros-env.py and of the modules it loaded from its folder
+        """
+        folder = str(SCRIPT.parent)
+        files = [str(SCRIPT)] + [module.__file__ for module in list(sys.modules.values())
+                                 if getattr(module, "__file__", None) and module.__file__.startswith(folder)]
+        return {file: os.stat(file).st_mtime_ns for file in files}
+
+    def isStale(self) -> bool:
+        # The daemon would run the old code, it must be started again
+        try:
+            return any(os.stat(file).st_mtime_ns != mtime for file, mtime in self.sources.items())
+        except OSError:
+            return True
+
+    def watchContainers(self) -> None:
+        """
+        Keep the inspect data of all the containers from the events of the Docker daemon. The cache is dropped
+        while the stream is broken, the commands then ask the Docker daemon.
+        """
+        client = docker_api(self.docker_socket) # Not the shared client, the children use theirs
+        while True:
+            try:
+                # Subscribe first, nothing happening during the listing is missed
+                since = time.time()
+                events = client.events({"type": ["container"]})
+                containers = {}
+                for container in client.listContainers(all=True):
+                    data = client.inspectContainer(container["Id"])
+                    if data != None:
+                        containers[data["Name"].lstrip("/")] = data
+                with self.lock:
+                    self.containers = containers
+                    self.last_event = since
+                for event in events:
+                    if event.get("Action") in CONTAINER_ACTIONS:
+                        resyncs = self.resyncs
+                        data = client.inspectContainer(event["Actor"]["ID"]) if event["Action"] != "destroy" else None
+                        with self.lock:
+                            if self.containers == None: # Dropped by resync, list again
+                                break
+                            # A resync since the inspect has newer data, it applied this event too
+                            if resyncs == self.resyncs:
+                                self.update(event["Actor"]["ID"], data)
+                    with self.lock:
+                        self.last_event = max(self.last_event, event.get("timeNano", 0) / 1e9)
+                events.close()
+            except (OSError, ValueError, KeyError):
+                pass
+            with self.lock:
+                self.containers = None
+            time.sleep(5)
+
+    def update(self, container_id: str, data: dict) -> None:
+        """
+        Replace the inspect data of a container in the cache, data is None when it was removed. Called with the
+        lock held.
+        """
+        self.containers = {name: container for name, container in self.containers.items() if container["Id"] != container_id}
+        if data != None:
+            self.containers[data["Name"].lstrip("/")] = data
+
+    def resync(self) -> None:
+        """
+        Apply the events the watcher has not read yet, once a command is done: the next one must not get the
+        containers as they were before it (stop && start, kill && create). The cache is dropped if the Docker
+        daemon doesn't answer.
+        """
+        with self.lock:
+            if self.containers == None:
+                return
+            since = self.last_event
+        client = docker_api(self.docker_socket)
+        try:
+            changed = []
+            for event in client.events({"type": ["container"]}, since=since, until=time.time()):
+                if event.get("Action") in CONTAINER_ACTIONS and event["Actor"]["ID"] not in changed:
+                    changed.append(event["Actor"]["ID"])
+            # A container created then removed by the command is not found, it is removed from the cache
+            updates = [(container_id, client.inspectContainer(container_id)) for container_id in changed]
+        except (OSError, ValueError, KeyError):
+            updates = None
+        finally:
+            client.close()
+        with self.lock:
+            self.resyncs += 1
+            if updates == None:
+                self.containers = None
+            elif self.containers != None:
+                for container_id, data in updates:
+                    self.update(container_id, data)
+
+    def warm(self, cwd: str) -> None:
+        """
+        Parse the param files which changed, the one of the folder of the command and the known environments.
+        """
+        with self.lock:
+            for path in RosEnvParam.known() + [pathlib.Path(cwd) / ".ros_env_param.yaml"]:
+                try:
+                    RosEnvParam.load(path)
+                except (OSError, ValueError):
+                    pass
+
+    def status(self) -> dict:
+        return {"pid": os.getpid(),
+                "uptime": time.time() - self.started,
+                "commands": self.commands,
+                "containers": len(self.containers) if self.containers != None else None,
+                "environments": len(RosEnvParam._cache)}
+
+    def run(self, connection: socket.socket, message: dict, fds: list[int]) -> None:
+        """
+        Run one command in a forked child, forward the signals of the client to it and send its exit code.
+        """
+        if self.isStale():
+            for fd in fds:
+                os.close(fd)
+            sendMessage(connection, {"stale": True})
+            threading.Thread(target=self.server.shutdown).start()
+            return
+
+        self.warm(message["cwd"])
+        with self.lock:
+            self.commands += 1
+            pid = os.fork()
+            if pid == 0:
+                self.runChild(message, fds)
+        for fd in fds:
+            os.close(fd)
+        sendMessage(connection, {"pid": pid})
+
+        done = threading.Event()
+
+        def forwardSignals():
+            reader = connection.makefile("rb")
+            try:
+                for line in reader:
+                    if not done.is_set():
+                        os.killpg(pid, json.loads(line)["signal"])
+                # The client is gone (killed, terminal closed)
+                if not done.is_set():
+                    os.killpg(pid, signal.SIGHUP)
+            except (OSError, ValueError, KeyError):
+                pass
+
+        threading.Thread(target=forwardSignals, daemon=True).start()
+        _, status = os.waitpid(pid, 0)
+        done.set()
+        self.resync()
+        code = os.waitstatus_to_exitcode(status)
+        sendMessage(connection, {"exit": code if code >= 0 else 128 - code})
+
+    def runChild(self, message: dict, fds: list[int]) -> None:
+        """
+        Run ros-env.py as the client would have, in the child process. Never return.
+        """
+        code = 1
+        try:
+            self.server.socket.close()
+            os.setpgid(0, 0)
+            for target, fd in enumerate(fds):
+                os.dup2(fd, target)
+                os.close(fd)
+            signal.signal(signal.SIGINT, signal.default_int_handler)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGHUP, signal.SIG_DFL)
+            os.chdir(message["cwd"])
+            os.environ.clear()
+            os.environ.update(message["env"], ROS_ENV_DAEMON="0")
+            # New objects: another thread of the daemon could hold the lock of the old ones during the fork
+            sys.stdin = open(0, "r", closefd=False)
+            sys.stdout = open(1, "w", closefd=False)
+            sys.stderr = open(2, "w", buffering=1, closefd=False)
+            sys.argv = [str(SCRIPT)] + message["argv"]
+
+            docker_api._client = None
+            try:
+                if self.containers != None and getSocketPath() == self.docker_socket:
+                    docker_api.client().containers = self.containers
+            except ConnectionError:
+                pass
+
+            exec(self.code, {"__name__": "__main__", "__file__": str(SCRIPT), "__builtins__": builtins})
+            code = 0
+        except SystemExit as e:
+            if isinstance(e.code, int):
+                code = e.code
+            elif e.code == None:
+                code = 0
+            else:
+                print(e.code, file=sys.stderr)
+        except KeyboardInterrupt:
+            code = 130
+        except BaseException:
+            traceback.print_exc()
+        finally:
+            try:
+                sys.stdout.flush()
+                sys.stderr.flush()
+            except OSError:
+                pass
+            os._exit(code)
+
+    def serve(self) -> None:
+        """
+        Listen on the socket until stop is asked, SIGTERM, Ctrl+C or the sources change.
+        """
+        if os.path.exists(self.socket_path):
+            if connect(self.socket_path) != None:
+                raise RuntimeError(f"A daemon is already listening on {self.socket_path}")
+            os.remove(self.socket_path)
+
+        daemon = self
+
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                # Only the user who started the daemon can run commands with it
+                if getPeerUid(self.request) != os.getuid():
+                    return
+                raw, fds, _, _ = socket.recv_fds(self.request, 1 << 20, 3)
+                while raw and not raw.endswith(b"\n"):
+                    chunk = self.request.recv(1 << 20)
+                    if not chunk:
+                        break
+                    raw += chunk
+                if not raw:
+                    return
+                message = json.loads(raw)
+                if "argv" in message and len(fds) == 3:
+                    daemon.run(self.request, message, fds)
+                elif message.get("control") == "status":
+                    sendMessage(self.request, daemon.status())
+                elif message.get("control") == "stop":
+                    sendMessage(self.request, {"stopped": True})
+                    threading.Thread(target=daemon.server.shutdown).start()
+                else:
+                    for fd in fds:
+                        os.close(fd)
+
+        class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+            daemon_threads = True
+
+        # The threads never hold a lock the children use: the fork of this multi-threaded process is safe
+        warnings.filterwarnings("ignore", message=".*fork.*", category=DeprecationWarning)
+        signal.signal(signal.SIGTERM, lambda sig, frame: sys.exit(0))
+        umask = os.umask(0o177)
+        try:
+            self.server = Server(self.socket_path, Handler)
+        finally:
+            os.umask(umask)
+        if self.docker_socket != None:
+            threading.Thread(target=self.watchContainers, daemon=True).start()
+        print(f"ros-env daemon {os.getpid()} listening on {self.socket_path}", flush=True)
+        try:
+            self.server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.server.server_close()
+            if os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
+            print("ros-env daemon stopped", flush=True)
+
+
+def startDaemon(timeout: float = 10) -> bool:
+    """
+    Start the daemon in the background, its output goes to daemon.log in the cache.
+
+    :return: True once it accept connections
+    """
+    log_path = getCacheDir() / "daemon.log"
+    log_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(log_path, "a") as log:
+        process = subprocess.Popen([sys.executable, str(SCRIPT), "daemon", "run"], stdin=subprocess.DEVNULL, stdout=log, stderr=subprocess.STDOUT,
+                                   start_new_session=True, env=dict(os.environ, ROS_ENV_DAEMON="0"))
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() != None:
+            return False
+        if request({"control": "status"}) != None:
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def stopDaemon() -> bool:
+    """
+    :return: False if no daemon was running
+    """
+    return request({"control": "stop"}) != None
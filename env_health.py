@@ -0,0 +1,114 @@
+import json
+import time
+import datetime
+from docker_api import docker_api
+from docker_tools import inspectContainer
+from rosdistro_cache import getCacheDir
+
+
+class env_health:
+    """
+    Wait for the healthcheck of a container (see docker_generator.getHealthcheck) and keep the time each start
+    took to be ready, in a history file per container.
+    """
+
+    def wait(name: str, timeout: float = 120) -> tuple[str, dict]:
+        """
+        Follow the health_status events of the container when the Docker Engine API is reachable, else poll its
+        state with a growing delay.
+
+        :return: (healthy, unhealthy, exited, timeout or none if the container has no healthcheck, last health
+                 state of the container)
+        """
+        deadline = time.time() + timeout
+        client = docker_api.client()
+        client.containers = None # The state given by the daemon of ros-env is older than the start
+        if client.available():
+            try:
+                return waitEvents(client, name, deadline)
+            except (OSError, ValueError, KeyError):
+                pass
+        return waitPolling(name, deadline)
+
+    def record(name: str, mode: str, status: str, duration: float) -> dict:
+        """
+        Save the time to ready of one start.
+
+        :param mode: how the container was started: create, start or snapshot
+        """
+        start = {"time": datetime.datetime.now().isoformat(timespec="seconds"),
+                 "mode": mode,
+                 "status": status,
+                 "duration": round(duration, 3)}
+        path = getHistoryPath(name)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "a") as history_file:
+            history_file.write(json.dumps(start) + "\n")
+        return start
+
+    def load(name: str) -> list[dict]:
+        """
+        :return: the recorded starts of the container, the oldest first
+        """
+        path = getHistoryPath(name)
+        if not path.is_file():
+            return []
+        starts = []
+        with open(path, "r") as history_file:
+            for line in history_file:
+                try:
+                    starts.append(json.loads(line))
+                except json.JSONDecodeError:
+                    continue
+        return starts
+
+
+def getHistoryPath(name: str):
+    return getCacheDir() / "starts" / (name.replace("/", "_") + ".jsonl")
+
+
+def getStatus(container: dict) -> tuple[str, dict]:
+    """
+    :return: (status, health) of inspect data: the health status, exited or none. None while it is starting.
+    """
+    if container == None or not container["State"]["Running"]:
+        return "exited", None
+    health = container["State"].get("Health")
+    if health == None:
+        return "none", None
+    if health["Status"] in ("healthy", "unhealthy"):
+        return health["Status"], health
+    return None, health
+
+
+def waitEvents(client: docker_api, name: str, deadline: float) -> tuple[str, dict]:
+    # Subscribe first, a status reached during the inspect is not missed
+    events = client.events({"type": ["container"], "container": [name]}, until=deadline)
+    health = None
+    try:
+        status, health = getStatus(client.inspectContainer(name))
+        if status != None:
+            return status, health
+        for event in events:
+            action = event.get("Action", "")
+            if action.startswith("health_status") or action in ("die", "destroy"):
+                status, health = getStatus(client.inspectContainer(name))
+                if status != None:
+                    return status, health
+        return "timeout", health
+    except TimeoutError:
+        return "timeout", health
+    finally:
+        events.close()
+
+
+def waitPolling(name: str, deadline: float) -> tuple[str, dict]:
+    delay = 0.1
+    while True:
+        status, health = getStatus(inspectContainer(name))
+        if status != None:
+            return status, health
+        if time.time() >= deadline:
+            return "timeout", health
+        time.sleep(min(delay, max(deadline - time.time(), 0)))
+        delay = min(delay * 2, 2)
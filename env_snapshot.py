@@ -0,0 +1,116 @@
+import datetime
+from docker_tools import runProcess, inspectContainer, inspectImage, BUILD_HASH_LABEL, QUERY_TIMEOUT
+from RosEnvParam import RosEnvParam
+
+
+SNAPSHOT_LABEL = "ros-env.snapshot" # Set on the snapshot images, give the container they come from
+
+
+class env_snapshot:
+    """
+    Images committed from the container of an environment, with everything done in it since it was created
+    (rosdep install, colcon build, tools setup). They are listed in the snapshots section of the param file, the
+    oldest first, and a new container can be created from one of them instead of the built image.
+
+    The named volumes (colcon cache) and the shared folders are not part of a snapshot, docker keep them anyway.
+    """
+
+    def create(rosEnv: dict, param_path: str, message: str = None) -> dict:
+        """
+        Commit the container of the environment, running (it is paused during the commit) or stopped.
+
+        :return: the snapshot saved in the param file
+        """
+        container = inspectContainer(rosEnv["container_name"])
+        if container == None:
+            raise RuntimeError(f"The container {rosEnv['container_name']} doesn't exist. Start it first.")
+        # Commit keep the labels: a snapshot of a snapshot still give the build it comes from
+        source = inspectImage(container["Image"])
+        snapshots = rosEnv.get("snapshots") or []
+
+        created = datetime.datetime.now()
+        tag = f"{getRepository(rosEnv['image_name'])}:snapshot-{created.strftime('%Y%m%d-%H%M%S')}"
+        if any(snapshot["tag"] == tag for snapshot in snapshots):
+            tag += f"-{len(snapshots)}"
+        command = ["docker", "commit", "--change", f"LABEL {SNAPSHOT_LABEL}={rosEnv['container_name']}"]
+        if message:
+            command += ["-m", message]
+        result = runProcess(command + [rosEnv["container_name"], tag])
+        if result.returncode != 0:
+            raise RuntimeError(f"docker commit failed: {result.stderr.strip()}")
+
+        snapshot = {"tag": tag,
+                    "created": created.isoformat(timespec="seconds"),
+                    "build hash": getBuildHash(source),
+                    "message": message}
+        RosEnvParam.setSnapshots(param_path, snapshots + [snapshot])
+        return snapshot
+
+    def listSnapshots(rosEnv: dict) -> list[dict]:
+        """
+        :return: the snapshots of the param file, the oldest first, with the size of their image (None if it was
+                 removed) and stale: True if the image of the environment was built again since the snapshot
+        """
+        # compose tag the image it builds with the name of the container, image_name is only the name given by -i
+        build_hash = getBuildHash(inspectImage(rosEnv["container_name"]))
+        res = []
+        for snapshot in rosEnv.get("snapshots") or []:
+            data = inspectImage(snapshot["tag"])
+            res.append(dict(snapshot, size=data["Size"] if data != None else None,
+                            stale=build_hash != None and snapshot.get("build hash") != build_hash))
+        return res
+
+    def find(rosEnv: dict, tag: str = None) -> dict:
+        """
+        :param tag: full tag or only its snapshot-<date> part, by default the newest snapshot
+        :return: the snapshot with its size and stale status, None if there is none or its image was removed
+        """
+        for snapshot in reversed(env_snapshot.listSnapshots(rosEnv)):
+            if snapshot["size"] == None:
+                continue
+            if tag == None or tag in (snapshot["tag"], snapshot["tag"].rsplit(":", 1)[1]):
+                return snapshot
+        return None
+
+    def remove(rosEnv: dict, param_path: str, tags: list[str]) -> list[str]:
+        """
+        Remove the images of the snapshots and their entries in the param file. An image used by a container is
+        kept.
+
+        :return: the removed tags
+        """
+        removed = []
+        for tag in tags:
+            if inspectImage(tag) != None:
+                result = runProcess(["docker", "rmi", tag], timeout=QUERY_TIMEOUT)
+                if result.returncode != 0:
+                    print(f"\t{tag} kept: {result.stderr.strip()}")
+                    continue
+            removed.append(tag)
+        RosEnvParam.setSnapshots(param_path, [snapshot for snapshot in rosEnv.get("snapshots") or [] if snapshot["tag"] not in removed])
+        return removed
+
+    def prune(rosEnv: dict, param_path: str, keep: int = 3, stale: bool = False) -> list[str]:
+        """
+        Keep the newest snapshots, forget the ones whose image was removed.
+
+        :param keep: number of snapshots kept
+        :param stale: also remove the snapshots older than the last build of the image
+        :return: the removed tags
+        """
+        snapshots = [snapshot for snapshot in env_snapshot.listSnapshots(rosEnv) if snapshot["size"] != None and not (stale and snapshot["stale"])]
+        kept = {snapshot["tag"] for snapshot in snapshots[max(0, len(snapshots) - keep):]}
+        tags = [snapshot["tag"] for snapshot in rosEnv.get("snapshots") or [] if snapshot["tag"] not in kept]
+        return env_snapshot.remove(rosEnv, param_path, tags)
+
+
+def getRepository(image: str) -> str:
+    # ros-env/robot:1.0 -> ros-env/robot, a registry port is not a tag
+    name, _, tag = image.rpartition(":")
+    return name if name and "/" not in tag else image
+
+
+def getBuildHash(image: dict) -> str:
+    if image == None:
+        return None
+    return (image["Config"].get("Labels") or {}).get(BUILD_HASH_LABEL)
@@ -0,0 +1,143 @@
+import sys
+import time
+import json
+import pathlib
+import datetime
+from docker_api import docker_api
+from docker_tools import runProcess, QUERY_TIMEOUT
+from cgroup_stats import getCgroupPath, readCpuUsage, readMemory
+from fleet import formatTable
+
+
+COLUMNS = ["name", "state", "status", "image", "cpu", "memory"]
+
+
+class env_status:
+    """
+    State of many environments from one list of the containers and one list of the images. The CPU usage is the
+    CPU time used since the previous sample, keep the same object between samples (watch mode).
+    """
+
+    def __init__(self, environments: list[dict]):
+        """
+        :param environments: {"name": name of the container and of its image, "path": param file}
+        """
+        self.environments = environments
+        self.previous = {} # container id -> (monotonic time, CPU seconds)
+
+    def sample(self) -> list[dict]:
+        containers, images = listState()
+        now = time.time()
+        rows = []
+        for environment in self.environments:
+            container = containers.get(environment["name"])
+            created = images.get(environment["name"])
+            row = {"name": environment["name"],
+                   "state": container["state"] if container != None else "absent",
+                   "status": container["status"] if container != None else "",
+                   "image": "not built",
+                   "cpu": "-",
+                   "memory": "-"}
+
+            if created != None:
+                row["image"] = f"{formatDuration(now - created)} old"
+                # Generated files are only written when they change, their mtime is the last real change
+                dockerfile = pathlib.Path(environment["path"]).parent / "Dockerfile"
+                if dockerfile.exists() and dockerfile.stat().st_mtime > created:
+                    row["image"] += ", Dockerfile newer"
+
+            if container != None and container["state"] == "running":
+                usage = readUsage(container["id"])
+                if usage != None:
+                    cpu, memory = usage
+                    tick = time.monotonic()
+                    previous = self.previous.get(container["id"])
+                    self.previous[container["id"]] = (tick, cpu)
+                    if previous != None and tick > previous[0]:
+                        row["cpu"] = f"{(cpu - previous[1]) / (tick - previous[0]) * 100:.1f} %"
+                    row["memory"] = f"{memory / 2**20:.0f} MiB"
+            rows.append(row)
+        return rows
+
+    def watch(self, interval: float) -> None:
+        """
+        Print the table again every interval seconds, over the previous one, until Ctrl+C.
+        """
+        sys.stdout.write("\x1b[2J")
+        try:
+            while True:
+                lines = formatTable(self.sample(), COLUMNS)
+                lines.append(f"\n{datetime.datetime.now():%H:%M:%S}  every {interval:g}s, Ctrl+C to quit")
+                # Cursor home, each line overwrite the previous one, then clear what remains
+                sys.stdout.write("\x1b[H" + "".join(line + "\x1b[K\n" for line in lines) + "\x1b[J")
+                sys.stdout.flush()
+                time.sleep(interval)
+        except KeyboardInterrupt:
+            print()
+
+
+def listState() -> tuple[dict, dict]:
+    """
+    List all the containers and images with one request each, on the Docker Engine API or else with the CLI.
+
+    :return: the containers by name ({"id", "state", "status"}) and the creation time of the images by name
+    """
+    client = docker_api.client()
+    if client.available():
+        try:
+            containers = {container["Names"][0].lstrip("/"): {"id": container["Id"], "state": container["State"], "status": container.get("Status", "")}
+                          for container in client.listContainers(all=True)}
+            images = {}
+            for image in client.listImages():
+                for tag in image.get("RepoTags") or []:
+                    images[tag.removesuffix(":latest")] = image["Created"]
+            return containers, images
+        except OSError:
+            pass
+
+    containers = {}
+    result = runProcess(["docker", "ps", "-a", "--no-trunc", "--format", "json"], timeout=QUERY_TIMEOUT)
+    for line in result.stdout.splitlines():
+        container = json.loads(line)
+        containers[container["Names"]] = {"id": container["ID"], "state": container["State"], "status": container.get("Status", "")}
+    images = {}
+    result = runProcess(["docker", "images", "--format", "json"], timeout=QUERY_TIMEOUT)
+    for line in result.stdout.splitlines():
+        image = json.loads(line)
+        name = image["Repository"] if image["Tag"] == "latest" else f"{image['Repository']}:{image['Tag']}"
+        images[name] = parseCreatedAt(image["CreatedAt"])
+    return containers, images
+
+
+def readUsage(container_id: str) -> tuple[float, int]:
+    """
+    :return: the CPU seconds and the memory bytes used by a running container, from its cgroup or else from the API
+    """
+    path = getCgroupPath(container_id)
+    if path != None:
+        try:
+            return readCpuUsage(path), readMemory(path)
+        except OSError:
+            pass
+    client = docker_api.client()
+    if client.available():
+        try:
+            stats = client.stats(container_id)
+        except OSError:
+            return None
+        if stats != None and stats.get("cpu_stats"):
+            return stats["cpu_stats"]["cpu_usage"]["total_usage"] / 1e9, stats.get("memory_stats", {}).get("usage", 0)
+    return None
+
+
+def parseCreatedAt(value: str) -> float:
+    # The CLI write "2024-05-01 12:00:00 +0200 CEST"
+    return datetime.datetime.strptime(" ".join(value.split()[:3]), "%Y-%m-%d %H:%M:%S %z").timestamp()
+
+
+def formatDuration(seconds: float) -> str:
+    for unit, length in (("day", 86400), ("hour", 3600), ("minute", 60)):
+        if seconds >= length:
+            count = int(seconds // length)
+            return f"{count} {unit}{'s' if count > 1 else ''}"
+    return f"{int(seconds)} seconds"
@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+"""
+Scripted stand-in for the docker CLI, used by benchmark.py to run ros-env.py without a Docker daemon. Install it
+as "docker" in a folder put first in PATH. The containers and images are kept in the json file FAKE_DOCKER_STATE,
+with the same layout as the state of docker_stub.py, and each call sleep FAKE_DOCKER_LATENCY milliseconds to
+mimic the docker CLI startup. When FAKE_DOCKER_HOME is set, "exec ... python3 ..." runs the python command on the
+host with this folder as home, which stand for the home of the container. "version" give the API version
+FAKE_DOCKER_API_VERSION (1.45 by default). "compose build" write the BuildKit rawjson progress when BUILDKIT_PROGRESS
+asks for it.
+
+The images built have layers: two shared by all the images and one of the image. "save" write them in the layout
+of Docker 25 (FAKE_DOCKER_SAVE_FORMAT=legacy for the <id>/layer.tar one) and "load" read both, reusing the layers
+already known like the daemon. A layer is a tar of one file of FAKE_DOCKER_LAYER_SIZE bytes named after the layer.
+"""
+import io
+import os
+import sys
+import re
+import json
+import time
+import fcntl
+import random
+import hashlib
+import tarfile
+import subprocess
+import yaml
+
+
+def makeLayer(spec: str) -> bytes:
+    # Half random, half zeros: it compress like a real layer
+    size = int(os.environ.get("FAKE_DOCKER_LAYER_SIZE", str(1 << 20)))
+    data = random.Random(spec).randbytes(size // 2) + bytes(size - size // 2)
+    with io.BytesIO() as buffer:
+        with tarfile.open(fileobj=buffer, mode="w", format=tarfile.USTAR_FORMAT) as layer:
+            info = tarfile.TarInfo(spec)
+            info.size = len(data)
+            layer.addfile(info, io.BytesIO(data))
+        return buffer.getvalue()
+
+
+def addImage(state: dict, tag: str, specs: list[str], labels: dict) -> None:
+    diff_ids = []
+    for spec in specs:
+        diff_id = "sha256:" + hashlib.sha256(makeLayer(spec)).hexdigest()
+        state["layers"][diff_id] = spec
+        diff_ids.append(diff_id)
+    config = json.dumps({"config": {"Labels": labels}, "rootfs": {"type": "layers", "diff_ids": diff_ids}}, sort_keys=True)
+    state["images"][tag] = {"labels": labels, "layers": diff_ids, "id": "sha256:" + hashlib.sha256(config.encode()).hexdigest()}
+
+
+def imageData(name: str, image: dict) -> dict:
+    return {"Id": image.get("id", "sha256:" + name), "RepoTags": [name if ":" in name else name + ":latest"], "Config": {"Labels": image.get("labels", {})},
+            "Size": image.get("size", 0), "RootFS": {"Type": "layers", "Layers": image.get("layers", [])}}
+
+
+def saveImage(state: dict, name: str, output) -> None:
+    image = state["images"][name]
+    config = json.dumps({"config": {"Labels": image.get("labels", {})}, "rootfs": {"type": "layers", "diff_ids": image["layers"]}}, sort_keys=True).encode()
+    legacy = os.environ.get("FAKE_DOCKER_SAVE_FORMAT") == "legacy"
+    config_name = f"{image['id'][7:]}.json" if legacy else f"blobs/sha256/{image['id'][7:]}"
+    layer_names = []
+    with tarfile.open(fileobj=output, mode="w|") as archive:
+        def add(name, data):
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            archive.addfile(info, io.BytesIO(data))
+        for i, diff_id in enumerate(image["layers"]):
+            layer_names.append(f"{i:064x}/layer.tar" if legacy else f"blobs/sha256/{diff_id[7:]}")
+            add(layer_names[-1], makeLayer(state["layers"][diff_id]))
+        add(config_name, config)
+        if not legacy:
+            add("oci-layout", b'{"imageLayoutVersion": "1.0.0"}')
+            add("index.json", json.dumps({"schemaVersion": 2, "manifests": []}).encode())
+        add("manifest.json", json.dumps([{"Config": config_name, "RepoTags": [name + ":latest"], "Layers": layer_names}]).encode())
+
+
+def loadImage(state: dict, source) -> int:
+    files = {}
+    with tarfile.open(fileobj=source, mode="r|") as archive:
+        for member in archive:
+            if member.isfile():
+                files[member.name] = archive.extractfile(member).read()
+    manifest = json.loads(files["manifest.json"])[0]
+    config = json.loads(files[manifest["Config"]])
+    diff_ids = config["rootfs"]["diff_ids"]
+    chains = [image.get("layers", []) for image in state["images"].values()]
+    for i, (diff_id, layer_name) in enumerate(zip(diff_ids, manifest["Layers"])):
+        # Like the daemon, a layer is only read when its chain (the layer and its parents) doesn't exist
+        if any(chain[:i + 1] == diff_ids[:i + 1] for chain in chains):
+            continue
+        if layer_name not in files:
+            print(f"open /var/lib/docker/tmp/docker-import/{layer_name}: no such file or directory", file=sys.stderr)
+            return 1
+        if "sha256:" + hashlib.sha256(files[layer_name]).hexdigest() != diff_id:
+            print(f"invalid diffID for layer {i}", file=sys.stderr)
+            return 1
+        with tarfile.open(fileobj=io.BytesIO(files[layer_name]), mode="r") as layer:
+            state["layers"][diff_id] = layer.getnames()[0]
+    tag = manifest["RepoTags"][0].removesuffix(":latest")
+    addImage(state, tag, [state["layers"][diff_id] for diff_id in diff_ids], config["config"]["Labels"])
+    print(f"Loaded image: {tag}:latest")
+    return 0
+
+
+def printBuildProgress(state: dict, dockerfile: str) -> None:
+    # BuildKit rawjson progress: one vertex per instruction, taking FAKE_DOCKER_STEP_TIME seconds (0.5 by default)
+    # or cached when an image was already built with the same instructions until this one
+    with open(dockerfile, "r") as file:
+        # The continuation lines are joined, like in the vertex names of BuildKit
+        text = re.sub(r"\\\s*\n\s*", "", file.read())
+    instructions = [line.strip() for line in text.splitlines() if re.match(r"[A-Z]+ ", line)]
+    start = time.time()
+    cached = True
+    vertexes = [{"digest": "sha256:context", "name": "[internal] load build context", "started": formatTime(start), "completed": formatTime(start)}]
+    for i, instruction in enumerate(instructions):
+        cached = cached and instruction in state["steps"]
+        end = start if cached else start + float(os.environ.get("FAKE_DOCKER_STEP_TIME", "0.5"))
+        vertexes.append({"digest": f"sha256:{i}", "name": f"[{i + 1}/{len(instructions)}] {instruction}", "cached": cached,
+                         "started": formatTime(start), "completed": formatTime(end)})
+        if instruction not in state["steps"]:
+            state["steps"].append(instruction)
+        start = end
+    for vertex in vertexes:
+        print(json.dumps({"vertexes": [vertex]}), file=sys.stderr)
+
+
+def formatTime(timestamp: float) -> str:
+    # RFC 3339 with nanoseconds, like BuildKit
+    return time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(timestamp)) + f".{int(timestamp % 1 * 1e9):09d}Z"
+
+
+def containerHealth(container: dict) -> dict:
+    # Starting for FAKE_DOCKER_READY_DELAY seconds after the start, then FAKE_DOCKER_HEALTH (healthy by default)
+    if time.time() - container.get("started", 0) < float(os.environ.get("FAKE_DOCKER_READY_DELAY", "0")):
+        return {"Status": "starting", "FailingStreak": 0, "Log": []}
+    status = os.environ.get("FAKE_DOCKER_HEALTH", "healthy")
+    output = "The daemon is running\n" if status == "healthy" else "The daemon is not running\n"
+    return {"Status": status, "FailingStreak": 0 if status == "healthy" else 3, "Log": [{"ExitCode": 0 if status == "healthy" else 1, "Output": output}]}
+
+
+def loadState(path: str) -> dict:
+    try:
+        with open(path, "r") as state_file:
+            state = json.load(state_file)
+    except (OSError, json.JSONDecodeError):
+        state = {}
+    state.setdefault("containers", {})
+    state.setdefault("images", {})
+    state.setdefault("layers", {})
+    state.setdefault("steps", [])
+    return state
+
+
+def saveState(path: str, state: dict) -> None:
+    with open(path, "w") as state_file:
+        json.dump(state, state_file)
+
+
+def getComposeService(files: list[str] = None) -> dict:
+    service = {}
+    for path in files or ["docker-compose.yaml"]:
+        with open(path, "r") as compose_file:
+            # Like compose, the mappings of the next files are merged key by key
+            for key, value in next(iter(yaml.safe_load(compose_file)["services"].values())).items():
+                service[key] = dict(service[key], **value) if isinstance(value, dict) and isinstance(service.get(key), dict) else value
+    return service
+
+
+def run(args: list[str], state: dict) -> int:
+    files = []
+    while args[:1] == ["compose"] and args[1:2] == ["-f"]:
+        files.append(args[2])
+        args = ["compose"] + args[3:]
+
+    if args[:2] == ["compose", "build"]:
+        service = getComposeService()
+        build_hash = os.environ.get("ROS_ENV_BUILD_HASH", "")
+        # The labels of the build section, with the variable compose substitute
+        labels = {key: str(value).replace("${ROS_ENV_BUILD_HASH:-}", build_hash) for key, value in service["build"].get("labels", {}).items()}
+        addImage(state, service["image"], ["base-0", "base-1", f"{service['image']}-{build_hash}"], labels)
+        # A bigger Dockerfile give a bigger image. Like compose, its path is relative to the context
+        dockerfile = os.path.join(service["build"].get("context", "."), service["build"]["dockerfile"])
+        state["images"][service["image"]]["size"] = os.path.getsize(dockerfile) << 20
+        if os.environ.get("BUILDKIT_PROGRESS") == "rawjson":
+            printBuildProgress(state, dockerfile)
+        return 0
+
+    if args[:2] == ["compose", "up"]:
+        service = getComposeService(files)
+        if service["image"] not in state["images"] and not any(service["image"] == image.get("id") for image in state["images"].values()):
+            print(f"Error: pull access denied for {service['image']}", file=sys.stderr)
+            return 1
+        state["containers"][service["container_name"]] = {"running": True, "image": service["image"], "started": time.time(),
+                                                          "healthcheck": service.get("healthcheck")}
+        return 0
+
+    if args[:1] == ["build"]:
+        tag = args[args.index("-t") + 1]
+        labels = dict(arg[len("--label="):].split("=", 1) for arg in args if arg.startswith("--label="))
+        state["images"][tag] = {"labels": labels}
+        return 0
+
+    if len(args) >= 3 and args[0] in ("container", "image") and args[1] == "inspect":
+        name = args[2]
+        if args[0] == "container" and name in state["containers"]:
+            container = state["containers"][name]
+            image = state["images"].get(container["image"], {})
+            data = {"Id": name + "-id", "Name": "/" + name, "Image": image.get("id", "sha256:" + container["image"]), "State": {"Status": "running" if container["running"] else "exited", "Running": container["running"]}}
+            if container.get("healthcheck"):
+                data["State"]["Health"] = containerHealth(container)
+            print(json.dumps([data]))
+            return 0
+        if args[0] == "image":
+            # By name or by ID, many at once
+            images = [next(((other, image) for other, image in state["images"].items() if name in (other, image.get("id", "sha256:" + other))), None) for name in args[2:]]
+            if None not in images:
+                print(json.dumps([imageData(other, image) for other, image in images]))
+                return 0
+            name = args[2 + images.index(None)]
+        print(f"Error: No such {args[0]}: {name}", file=sys.stderr)
+        return 1
+
+    if len(args) >= 2 and args[0] in ("start", "stop", "rm"):
+        name = args[-1]
+        if name not in state["containers"]:
+            print(f"Error: No such container: {name}", file=sys.stderr)
+            return 1
+        if args[0] == "rm":
+            del state["containers"][name]
+        else:
+            state["containers"][name]["running"] = args[0] == "start"
+            state["containers"][name]["started"] = time.time()
+        return 0
+
+    if len(args) >= 2 and args[0] == "rmi":
+        if args[-1] not in state["images"]:
+            print(f"Error: No such image: {args[-1]}", file=sys.stderr)
+            return 1
+        users = [name for name, container in state["containers"].items() if container.get("image") == args[-1]]
+        if users:
+            print(f"Error response from daemon: conflict: unable to remove repository reference \"{args[-1]}\" (must force) - container {users[0]}-id is using its referenced image", file=sys.stderr)
+            return 1
+        del state["images"][args[-1]]
+        return 0
+
+    if args[:1] == ["ps"]:
+        for name, container in state["containers"].items():
+            if not (container["running"] or "-a" in args):
+                continue
+            if "json" in args:
+                print(json.dumps({"ID": name + "-id", "Names": name, "Image": container.get("image", name),
+                                  "State": "running" if container["running"] else "exited", "Status": "Up" if container["running"] else "Exited (0)"}))
+            else:
+                print(f"{name}-id  {container.get('image', name)}  {name}")
+        return 0
+
+    if args[:1] == ["commit"]:
+        name, tag = args[-2:]
+        if name not in state["containers"]:
+            print(f"Error: No such container: {name}", file=sys.stderr)
+            return 1
+        image = state["images"][state["containers"][name]["image"]]
+        labels = dict(image.get("labels", {}))
+        for change in [args[i + 1] for i, arg in enumerate(args[:-2]) if arg == "--change"]:
+            key, value = change.removeprefix("LABEL ").split("=", 1)
+            labels[key] = value
+        addImage(state, tag, [state["layers"][diff_id] for diff_id in image["layers"]] + [f"{tag}-changes"], labels)
+        state["images"][tag]["size"] = image.get("size", 0) + (1 << 20)
+        print(state["images"][tag]["id"])
+        return 0
+
+    if args[:1] == ["save"]:
+        if args[1] not in state["images"]:
+            print(f"Error response from daemon: reference does not exist", file=sys.stderr)
+            return 1
+        saveImage(state, args[1], sys.stdout.buffer)
+        return 0
+
+    if args[:1] == ["load"]:
+        return loadImage(state, sys.stdin.buffer)
+
+    if args[:1] == ["images"] or args[:2] == ["image", "ls"]:
+        labels = [args[i + 1][len("label="):] for i, arg in enumerate(args[:-1]) if arg == "--filter" and args[i + 1].startswith("label=")]
+        for name, image in state["images"].items():
+            if not all(key in image.get("labels", {}) and value in ("", image["labels"][key]) for key, _, value in (label.partition("=") for label in labels)):
+                continue
+            if "-q" in args:
+                print(image.get("id", "sha256:" + name))
+            elif "json" in args:
+                print(json.dumps({"Repository": name, "Tag": "latest", "ID": "sha256:" + name, "CreatedAt": "2024-05-01 12:00:00 +0000 UTC"}))
+            else:
+                print(f"{name}  latest  sha256:{name}")
+        return 0
+
+    if args[:1] == ["version"]:
+        print(os.environ.get("FAKE_DOCKER_API_VERSION", "1.45"))
+        return 0
+
+    if args[:1] == ["exec"] and "python3" in args and "FAKE_DOCKER_HOME" in os.environ:
+        command = args[args.index("python3"):]
+        return subprocess.run(command, env=dict(os.environ, HOME=os.environ["FAKE_DOCKER_HOME"])).returncode
+
+    # exec, image history, volume, ... succeed without output
+    return 0
+
+
+if __name__ == "__main__":
+    time.sleep(float(os.environ.get("FAKE_DOCKER_LATENCY", "0")) / 1000)
+    state_path = os.environ.get("FAKE_DOCKER_STATE", "fake_docker_state.json")
+    # Calls run in parallel with fleet, the state is locked while it is updated
+    with open(state_path + ".lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        state = loadState(state_path)
+        code = run(sys.argv[1:], state)
+        saveState(state_path, state)
+    sys.exit(code)
@@ -0,0 +1,102 @@
+import os
+import sys
+import time
+import pathlib
+import threading
+import concurrent.futures
+import yaml
+from RosEnvParam import RosEnvParam
+from docker_tools import inspectContainer, inspectImage, runProcess
+
+
+COMMANDS = {
+    "build": ["build"],
+    "start": ["start", "--detach"],
+    "stop": ["stop"],
+    "kill": ["kill"]
+}
+
+
+class fleet:
+    """
+    Many environments listed in a manifest, one param file per environment:
+
+        parallelism: 4
+        environments:
+            - robot_a/.ros_env_param.yaml
+            - robot_b/.ros_env_param.yaml
+
+    Each command run ros-env.py in the folder of the param file, at most parallelism at the same time.
+    """
+
+    def __init__(self, param_paths: list[pathlib.Path], parallelism: int = 4):
+        """
+        :param param_paths: the param file of each environment
+        :param parallelism: maximum number of environments handled at the same time
+        """
+        self.parallelism = parallelism
+        self.environments = []
+        for path in param_paths:
+            path = pathlib.Path(path).resolve()
+            self.environments.append({"path": path, "name": RosEnvParam.load(RosEnvParam.exist(path))["container_name"]})
+        self.print_lock = threading.Lock()
+
+    def load(manifest: str, parallelism: int = None) -> "fleet":
+        manifest = pathlib.Path(manifest)
+        with open(manifest, "r") as manifest_file:
+            data = yaml.safe_load(manifest_file) or {}
+        return fleet([manifest.parent / path for path in data.get("environments", [])],
+                     parallelism if parallelism != None else data.get("parallelism", 4))
+
+    def print(self, name: str, line: str) -> None:
+        with self.print_lock:
+            print(f"[{name}] {line}", flush=True)
+
+    def runOne(self, environment: dict, command: str) -> dict:
+        start = time.perf_counter()
+
+        def output(line: str) -> None:
+            line = line.rstrip()
+            if line != "":
+                self.print(environment["name"], line)
+
+        result = runProcess([sys.executable, str(pathlib.Path(__file__).resolve().parent / "ros-env.py"),
+                             "--param-path", environment["path"].name] + COMMANDS[command],
+                            onStdout=output, onStderr=output, cwd=environment["path"].parent, env=dict(os.environ, PYTHONUNBUFFERED="1"))
+        code = result.returncode
+        return {"name": environment["name"], "command": command, "success": code == 0, "code": code,
+                "duration": time.perf_counter() - start}
+
+    def run(self, command: str) -> list[dict]:
+        """
+        Run the command on every environment.
+
+        :return: one result per environment, in the manifest order
+        """
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, self.parallelism)) as pool:
+            futures = [pool.submit(self.runOne, environment, command) for environment in self.environments]
+            return [future.result() for future in futures]
+
+    def status(self) -> list[dict]:
+        res = []
+        for environment in self.environments:
+            container = inspectContainer(environment["name"])
+            image = inspectImage(environment["name"])
+            res.append({"name": environment["name"],
+                        "container": container["State"].get("Status", "running" if container["State"]["Running"] else "exited") if container != None else "absent",
+                        "image": "built" if image != None else "not built",
+                        "path": str(environment["path"].parent)})
+        return res
+
+
+def formatTable(rows: list[dict], columns: list[str]) -> list[str]:
+    widths = {column: max([len(column)] + [len(str(row[column])) for row in rows]) for column in columns}
+    lines = ["  ".join(column.upper().ljust(widths[column]) for column in columns)]
+    for row in rows:
+        lines.append("  ".join(str(row[column]).ljust(widths[column]) for column in columns))
+    return lines
+
+
+def printTable(rows: list[dict], columns: list[str]) -> None:
+    for line in formatTable(rows, columns):
+        print(line)
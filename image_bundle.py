@@ -0,0 +1,319 @@
+import io
+import os
+import json
+import time
+import shutil
+import hashlib
+import pathlib
+import tarfile
+import threading
+import subprocess
+from docker_api import docker_api
+from docker_tools import runProcess, inspectImage, getComposeImage, QUERY_TIMEOUT
+from docker_generator import writeIfChanged
+from dds_profile import DDS_DIR
+
+
+BUNDLE_VERSION = 1
+MANIFEST = "bundle.json"
+# Generated next to the param file, restored so the image can be started without create_from
+GENERATED_FILES = ["Dockerfile", "docker-compose.yaml", ".env", ".dockerignore", "Dockerfile.dockerignore"]
+CHUNK = 1 << 20
+# Raised by a truncated or damaged bundle: broken tar, missing member, invalid json
+BUNDLE_ERRORS = (tarfile.TarError, EOFError, KeyError, ValueError, UnicodeDecodeError)
+
+
+class image_bundle:
+    """
+    Single file to deploy an environment on a computer without network: the param file, the generated files and
+    the image as saved by docker save. Each layer is a zstd member of the bundle, the layers a previous bundle
+    already carried are left out, so the bundle of a rebuild only weight the changed layers.
+
+    Layout (plain tar): bundle.json, files/<generated file>, image/meta.tar (the docker save members which are not
+    layers), image/layers/<diff id>.tar.zst
+    """
+
+    def export(rosEnv: dict, param_path: str, output: str, since: list[str] = None, level: int = 3) -> dict:
+        """
+        :param since: bundles already imported on the target, the layers they carry are not written again
+        :param level: zstd compression level
+        :return: the manifest of the bundle
+        """
+        checkZstd()
+        # The image compose tagged, named after the container
+        image = getComposeImage(pathlib.Path(param_path).parent / "docker-compose.yaml") or rosEnv["container_name"]
+        data = inspectImage(image)
+        if data == None:
+            raise RuntimeError(f"The image {image} doesn't exist. Build it first.")
+        layers = data["RootFS"]["Layers"]
+
+        # docker load reuse a layer only if all its parents are there: skip the longest prefix of the image
+        # which is a prefix of an image carried by a previous bundle
+        skipped = 0
+        for path in since or []:
+            try:
+                with tarfile.open(path, "r") as previous:
+                    chain = [layer["diff_id"] for layer in readManifest(previous)["layers"]]
+            except BUNDLE_ERRORS as e:
+                raise RuntimeError(f"{path} is not a readable bundle: {e}") from None
+            skipped = max(skipped, commonPrefix(layers, chain))
+        skip = set(layers[:skipped])
+
+        output = pathlib.Path(output)
+        tmp = output.with_name(output.name + ".tmp")
+        layer_path = output.with_name(f"{output.name}.layer.tmp")
+        raw_path = output.with_name(f"{output.name}.raw.tmp")
+        manifest = {"version": BUNDLE_VERSION,
+                    "image": image,
+                    "image_id": data["Id"],
+                    "container": rosEnv["container_name"],
+                    "param": pathlib.Path(param_path).name,
+                    "since": [pathlib.Path(path).name for path in since or []],
+                    "created": time.time(),
+                    "files": [],
+                    "layers": [{"diff_id": layer, "included": layer not in skip} for layer in layers],
+                    "members": []} # docker save members in order: {"name", "diff_id"} for the layers, {"name"} else
+
+        process = subprocess.Popen(["docker", "save", image], stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        try:
+            with tarfile.open(tmp, "w") as bundle, io.BytesIO() as meta_buffer:
+                for name, path in getBundleFiles(param_path):
+                    bundle.add(path, arcname=f"files/{name}", recursive=False)
+                    manifest["files"].append(name)
+
+                with tarfile.open(fileobj=process.stdout, mode="r|") as save, tarfile.open(fileobj=meta_buffer, mode="w") as meta:
+                    for member in save:
+                        diff_id = getLayerId(member, layers)
+                        if diff_id == None:
+                            meta.addfile(member, save.extractfile(member) if member.isfile() else None)
+                            manifest["members"].append({"name": member.name})
+                            continue
+                        if diff_id in skip: # The name give the digest, the layer is not even read
+                            manifest["members"].append({"name": member.name, "diff_id": diff_id, "size": member.size})
+                            continue
+                        # Legacy save format: the digest is only known once the layer is read. With layers to
+                        # skip, it is hashed into a raw copy first so a skipped layer is never compressed
+                        source = save.extractfile(member)
+                        if skip:
+                            diff_id = copyLayer(source, raw_path)
+                            source = open(raw_path, "rb")
+                        try:
+                            if diff_id not in skip:
+                                diff_id = compressLayer(source, layer_path, level)
+                                bundle.add(layer_path, arcname=f"image/layers/{diff_id}.tar.zst")
+                                entry = next(layer for layer in manifest["layers"] if layer["diff_id"] == diff_id)
+                                entry["size"] = member.size
+                                entry["compressed"] = layer_path.stat().st_size
+                                layer_path.unlink()
+                        finally:
+                            if skip:
+                                source.close()
+                                raw_path.unlink()
+                        manifest["members"].append({"name": member.name, "diff_id": diff_id, "size": member.size})
+
+                addBytes(bundle, "image/meta.tar", meta_buffer.getvalue())
+                addBytes(bundle, MANIFEST, json.dumps(manifest, indent=1).encode())
+
+            if process.wait() != 0:
+                raise RuntimeError(f"docker save failed: {process.stderr.read().decode(errors='replace').strip()}")
+            os.replace(tmp, output)
+        finally:
+            if process.poll() == None:
+                process.kill()
+                process.wait()
+            process.stdout.close()
+            process.stderr.close()
+            for path in (tmp, layer_path, raw_path):
+                if path.exists():
+                    path.unlink()
+        return manifest
+
+    def load(path: str, output_dir: str = ".") -> dict:
+        """
+        Write the files of the bundle in output_dir and load its image in docker, unless it is already there.
+
+        :return: the manifest of the bundle
+        """
+        output_dir = pathlib.Path(output_dir)
+        try:
+            with tarfile.open(path, "r") as bundle:
+                manifest = readManifest(bundle)
+                existing = inspectImage(manifest["image"])
+                if existing == None or existing["Id"] != manifest["image_id"]:
+                    checkZstd()
+                    missing = [layer["diff_id"] for layer in manifest["layers"] if not layer["included"]]
+                    if missing and not any(commonPrefix(chain, missing) == len(missing) for chain in getLocalLayers()):
+                        raise RuntimeError(f"This bundle doesn't contain the first {len(missing)} layer(s) of the image, "
+                                           f"import one of these bundles first: {', '.join(manifest['since'])}")
+                    dockerLoad(bundle, manifest)
+
+                for name in manifest["files"]:
+                    if name.startswith("/") or ".." in name.split("/"):
+                        continue
+                    (output_dir / name).parent.mkdir(parents=True, exist_ok=True)
+                    content = bundle.extractfile(f"files/{name}").read().decode()
+                    writeIfChanged(output_dir / name, content)
+        except BUNDLE_ERRORS as e:
+            raise RuntimeError(f"{path} is not a readable bundle, it may be truncated or damaged: {e}") from None
+        return manifest
+
+
+def readManifest(bundle: tarfile.TarFile) -> dict:
+    manifest = json.load(bundle.extractfile(MANIFEST))
+    if manifest.get("version") != BUNDLE_VERSION:
+        raise RuntimeError(f"Unknown bundle version {manifest.get('version')}, update ros-env.")
+    return manifest
+
+
+def checkZstd() -> None:
+    if shutil.which("zstd") == None:
+        raise RuntimeError("The zstd command is needed to compress the bundles: sudo apt install zstd")
+
+
+def commonPrefix(first: list, second: list) -> int:
+    count = 0
+    for a, b in zip(first, second):
+        if a != b:
+            break
+        count += 1
+    return count
+
+
+def getBundleFiles(param_path: str) -> list[tuple[str, pathlib.Path]]:
+    """
+    :return: (name relative to the folder of the param file, path) of the param file and of the generated files
+    """
+    folder = pathlib.Path(param_path).parent
+    files = [(pathlib.Path(param_path).name, pathlib.Path(param_path))]
+    for name in GENERATED_FILES:
+        if (folder / name).is_file():
+            files.append((name, folder / name))
+    if (folder / DDS_DIR).is_dir():
+        for path in sorted((folder / DDS_DIR).iterdir()):
+            if path.is_file():
+                files.append((f"{DDS_DIR}/{path.name}", path))
+    return files
+
+
+def getLayerId(member: tarfile.TarInfo, layers: list[str]) -> str:
+    """
+    :return: the diff id of a layer of docker save, "" if it is a layer of the legacy format (<id>/layer.tar, the
+             digest is not in the name) and None for the other members
+    """
+    if not member.isfile():
+        return None
+    if member.name.endswith("/layer.tar"):
+        return ""
+    # Since Docker 25 the save is an OCI layout: the uncompressed layers are blobs named after their diff id
+    if member.name.startswith("blobs/sha256/") and "sha256:" + member.name.rsplit("/", 1)[1] in layers:
+        return "sha256:" + member.name.rsplit("/", 1)[1]
+    return None
+
+
+def copyLayer(source, path: pathlib.Path) -> str:
+    """
+    Copy a layer as it is, and hash it on the way.
+
+    :return: the diff id of the layer
+    """
+    sha = hashlib.sha256()
+    with open(path, "wb") as output:
+        for chunk in iter(lambda: source.read(CHUNK), b""):
+            sha.update(chunk)
+            output.write(chunk)
+    return "sha256:" + sha.hexdigest()
+
+
+def compressLayer(source, path: pathlib.Path, level: int) -> str:
+    """
+    Compress a layer with zstd on all the cores, and hash it on the way.
+
+    :return: the diff id of the layer (sha256 of the uncompressed tar)
+    """
+    sha = hashlib.sha256()
+    with open(path, "wb") as output:
+        process = subprocess.Popen(["zstd", "-q", "-T0", f"-{level}", "-c"], stdin=subprocess.PIPE, stdout=output)
+        try:
+            for chunk in iter(lambda: source.read(CHUNK), b""):
+                sha.update(chunk)
+                process.stdin.write(chunk)
+            process.stdin.close()
+        finally:
+            if process.wait() != 0:
+                raise RuntimeError(f"zstd failed on {path}")
+    return "sha256:" + sha.hexdigest()
+
+
+def addBytes(bundle: tarfile.TarFile, name: str, data: bytes) -> None:
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    info.mtime = int(time.time())
+    bundle.addfile(info, io.BytesIO(data))
+
+
+def getLocalLayers() -> list[list[str]]:
+    """
+    :return: the diff ids of the layers of each local image
+    """
+    client = docker_api.client()
+    if client.available():
+        try:
+            return [inspectImage(image["Id"])["RootFS"]["Layers"] for image in client.listImages()]
+        except OSError:
+            pass
+    result = runProcess(["docker", "image", "ls", "-q", "--no-trunc"], timeout=QUERY_TIMEOUT)
+    ids = sorted(set(result.stdout.split()))
+    if result.returncode != 0 or not ids:
+        return []
+    result = runProcess(["docker", "image", "inspect", *ids], timeout=QUERY_TIMEOUT)
+    return [image["RootFS"]["Layers"] for image in json.loads(result.stdout)] if result.returncode == 0 else []
+
+
+def dockerLoad(bundle: tarfile.TarFile, manifest: dict) -> None:
+    """
+    Rebuild the docker save archive from the bundle and stream it to docker load. The layers left out of the
+    bundle are left out of the archive too: docker load doesn't read the layers it already has.
+    """
+    meta = tarfile.open(fileobj=bundle.extractfile("image/meta.tar"), mode="r")
+    included = {layer["diff_id"] for layer in manifest["layers"] if layer["included"]}
+    process = subprocess.Popen(["docker", "load", "-q"], stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    try:
+        with tarfile.open(fileobj=process.stdin, mode="w|") as archive:
+            for member in manifest["members"]:
+                if "diff_id" not in member:
+                    info = meta.getmember(member["name"])
+                    archive.addfile(info, meta.extractfile(info) if info.isfile() else None)
+                elif member["diff_id"] in included:
+                    info = tarfile.TarInfo(member["name"])
+                    info.size = member["size"]
+                    info.mode = 0o644
+                    decompressLayer(bundle.extractfile(f"image/layers/{member['diff_id']}.tar.zst"), archive, info)
+        process.stdin.close()
+    except BrokenPipeError:
+        pass
+    output = process.stdout.read().decode(errors="replace")
+    if process.wait() != 0:
+        raise RuntimeError(f"docker load failed: {output.strip()}")
+
+
+def decompressLayer(source, archive: tarfile.TarFile, info: tarfile.TarInfo) -> None:
+    process = subprocess.Popen(["zstd", "-q", "-d", "-c"], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+
+    def feed():
+        try:
+            for chunk in iter(lambda: source.read(CHUNK), b""):
+                process.stdin.write(chunk)
+        except BrokenPipeError:
+            pass
+        finally:
+            process.stdin.close()
+
+    feeder = threading.Thread(target=feed, daemon=True)
+    feeder.start()
+    try:
+        archive.addfile(info, process.stdout)
+    finally:
+        process.stdout.close()
+        feeder.join()
+        if process.wait() != 0:
+            raise RuntimeError(f"zstd failed on the layer {info.name}")
@@ -0,0 +1,44 @@
+IMAGE_PROFILES = ["desktop", "base", "headless", "sim"]
+
+BUILD_TOOLS = ["git", "make", "cmake", "build-essential", "python3", "python3-pip", "python3-rosdep"]
+GUI_DEPS = ["libglib2.0-0", "libsm6", "libxext6", "libxrender-dev", "libopencv-dev", "ffmpeg", "xterm"]
+PIP_DEPS = ["networkx", "matplotlib", "xacro"]
+
+
+class image_profile:
+    """
+    Base image and default dependencies of an environment.
+
+    - desktop: osrf/ros desktop image with the GUI tools, X libraries, OpenCV, ffmpeg and the Python plotting stack.
+    - sim: same from the desktop-full image (simulators included), Gazebo is always installed.
+    - base: official ros-base image (no GUI), the build tools and the ROS control packages. For the robots.
+    - headless: official ros-base image and the build tools only, the workspace brings its dependencies with its
+      package.xml files. For the CI.
+    """
+
+    def __init__(self, name: str = "desktop"):
+        if name not in IMAGE_PROFILES:
+            raise ValueError(f"{name} image profile is not supported. Choose one of {IMAGE_PROFILES}")
+        self.name = name
+
+    def getBaseImage(self, ros_distro: str) -> str:
+        if self.name == "desktop":
+            return f"osrf/ros:{ros_distro}-desktop"
+        if self.name == "sim":
+            return f"osrf/ros:{ros_distro}-desktop-full"
+        return f"ros:{ros_distro}-ros-base"
+
+    def hasGUI(self) -> bool:
+        return self.name in ("desktop", "sim")
+
+    def isGazebo(self) -> bool:
+        return self.name == "sim"
+
+    def hasRosDependencies(self) -> bool:
+        return self.name != "headless"
+
+    def getAptDependencies(self) -> list[str]:
+        return BUILD_TOOLS + (GUI_DEPS if self.hasGUI() else [])
+
+    def getPipDependencies(self) -> list[str]:
+        return PIP_DEPS if self.hasGUI() else []
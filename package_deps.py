@@ -0,0 +1,258 @@
+import os
+import re
+import json
+import time
+import hashlib
+import pathlib
+import concurrent.futures
+import xml.etree.ElementTree as ET
+import yaml
+from rosdistro_cache import getCacheDir
+from package_index import UBUNTU_RELEASES
+
+
+ROSDEP_URLS = ["https://raw.githubusercontent.com/ros/rosdistro/master/rosdep/base.yaml",
+               "https://raw.githubusercontent.com/ros/rosdistro/master/rosdep/python.yaml"]
+DISTRIBUTION_URL = "https://raw.githubusercontent.com/ros/rosdistro/master/{distro}/distribution.yaml"
+# The test and doc dependencies are not installed
+DEPEND_TAGS = ["depend", "build_depend", "build_export_depend", "buildtool_depend", "exec_depend", "run_depend"]
+IGNORED_FOLDERS = ["build", "install", "log", ".git"]
+
+
+class rosdep_cache:
+    """
+    Compact copy of the rosdep database for one distro: only the apt and pip packages of each key on the Ubuntu
+    release of the distro are kept, with the names of the ROS packages released for it.
+    """
+
+    TTL = 24*60*60 # One day, like the rosdistro index
+
+    def __init__(self, ros_distro: str, path: pathlib.Path = None, ttl: int = None, offline: bool = False):
+        if ros_distro not in UBUNTU_RELEASES:
+            raise NameError(f"The Ubuntu release of {ros_distro} is unknown, its rosdep keys can't be resolved.")
+        self.ros_distro = ros_distro
+        self.release = UBUNTU_RELEASES[ros_distro]
+        self.path = path if path != None else getCacheDir() / "rosdep" / f"{ros_distro}.json"
+        self.ttl = ttl if ttl != None else rosdep_cache.TTL
+        self.offline = offline
+        self.data = self.read()
+
+    def read(self) -> dict:
+        try:
+            with open(self.path, "r") as cache_file:
+                data = json.load(cache_file)
+        except (OSError, json.JSONDecodeError):
+            return None
+        if not isinstance(data, dict) or not isinstance(data.get("keys"), dict):
+            return None
+        return data
+
+    def write(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".tmp")
+        with open(tmp, "w") as cache_file:
+            json.dump(self.data, cache_file)
+        os.replace(tmp, self.path)
+
+    def isFresh(self) -> bool:
+        return self.data != None and time.time() - self.data.get("fetched", 0) < self.ttl
+
+    def refresh(self) -> None:
+        import requests
+
+        keys = {}
+        for url in ROSDEP_URLS:
+            response = requests.get(url, timeout=30)
+            response.raise_for_status()
+            for key, rule in (yaml.safe_load(response.text) or {}).items():
+                packages = resolveRule(rule, self.release)
+                if packages != None:
+                    keys[key] = packages
+
+        response = requests.get(DISTRIBUTION_URL.format(distro=self.ros_distro), timeout=30)
+        response.raise_for_status()
+        ros_packages = []
+        for name, repository in (yaml.safe_load(response.text).get("repositories") or {}).items():
+            release = repository.get("release")
+            if release != None:
+                ros_packages += release.get("packages", [name])
+
+        self.data = {"fetched": time.time(), "release": self.release, "keys": keys, "ros packages": sorted(set(ros_packages))}
+        self.write()
+
+    def load(self) -> dict:
+        """
+        Same rules as rosdistro_cache: at most one network round trip, none if the cache is fresh or in offline mode.
+        """
+        if self.offline:
+            if self.data == None:
+                raise ConnectionError(f"Offline mode but no rosdep database cached in {self.path}. Run once with network first.")
+            return self.data
+
+        if not self.isFresh():
+            try:
+                self.refresh()
+            except Exception as e:
+                if self.data == None:
+                    raise ConnectionError(f"Error fetching the rosdep database: {e}") from e
+                print(f"\nError fetching the rosdep database: {e}\nUsing the cached one from {self.path}")
+        return self.data
+
+    def resolve(self, keys: list[str]) -> tuple[dict, list[str]]:
+        """
+        :return: the apt and pip packages of the keys ({"apt": [...], "pip": [...]}) and the keys which are unknown
+        """
+        data = self.load()
+        ros_packages = set(data["ros packages"])
+        res = {"apt": set(), "pip": set()}
+        unresolved = []
+        for key in keys:
+            if key in ros_packages:
+                res["apt"].add(f"ros-{self.ros_distro}-{key.replace('_', '-')}")
+            elif key in data["keys"]:
+                for kind in ("apt", "pip"):
+                    res[kind].update(data["keys"][key][kind])
+            else:
+                unresolved.append(key)
+        return {kind: sorted(packages) for kind, packages in res.items()}, sorted(unresolved)
+
+
+def resolveRule(rule: dict, release: str) -> dict:
+    """
+    Find the packages of a rosdep rule on an Ubuntu release. The rules are either a list of apt packages or a
+    dict by release ("*" for the others) of lists or of {apt|pip: {packages: [...]}}.
+
+    :return: {"apt": [...], "pip": [...]} or None if the key is not available on Ubuntu
+    """
+    ubuntu = rule.get("ubuntu") if isinstance(rule, dict) else None
+    if isinstance(ubuntu, dict) and not ("apt" in ubuntu or "pip" in ubuntu or "packages" in ubuntu):
+        if release in ubuntu:
+            ubuntu = ubuntu[release]
+        elif "*" in ubuntu:
+            ubuntu = ubuntu["*"]
+        else:
+            return None
+        if ubuntu == None: # Explicitly nothing to install on this release
+            return {"apt": [], "pip": []}
+
+    if isinstance(ubuntu, list):
+        return {"apt": ubuntu, "pip": []}
+    if isinstance(ubuntu, dict):
+        if "packages" in ubuntu:
+            return {"apt": ubuntu["packages"] or [], "pip": []}
+        return {kind: ((ubuntu.get(kind) or {}).get("packages") or []) for kind in ("apt", "pip")}
+    return None
+
+
+def parsePackageXML(path: pathlib.Path) -> dict:
+    """
+    :return: the name of the package and its dependencies, as [key, condition or None]
+    """
+    root = ET.parse(path).getroot()
+    depends = []
+    for tag in DEPEND_TAGS:
+        for depend in root.findall(tag):
+            if depend.text:
+                depends.append([depend.text.strip(), depend.get("condition")])
+    return {"name": root.findtext("name", "").strip(), "depends": depends}
+
+
+def isConditionTrue(condition: str, ros_type: str) -> bool:
+    """
+    Evaluate the condition attribute of a dependency ($ROS_VERSION == 2, $ROS_PYTHON_VERSION == 3, and, or).
+    """
+    if condition == None:
+        return True
+    variables = {"ROS_VERSION": "2" if ros_type == "ros2" else "1", "ROS_PYTHON_VERSION": "3"}
+    condition = re.sub(r"\$(\w+)", lambda match: variables.get(match.group(1), ""), condition)
+    for alternative in re.split(r"\s+or\s+", condition):
+        if all(isComparisonTrue(comparison) for comparison in re.split(r"\s+and\s+", alternative)):
+            return True
+    return False
+
+
+def isComparisonTrue(comparison: str) -> bool:
+    match = re.fullmatch(r"\s*\(?\s*(\S*)\s*(==|!=)\s*(\S*)\s*\)?\s*", comparison)
+    if match == None:
+        return True # Unknown syntax: keep the dependency
+    left, operator, right = match.groups()
+    return (left == right) == (operator == "==")
+
+
+class workspace_scan:
+    """
+    Find the package.xml files of a workspace and read their dependencies. The result of each file is cached with
+    its modification time and size, only the new or modified files are parsed again, in parallel.
+    """
+
+    def __init__(self, workspace: str):
+        self.workspace = pathlib.Path(workspace).resolve()
+        self.path = getCacheDir() / "workspaces" / (hashlib.sha256(str(self.workspace).encode()).hexdigest()[:16] + ".json")
+        try:
+            with open(self.path, "r") as cache_file:
+                self.cache = json.load(cache_file)
+        except (OSError, json.JSONDecodeError):
+            self.cache = {}
+
+    def findPackageXML(self) -> list[pathlib.Path]:
+        res = []
+        for root, dirs, files in os.walk(self.workspace):
+            if "COLCON_IGNORE" in files or "CATKIN_IGNORE" in files or "AMENT_IGNORE" in files:
+                dirs[:] = []
+                continue
+            dirs[:] = [folder for folder in dirs if folder not in IGNORED_FOLDERS]
+            if "package.xml" in files:
+                res.append(pathlib.Path(root) / "package.xml")
+        return res
+
+    def scan(self) -> dict:
+        """
+        :return: {package name: [[key, condition], ...]}
+        """
+        entries = {}
+        to_parse = []
+        for path in self.findPackageXML():
+            stat = path.stat()
+            entry = self.cache.get(str(path))
+            if entry != None and entry["mtime"] == stat.st_mtime_ns and entry["size"] == stat.st_size:
+                entries[str(path)] = entry
+            else:
+                to_parse.append((path, stat))
+
+        with concurrent.futures.ThreadPoolExecutor() as pool:
+            futures = [pool.submit(parsePackageXML, path) for path, stat in to_parse]
+            for (path, stat), future in zip(to_parse, futures):
+                try:
+                    entries[str(path)] = dict(future.result(), mtime=stat.st_mtime_ns, size=stat.st_size)
+                except ET.ParseError as e:
+                    print(f"\n\t{path} is not a valid package.xml ({e}), its dependencies are ignored.")
+
+        if to_parse or len(entries) != len(self.cache):
+            self.cache = entries
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_suffix(".tmp")
+            with open(tmp, "w") as cache_file:
+                json.dump(entries, cache_file)
+            os.replace(tmp, self.path)
+        return {entry["name"]: entry["depends"] for entry in entries.values()}
+
+
+def getWorkspaceDependencies(workspaces: list[str], ros_distro: str, ros_type: str, offline: bool = False) -> tuple[dict, list[str]]:
+    """
+    Resolve the dependencies of all the packages of the workspaces to apt and pip packages. The dependencies on
+    packages of the workspaces are skipped.
+
+    :return: {"apt": [...], "pip": [...]} and the keys which couldn't be resolved
+    """
+    packages = {}
+    for workspace in workspaces:
+        packages.update(workspace_scan(workspace).scan())
+
+    keys = set()
+    for depends in packages.values():
+        for key, condition in depends:
+            if key not in packages and isConditionTrue(condition, ros_type):
+                keys.add(key)
+    if not keys:
+        return {"apt": [], "pip": []}, []
+    return rosdep_cache(ros_distro, offline=offline).resolve(sorted(keys))
@@ -0,0 +1,203 @@
+import re
+import gzip
+import json
+import bisect
+import difflib
+import platform
+from rosdistro_cache import getCacheDir
+
+
+# Ubuntu release of the osrf/ros images
+UBUNTU_RELEASES = {
+    "melodic": "bionic",
+    "noetic": "focal",
+    "foxy": "focal",
+    "galactic": "focal",
+    "humble": "jammy",
+    "iron": "jammy",
+    "jazzy": "noble",
+    "kilted": "noble",
+    "rolling": "noble"
+}
+UBUNTU_MIRRORS = {
+    "amd64": "http://archive.ubuntu.com/ubuntu",
+    "arm64": "http://ports.ubuntu.com/ubuntu-ports"
+}
+UBUNTU_COMPONENTS = ["main", "restricted", "universe", "multiverse"]
+UBUNTU_POCKETS = ["", "-updates"]
+PYPI_URL = "https://pypi.org/simple/"
+
+
+class package_index:
+    """
+    Names of all the packages of a repository (apt for a distro, PyPI), kept sorted and gzip compressed in the
+    cache. A lookup is a binary search, so checking the dependencies of an environment doesn't need the network
+    once the index is downloaded. The index is only downloaded again with refresh.
+    """
+
+    def __init__(self, name: str, urls: list[str], parser, normalize):
+        """
+        :param name: name of the index file in the cache
+        :param urls: files of the repository listing its packages
+        :param parser: function which return the package names of one downloaded file
+        :param normalize: function which give the name under which a package is indexed
+        """
+        self.name = name
+        self.urls = urls
+        self.parser = parser
+        self.normalize = normalize
+        self.path = getCacheDir() / "packages" / f"{name}.txt.gz"
+        self.names = None
+
+    def apt(ros_distro: str, ros_type: str) -> "package_index":
+        """
+        :return: the index of the Ubuntu and ROS apt packages available in the osrf/ros image of the distro
+        :raises NameError: if the Ubuntu release of the distro is unknown
+        """
+        if ros_distro not in UBUNTU_RELEASES:
+            raise NameError(f"The Ubuntu release of {ros_distro} is unknown, its apt packages can't be checked.")
+        release = UBUNTU_RELEASES[ros_distro]
+        arch = getArch()
+        urls = [f"{UBUNTU_MIRRORS[arch]}/dists/{release}{pocket}/{component}/binary-{arch}/Packages.gz"
+                for pocket in UBUNTU_POCKETS for component in UBUNTU_COMPONENTS]
+        urls.append(f"http://packages.ros.org/{'ros2' if ros_type == 'ros2' else 'ros'}/ubuntu/dists/{release}/main/binary-{arch}/Packages.gz")
+        return package_index(f"apt-{ros_distro}-{release}-{arch}", urls, parseAptPackages, normalizeApt)
+
+    def pypi() -> "package_index":
+        return package_index("pypi", [PYPI_URL], parsePypiProjects, normalizePip)
+
+    def exist(self) -> bool:
+        return self.path.is_file()
+
+    def load(self) -> list[str]:
+        if self.names == None:
+            if not self.exist():
+                raise FileNotFoundError(f"No {self.name} package index in {self.path}. Run ./ros-env.py deps refresh first.")
+            with gzip.open(self.path, "rt") as index_file:
+                self.names = index_file.read().split("\n")
+        return self.names
+
+    def save(self, names: set[str]) -> None:
+        self.names = sorted(names)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".tmp")
+        with gzip.open(tmp, "wt") as index_file:
+            index_file.write("\n".join(self.names))
+        tmp.replace(self.path)
+
+    def refresh(self) -> int:
+        """
+        Download the package lists of the repository and replace the cached index.
+
+        :return: the number of indexed packages
+        """
+        import requests
+
+        names = set()
+        for url in self.urls:
+            response = requests.get(url, headers={"Accept": "application/vnd.pypi.simple.v1+json"}, timeout=60)
+            if response.status_code == 404: # Not every pocket or component exist for every release
+                continue
+            response.raise_for_status()
+            names.update(self.normalize(name) for name in self.parser(response.content))
+        if len(names) == 0:
+            raise ConnectionError(f"No package found for the {self.name} index.")
+        self.save(names)
+        return len(names)
+
+    def contains(self, name: str) -> bool:
+        names = self.load()
+        name = self.normalize(name)
+        i = bisect.bisect_left(names, name)
+        return i < len(names) and names[i] == name
+
+    def suggest(self, name: str, n: int = 3) -> list[str]:
+        """
+        :return: the closest package names, searched among the ones with the same first letters
+        """
+        names = self.load()
+        name = self.normalize(name)
+        for prefix in (name[:2], name[:1]):
+            start = bisect.bisect_left(names, prefix)
+            end = bisect.bisect_left(names, prefix + "\uffff")
+            matches = difflib.get_close_matches(name, names[start:end], n=n, cutoff=0.75)
+            if matches:
+                return matches
+        return []
+
+    def check(self, packages: list[str], getName) -> list[dict]:
+        """
+        :param getName: function which extract the package name of a dependency line (version, extras, ...), None if it can't be checked
+        :return: the unknown packages with their suggestions
+        """
+        res = []
+        for package in packages:
+            name = getName(package)
+            if name != None and not self.contains(name):
+                res.append({"package": package, "suggestions": self.suggest(name)})
+        return res
+
+
+def checkDependencies(dependencies: dict, ros_distro: str, ros_type: str) -> list[str]:
+    """
+    Check the apt and pip dependencies of an environment against the cached indexes.
+
+    :param dependencies: {"apt": [...], "pip": [...]} as parsed by docker_generator.parseDependenciesString
+    :return: one error message per unknown package
+    :raises FileNotFoundError: if an index is not cached
+    """
+    errors = []
+    indexes = [("apt", lambda: package_index.apt(ros_distro, ros_type), getAptName),
+               ("pip", package_index.pypi, getPipName)]
+    for kind, getIndex, getName in indexes:
+        if not dependencies.get(kind):
+            continue
+        index = getIndex()
+        for unknown in index.check(dependencies[kind], getName):
+            message = f"{kind}: {unknown['package']} is not in the {index.name} index."
+            if unknown["suggestions"]:
+                message += f" Did you mean {', '.join(unknown['suggestions'])}?"
+            errors.append(message)
+    return errors
+
+
+def getArch() -> str:
+    machine = platform.machine().lower()
+    return "arm64" if machine in ("aarch64", "arm64") else "amd64"
+
+
+def parseAptPackages(content: bytes) -> list[str]:
+    # Packages.gz: one paragraph per package, virtual packages are in the Provides field
+    if content[:2] == b"\x1f\x8b":
+        content = gzip.decompress(content)
+    text = content.decode(errors="replace")
+    res = re.findall(r"^Package: (\S+)", text, re.MULTILINE)
+    for provides in re.findall(r"^Provides: (.+)", text, re.MULTILINE):
+        res += [re.sub(r"\s*\(.*\)", "", package).strip() for package in provides.split(",")]
+    return res
+
+
+def parsePypiProjects(content: bytes) -> list[str]:
+    return [project["name"] for project in json.loads(content)["projects"]]
+
+
+def normalizeApt(name: str) -> str:
+    return name.lower()
+
+
+def normalizePip(name: str) -> str:
+    # PEP 503
+    return re.sub(r"[-_.]+", "-", name).lower()
+
+
+def getAptName(package: str) -> str:
+    # nano=6.2-1, nano:amd64, nano/jammy-updates
+    return re.split(r"[=:/]", package.strip(), maxsplit=1)[0]
+
+
+def getPipName(package: str) -> str:
+    # numpy==1.26, opencv-python[contrib]>=4, pkg @ https://...
+    if "://" in package or package.strip().startswith((".", "/", "-")): # URL, local path or pip option
+        return None
+    match = re.match(r"\s*([A-Za-z0-9][A-Za-z0-9._-]*)", package)
+    return match.group(1) if match else package.strip()
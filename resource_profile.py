@@ -0,0 +1,63 @@
+import re
+
+
+class resource_profile:
+    """
+    CPU, memory and real-time limits of the container, for the control loops (ros2_control) which need a
+    predictable scheduling. Every field is optional, None keep the docker default.
+    """
+
+    def __init__(self, cpuset: str = None, rtprio: int = None, memlock: int = None, cpu_shares: int = None, memory: str = None):
+        """
+        :param cpuset: CPUs the container can use. ex: "2-3" or "2,3". Isolate them on the host (isolcpus) for the best result.
+        :param rtprio: maximum real-time priority allowed in the container (ulimit rtprio, 1 to 99).
+        :param memlock: maximum locked memory in bytes (ulimit memlock), -1 for unlimited. Needed by mlockall.
+        :param cpu_shares: relative CPU weight of the container. Docker default is 1024.
+        :param memory: memory limit. ex: 4g
+        """
+        if cpuset != None and re.fullmatch(r"\d+(-\d+)?(,\d+(-\d+)?)*", str(cpuset)) == None:
+            raise ValueError(f"{cpuset} is not a valid cpuset. ex: 2-3 or 2,3")
+        if rtprio != None and not 0 <= int(rtprio) <= 99:
+            raise ValueError(f"rtprio must be between 0 and 99, not {rtprio}")
+        self.cpuset = str(cpuset) if cpuset != None else None
+        self.rtprio = int(rtprio) if rtprio != None else None
+        self.memlock = int(memlock) if memlock != None else None
+        self.cpu_shares = int(cpu_shares) if cpu_shares != None else None
+        self.memory = memory
+
+    def fromDict(data: dict) -> "resource_profile":
+        data = data if data != None else {}
+        return resource_profile(data.get("cpuset"), data.get("rtprio"), data.get("memlock"), data.get("cpu shares"), data.get("memory"))
+
+    def toDict(self) -> dict:
+        return {
+            "cpuset": self.cpuset,
+            "rtprio": self.rtprio,
+            "memlock": self.memlock,
+            "cpu shares": self.cpu_shares,
+            "memory": self.memory
+        }
+
+    def isEnabled(self) -> bool:
+        return any(value != None for value in self.toDict().values())
+
+    def getCompose(self) -> dict:
+        """
+        :return: the keys to add to the compose service
+        """
+        service = {}
+        if self.cpuset != None:
+            service["cpuset"] = self.cpuset
+        if self.cpu_shares != None:
+            service["cpu_shares"] = self.cpu_shares
+        if self.memory != None:
+            service["mem_limit"] = self.memory
+        ulimits = {}
+        if self.rtprio != None:
+            ulimits["rtprio"] = {"soft": self.rtprio, "hard": self.rtprio}
+            service["cap_add"] = ["SYS_NICE"] # Needed to use SCHED_FIFO/SCHED_RR
+        if self.memlock != None:
+            ulimits["memlock"] = {"soft": self.memlock, "hard": self.memlock}
+        if ulimits:
+            service["ulimits"] = ulimits
+        return service
@@ -0,0 +1,121 @@
+import csv
+import time
+import collections
+from docker_api import docker_api
+from cgroup_stats import getCgroupPath, cgroup_reader
+
+
+FIELDS = ["time", "cpu percent", "memory bytes", "read bytes/s", "write bytes/s"]
+
+
+class resource_sampler:
+    """
+    Sample the CPU, memory and disk usage of a container at a fixed rate, from its cgroup v2 files read on the
+    host or else from the Docker stats API. The last samples are kept in a ring buffer of fixed size, so it can
+    run during a whole simulation with a constant memory.
+    """
+
+    def __init__(self, container_id: str, rate: float = 2.0, size: int = 3600):
+        """
+        :param container_id: full ID of the container
+        :param rate: samples per second
+        :param size: number of samples kept, the oldest ones are dropped
+        """
+        self.container_id = container_id
+        self.period = 1.0 / rate
+        self.samples = collections.deque(maxlen=size)
+        self.previous = None # (monotonic time, counters) of the last read
+        self.stopped = False
+        self.reader = None
+        path = getCgroupPath(container_id)
+        if path != None:
+            try:
+                self.reader = cgroup_reader(path)
+            except OSError:
+                pass
+        self.source = "cgroup" if self.reader != None else "docker stats API"
+
+    def readCounters(self) -> tuple[float, int, int, int]:
+        """
+        :return: CPU seconds, memory bytes, bytes read and bytes written. None if the container is stopped
+        """
+        try:
+            if self.reader != None:
+                return self.reader.sample()
+            stats = docker_api.client().stats(self.container_id)
+        except OSError:
+            return None
+        if stats == None or not stats.get("cpu_stats"):
+            return None
+        io = (stats.get("blkio_stats") or {}).get("io_service_bytes_recursive") or []
+        return (stats["cpu_stats"]["cpu_usage"]["total_usage"] / 1e9,
+                (stats.get("memory_stats") or {}).get("usage", 0),
+                sum(entry["value"] for entry in io if entry["op"].lower() == "read"),
+                sum(entry["value"] for entry in io if entry["op"].lower() == "write"))
+
+    def sample(self) -> tuple:
+        """
+        Read the counters and add the usage since the previous read to the ring buffer.
+
+        :return: the new sample (see FIELDS), None for the first read which has nothing to compare with
+        """
+        tick = time.monotonic()
+        counters = self.readCounters()
+        if counters == None:
+            self.stopped = True
+            return None
+        previous, self.previous = self.previous, (tick, counters)
+        if previous == None or tick <= previous[0]:
+            return None
+        elapsed = tick - previous[0]
+        cpu, memory, read, write = counters
+        sample = (time.time(),
+                  (cpu - previous[1][0]) / elapsed * 100,
+                  memory,
+                  (read - previous[1][2]) / elapsed,
+                  (write - previous[1][3]) / elapsed)
+        self.samples.append(sample)
+        return sample
+
+    def run(self, duration: float = None, callback=None) -> None:
+        """
+        Sample until duration seconds, Ctrl+C or the container stop. Each tick is planned from the previous one,
+        the rate doesn't drift with the time spent reading.
+
+        :param callback: function called with each new sample
+        """
+        start = next_tick = time.monotonic()
+        try:
+            while not self.stopped and (duration == None or time.monotonic() - start < duration):
+                sample = self.sample()
+                if sample != None and callback != None:
+                    callback(sample)
+                next_tick += self.period
+                time.sleep(max(0.0, next_tick - time.monotonic()))
+        except KeyboardInterrupt:
+            pass
+
+    def summary(self) -> dict:
+        """
+        :return: {field: (mean, max)} over the samples of the buffer
+        """
+        if len(self.samples) == 0:
+            return {}
+        return {field: (sum(values) / len(values), max(values))
+                for field, values in zip(FIELDS[1:], list(zip(*self.samples))[1:])}
+
+    def exportCSV(self, path: str) -> None:
+        with open(path, "w", newline="") as csv_file:
+            writer = csv.writer(csv_file)
+            writer.writerow(FIELDS)
+            for sample in self.samples:
+                writer.writerow([f"{sample[0]:.3f}", f"{sample[1]:.2f}", sample[2], f"{sample[3]:.0f}", f"{sample[4]:.0f}"])
+
+    def close(self) -> None:
+        if self.reader != None:
+            self.reader.close()
+
+
+def formatSample(sample: tuple) -> str:
+    return (f"cpu {sample[1]:6.1f} %   memory {sample[2] / 2**20:7.0f} MiB   "
+            f"read {sample[3] / 1e6:7.2f} MB/s   write {sample[4] / 1e6:7.2f} MB/s")
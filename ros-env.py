@@ -1,17 +1,32 @@
 #!/usr/bin/env python3
 
-import subprocess
-import argparse
 import os
 import sys
-import yaml
+
+# Thin client: when the daemon runs, it runs the command, nothing below is imported
+if __name__ == "__main__" and os.environ.get("ROS_ENV_DAEMON") != "0" and "daemon" not in sys.argv[1:]:
+    from daemon_client import forward
+    code = forward(sys.argv[1:])
+    if code != None:
+        sys.exit(code)
+
+import argparse
 import pathlib
-from docker_generator import docker_generator
-from docker_tools import docker_tools
+import time
+# Only the modules needed to build the parser, each command imports its own ones in its branch
 from RosEnvParam import RosEnvParam
+from dds_profile import TRANSPORTS, DDS_VENDORS
+from image_profile import IMAGE_PROFILES
+
+# Everything the commands import, loaded once by the daemon (see env_daemon)
+COMMAND_MODULES = ["shutil", "statistics", "docker_generator", "docker_tools", "base_image", "colcon_cache",
+                   "dds_profile", "resource_profile", "build_stats", "fleet", "env_status", "resource_sampler",
+                   "package_index", "rosdistro_cache", "workspace_sync", "env_daemon", "daemon_client", "image_bundle",
+                   "env_snapshot", "env_health"]
 
 parser = argparse.ArgumentParser(description="This script generate an isolate environment for your ros application. It use container with Docker framework.")
 parser.add_argument("--param-path", help="path to a RosEnvParam.yaml file. By default: ./.RosEnvParam.yaml", default=".ros_env_param.yaml", required=False)
+parser.add_argument("--offline", help="Never fetch the rosdistro index from the network, use the cached one (~/.cache/ros-env).", action="store_true")
 
 command_subparser = parser.add_subparsers(dest="command", help="Available commands", required=True)
 create_parser = command_subparser.add_parser("create", help="Create necessary file for ros environment in docker")
@@ -19,11 +34,24 @@ create_parser = command_subparser.add_parser("create", help="Create necessary fi
 create_parser.add_argument("-n", "--name", help="This will be the name of the container. By default is ros-<distro>", required=False)
 create_parser.add_argument("-i", "--iname", help="This will be the name of the image. By default take --name value", required=False)
 create_parser.add_argument("--ros-distro",help="Version of ROS. Can be ROS2: humble, galactic, jazzy,... or even ROS1: noetic, melodic, ...\n If not specify the default distros humble", required=False)
+create_parser.add_argument("-p", "--profile", choices=IMAGE_PROFILES, default="desktop", help="Base image and default dependencies. desktop: osrf/ros desktop with the GUI tools. sim: desktop-full with Gazebo. base: ros-base without GUI. headless: ros-base and the build tools only, for CI. By default desktop")
 create_parser.add_argument("-g", "--gazebo", help="Add all dependencies for using gzebo in the corresponding version", action="store_true", required=False)
 create_parser.add_argument("-v", "--volumes", nargs='+', help="list of folders to copy with the ros environment. Most of the time are existing source folders. If not defined an empty folder named 'ros_ws' will be create.", required=False)
 create_parser.add_argument("-s", "--shared", help="Share the folder created or specify by --path to the container", action="store_true")
 create_parser.add_argument("-e", "--env", help="You can specify a list of environment variables from a .txt file. They will be added to the default environment variable.", required=False)
 create_parser.add_argument("-d", "--dependencies", help="You probably need specific dependencies for your project. Add them with a list in a .txt file.", required=False)
+create_parser.add_argument("-b", "--base-image", help="Start from a base image shared by every environment with the same distro and Gazebo option. Only the project dependencies and files are added to it.", action="store_true")
+create_parser.add_argument("-c", "--colcon-cache", help="Keep the colcon build/install/log folders in named volumes and use a ccache volume shared by all environments for C/C++ builds.", action="store_true")
+create_parser.add_argument("-t", "--transport", choices=TRANSPORTS, default="default", help="DDS transport profile (ROS 2). shm: bigger /dev/shm and shared memory transport between the container processes. host: same with the host network and IPC namespace.")
+create_parser.add_argument("--dds", choices=DDS_VENDORS, default="fastdds", help="DDS implementation configured by --transport. By default fastdds")
+create_parser.add_argument("--shm-size", default="2gb", help="Size of /dev/shm with --transport shm or host. By default 2gb")
+create_parser.add_argument("--cpuset", help="CPUs of the container, ex: 2-3. Isolate them on the host for control loops.", required=False)
+create_parser.add_argument("--rtprio", type=int, help="Maximum real-time priority in the container (ulimit rtprio, 1-99). Add the SYS_NICE capability.", required=False)
+create_parser.add_argument("--memlock", type=int, help="Maximum locked memory in bytes (ulimit memlock), -1 for unlimited.", required=False)
+create_parser.add_argument("--cpu-shares", type=int, help="Relative CPU weight of the container. Docker default is 1024.", required=False)
+create_parser.add_argument("--memory", help="Memory limit of the container. ex: 4g", required=False)
+create_parser.add_argument("--no-package-deps", help="Don't install the dependencies of the package.xml files found in the copied folders.", action="store_true")
+create_parser.add_argument("-l", "--layered", help="Install dependencies in separate sorted layers with BuildKit apt/pip cache mounts. Adding a dependency only rebuild the last layers.", action="store_true")
 
 
 create_from_parser = command_subparser.add_parser("create_from", help="load a ros_env_param.yaml and create files from parameter saved in it.")
@@ -32,11 +60,178 @@ create_from_parser.add_argument("-f", "--file", help="path to the file you want
 
 delete_parser = command_subparser.add_parser("delete", help="Delete created file for ros environment in docker. Dockerfile, docker-compose.yaml, .env. And rm all docker contianers and images.")
 build_parser = command_subparser.add_parser("build", help="Build the image. WARN: Need to be execute after the create commands")
+build_parser.add_argument("-f", "--force", help="Build even if the image is up to date with the generated files.", action="store_true")
+build_parser.add_argument("--skip-check", help="Don't check the additionnal apt and pip dependencies against the cached package indexes.", action="store_true")
 start_parser = command_subparser.add_parser("start", help="Start the containers. From the corresponding image")
+start_parser.add_argument("-d", "--detach", help="Only start the container, without opening a terminal in it.", action="store_true")
+start_parser.add_argument("-t", "--timeout", type=float, default=120, help="Seconds to wait for the healthcheck of the container (ROS setup sourced, ros2 daemon answering). By default 120")
+start_parser.add_argument("--no-wait", help="Don't wait for the healthcheck.", action="store_true")
+start_parser.add_argument("-s", "--snapshot", nargs="?", const="latest", help="Create the container from a snapshot, the newest one without TAG, instead of the built image. Only when the container doesn't exist.", required=False)
 stop_parser = command_subparser.add_parser("stop", help="Stop the containers.")
 kill_parser = command_subparser.add_parser("kill", help="Kill the containers wihtout removing the image.")
-
-
+snapshot_parser = command_subparser.add_parser("snapshot", help="Commit the container with everything done in it (rosdep install, colcon build, ...) to an image tracked in the param file.")
+snapshot_parser.add_argument("action", nargs="?", choices=["create", "list", "prune", "rm"], default="create", help="create (default): commit the container. list: show the snapshots. prune: remove all but the --keep newest ones. rm: remove --tag.")
+snapshot_parser.add_argument("-m", "--message", help="Description saved with the snapshot.", required=False)
+snapshot_parser.add_argument("-t", "--tag", action="append", help="Snapshot to remove with rm. Can be repeated.", required=False)
+snapshot_parser.add_argument("--keep", type=int, default=3, help="Number of snapshots kept by prune. By default 3")
+snapshot_parser.add_argument("--stale", help="prune also remove the snapshots taken before the last build of the image.", action="store_true")
+restore_parser = command_subparser.add_parser("restore", help="Replace the container by a new one created from a snapshot.")
+restore_parser.add_argument("tag", nargs="?", help="Snapshot to restore, full tag or snapshot-<date>. By default the newest one.")
+
+status_parser = command_subparser.add_parser("status", help="Show the state, uptime, image age and CPU/memory usage of every environment created on this computer.")
+status_parser.add_argument("-w", "--watch", help="Refresh the table until Ctrl+C.", action="store_true")
+status_parser.add_argument("--interval", type=float, default=2, help="Seconds between two refreshes with --watch. By default 2")
+
+top_parser = command_subparser.add_parser("top", help="Sample the CPU, memory and disk usage of the running container until Ctrl+C.")
+top_parser.add_argument("--rate", type=float, default=2, help="Samples per second. By default 2")
+top_parser.add_argument("--buffer", type=int, default=3600, help="Number of last samples kept in memory for the summary and the CSV. By default 3600")
+top_parser.add_argument("--duration", type=float, help="Stop after this number of seconds.", required=False)
+top_parser.add_argument("--csv", help="Write the kept samples in this CSV file at the end.", required=False)
+
+sync_parser = command_subparser.add_parser("sync", help="Copy the changes of the workspaces into the running container, without building the image again.")
+sync_parser.add_argument("--verify", help="List the files of the container again instead of trusting the manifest of the last sync.", action="store_true")
+sync_parser.add_argument("--dry-run", help="Only show the files which would be copied or deleted.", action="store_true")
+
+export_parser = command_subparser.add_parser("export", help="Write the image and the files of the environment in one compressed bundle, to deploy it on a computer without network.")
+export_parser.add_argument("-o", "--output", help="Bundle file. By default ./<image name>.bundle.tar", required=False)
+export_parser.add_argument("--since", action="append", help="Bundle already imported on the target: the layers it carry are not written again. Can be repeated.", required=False)
+export_parser.add_argument("--level", type=int, default=3, help="zstd compression level, 1 to 19. By default 3")
+
+import_parser = command_subparser.add_parser("import", help="Load the image of a bundle and write its files, then use create_from or start.")
+import_parser.add_argument("bundle", help="Bundle written by export.")
+import_parser.add_argument("-o", "--output", help="Folder of the files of the environment. By default the current folder", default=".")
+
+daemon_parser = command_subparser.add_parser("daemon", help="Keep a background process with everything loaded which run the commands, they start much faster. Set ROS_ENV_DAEMON=0 to not use it.")
+daemon_parser.add_argument("action", choices=["start", "stop", "status", "run"], help="run: run the daemon in the foreground.")
+
+fleet_parser = command_subparser.add_parser("fleet", help="Run a command on every environment of a fleet manifest, in parallel.")
+fleet_parser.add_argument("action", choices=["build", "start", "stop", "kill", "status"], help="start only start the containers (no terminal).")
+fleet_parser.add_argument("-m", "--manifest", help="Fleet manifest listing the param files of the environments. By default ./ros_env_fleet.yaml", default="ros_env_fleet.yaml")
+fleet_parser.add_argument("-j", "--parallelism", type=int, help="Maximum number of environments handled at the same time. By default the manifest value or 4", required=False)
+
+matrix_parser = command_subparser.add_parser("matrix", help="Generate and build the environment of --param-path for several ROS distros, each in its own folder.")
+matrix_parser.add_argument("distros", nargs="+", help="ROS distros to build. ex: humble jazzy noetic")
+matrix_parser.add_argument("-o", "--output", help="Folder of the generated distro folders. By default ./matrix", default="matrix")
+matrix_parser.add_argument("-j", "--parallelism", type=int, default=2, help="Maximum number of builds at the same time. By default 2")
+matrix_parser.add_argument("--no-build", help="Only generate the files", action="store_true")
+
+deps_parser = command_subparser.add_parser("deps", help="Check the additionnal apt and pip dependencies against package indexes cached per distro, without network.")
+deps_parser.add_argument("action", nargs="?", choices=["check", "refresh"], default="check", help="check: look for unknown packages (default). refresh: download the apt index of the distro and the PyPI index.")
+deps_parser.add_argument("--distro", help="With refresh, ROS distro of the apt index. By default the one of --param-path", required=False)
+
+stats_parser = command_subparser.add_parser("stats", help="Show the recorded builds of the image: slowest steps, cache hits and regressions, and the time to ready of the starts.")
+stats_parser.add_argument("--top", type=int, default=10, help="Number of slowest steps to show. By default 10")
+stats_parser.add_argument("--builds", type=int, default=5, help="Number of last builds to show. By default 5")
+
+jitter_parser = command_subparser.add_parser("jitter", help="Measure the wake up jitter of a periodic loop in the running container, to check its resource profile.")
+jitter_parser.add_argument("--period", type=int, default=1000, help="Period of the loop in microseconds. By default 1000")
+jitter_parser.add_argument("--duration", type=float, default=10, help="Duration of the measure in seconds. By default 10")
+jitter_parser.add_argument("--priority", type=int, default=80, help="SCHED_FIFO priority of the loop, 0 for the default scheduler. By default 80")
+
+cache_parser = command_subparser.add_parser("cache", help="Show or prune the ccache shared by the environments created with --colcon-cache.")
+cache_parser.add_argument("action", nargs="?", choices=["stats", "prune", "clear"], default="stats", help="stats: hit rate and size (default). prune: evict old entries down to the maximum size. clear: empty the cache.")
+cache_parser.add_argument("--max-size", help="With prune, new maximum size of the cache. ex: 5G", required=False)
+
+base_parser = command_subparser.add_parser("base", help="Manage the base images shared between environments (create --base-image).")
+base_parser.add_argument("action", choices=["list", "build", "gc"], help="list: show the base images and how many images use them. build: (re)build the base of the environment or --tag. gc: remove the base images used by no image.")
+base_parser.add_argument("-t", "--tag", help="Tag of the base image to build. By default the base of the environment in --param-path", required=False)
+
+
+
+
+def generatorFromParam(rosEnv: dict, offline: bool, **overrides) -> "docker_generator":
+    """
+    Generate the files of an environment from its loaded param file.
+
+    :param overrides: docker_generator arguments which replace the saved ones
+    """
+    from docker_generator import docker_generator
+    from resource_profile import resource_profile
+    option = rosEnv['option']
+    kwargs = dict(name = rosEnv['container_name'],
+                  iname = rosEnv['image_name'],
+                  isGazebo = option["gazebo"],
+                  volumes_path_list = option['volume path list'],
+                  isShared = option['volume shared'],
+                  env_content = option['additionnal']['environment']['content'],
+                  dep_content = option['additionnal']['dependencies']['content'],
+                  ros_distro = rosEnv["ros"]['distro'],
+                  ros_type = rosEnv["ros"].get("type"), # Checked when the param file was created
+                  offline = offline,
+                  isLayered = option.get("layered", False),
+                  isBaseImage = option.get("base image", {}).get("status", False),
+                  isCache = option.get("colcon cache", False),
+                  transport = option.get("transport", {}).get("mode", "default"),
+                  dds = option.get("transport", {}).get("dds", "fastdds"),
+                  shm_size = option.get("transport", {}).get("shm size", "2gb"),
+                  resources = resource_profile.fromDict(option.get("resources")),
+                  isPackageDeps = option.get("package deps", False),
+                  profile = option.get("image profile", "desktop"))
+    kwargs.update(overrides)
+    return docker_generator(**kwargs)
+
+def startSnapshot(snapshot: dict) -> bool:
+    """
+    Create and start the container of docker-compose.yaml from a snapshot.
+    """
+    from docker_tools import docker_tools
+    if snapshot["stale"]:
+        print(f"The image was built again since {snapshot['tag']}, the container won't have the changes of the build.")
+    print(f"Using snapshot {snapshot['tag']} ({snapshot['created']})")
+    start = time.monotonic()
+    if not docker_tools.up(snapshot["tag"]):
+        return False
+    print(f"Container created from the snapshot in {time.monotonic() - start:.1f}s")
+    return True
+
+def waitReady(name: str, mode: str, begin: float, timeout: float = 120) -> bool:
+    """
+    Wait for the healthcheck of the container and report the time to ready since begin (time.monotonic).
+
+    :param mode: create, start or snapshot, saved with the time to ready. None if the container was already
+                 running, nothing is saved.
+    """
+    from env_health import env_health
+    print("Waiting for the environment to be ready ... ", end="", flush=True)
+    status, health = env_health.wait(name, timeout)
+    duration = time.monotonic() - begin
+    if status == "none":
+        print("Skipped (no healthcheck, run create_from to add it)")
+        return True
+    if mode != None:
+        env_health.record(name, mode, status, duration)
+    if status == "healthy":
+        print(f"Done, ready in {duration:.1f}s")
+        return True
+    reasons = {"unhealthy": "unhealthy", "exited": "the container stopped", "timeout": f"not ready after {timeout:g} s"}
+    print(f"Failed ({reasons[status]})")
+    if health != None and health.get("Log"):
+        print(f"\tLast check: {health['Log'][-1]['Output'].strip()}")
+    return False
+
+def checkEnvDependencies(rosEnv: dict) -> bool:
+    """
+    Check the additionnal dependencies of an environment against the cached package indexes.
+
+    :return: False if a package is unknown. True if they are all known or if they can't be checked.
+    """
+    from package_index import checkDependencies
+    dependencies = rosEnv['option']['additionnal']['dependencies']['content']
+    if not dependencies:
+        return True
+    print("Checking the additionnal dependencies ... ", end="")
+    try:
+        errors = checkDependencies(dependencies, rosEnv['ros']['distro'], rosEnv['ros']['type'])
+    except (FileNotFoundError, NameError) as e:
+        print(f"Skipped\n\t{e}")
+        return True
+    if not errors:
+        print("Done")
+        return True
+    print("Failed")
+    for error in errors:
+        print(f"\t{error}")
+    return False
 
 
 if __name__=="__main__":
@@ -50,14 +245,24 @@ if __name__=="__main__":
     args = parser.parse_args()
 
     if args.command == "create":
+        from docker_generator import docker_generator
+        from resource_profile import resource_profile
         print(f"You have chosen {"Ros "+args.ros_distro if args.ros_distro != None else "the default ROS distro"} with the following option: ")
         print(f"\tContainer name: {args.name}")
         print(f"\tImage name: {args.iname}")
+        print(f'\tImage profile : {args.profile}')
         print(f'\tGazebo : {args.gazebo}')
         if args.shared: print(f'\tshared folders: {args.volumes}')
         else: print(f'\tcopy folders : {args.volumes}')
         print(f'\tenvironment variables : {args.env}')
         print(f'\tDependencies : {args.dependencies}')
+        print(f'\tLayered : {args.layered}')
+        print(f'\tBase image : {args.base_image}')
+        print(f'\tColcon cache : {args.colcon_cache}')
+        print(f'\tPackage.xml dependencies : {not args.no_package_deps}')
+        resources = resource_profile(args.cpuset, args.rtprio, args.memlock, args.cpu_shares, args.memory)
+        if resources.isEnabled(): print(f'\tResources : {resources.getCompose()}')
+        print(f'\tTransport : {args.transport}' + (f' ({args.dds}, /dev/shm {args.shm_size})' if args.transport != "default" else ''))
 
         gen=docker_generator(args.name,
                             args.iname,
@@ -66,7 +271,17 @@ if __name__=="__main__":
                             args.shared,
                             args.env, 
                             args.dependencies,
-                            args.ros_distro)
+                            args.ros_distro,
+                            offline=args.offline,
+                            isLayered=args.layered,
+                            isBaseImage=args.base_image,
+                            isCache=args.colcon_cache,
+                            transport=args.transport,
+                            dds=args.dds,
+                            shm_size=args.shm_size,
+                            resources=resources,
+                            isPackageDeps=not args.no_package_deps,
+                            profile=args.profile)
 
         RosEnvParam.generate(args.param_path, gen)
 
@@ -74,19 +289,15 @@ if __name__=="__main__":
         print(f"Load param from {args.file}")
         rosEnv = RosEnvParam.load(RosEnvParam.exist(args.file))
 
-        gen = docker_generator(rosEnv['container_name'],
-                        rosEnv['image_name'],
-                        rosEnv['option']["gazebo"],
-                        rosEnv['option']['volume path list'],
-                        rosEnv['option']['volume shared'],
-                        env_content = rosEnv['option']['additionnal']['environment']['content'],
-                        dep_content = rosEnv['option']['additionnal']['dependencies']['content'],
-                        ros_distro = rosEnv["ros"]['distro'])
+        gen = generatorFromParam(rosEnv, args.offline)
 
         param_name = args.param_path if args.param_path != '.ros_env_param.yaml' else pathlib.Path(args.file).name
         RosEnvParam.generate(param_name, gen)
 
     elif args.command == "delete":
+        import shutil
+        from docker_tools import docker_tools
+        from dds_profile import DDS_DIR
         rosEnv = RosEnvParam.load(args.param_path)
 
         print("Deleting files...")
@@ -99,6 +310,12 @@ if __name__=="__main__":
         if os.path.exists("./.env"):
             os.remove("./.env")
             print("\t.env deleted.")
+        if os.path.exists("./.dockerignore"):
+            os.remove("./.dockerignore")
+            print("\t.dockerignore deleted.")
+        if os.path.isdir(f"./{DDS_DIR}"):
+            shutil.rmtree(f"./{DDS_DIR}")
+            print(f"\t{DDS_DIR}/ deleted.")
 
 
         print("Deleting docker container :", end="\n\t")
@@ -115,36 +332,356 @@ if __name__=="__main__":
             docker_tools.rmi(rosEnv["image_name"])
         else:
             print("Docker never build.")
+        for snapshot in rosEnv.get("snapshots") or []:
+            if docker_tools.imageExist(snapshot["tag"]):
+                docker_tools.rmi(snapshot["tag"])
         print("Delete completed !")
 
     elif args.command == "build":
-        docker_tools.build()
+        from docker_tools import docker_tools
+        from base_image import base_image
+        profile = "desktop"
+        if os.path.exists(args.param_path):
+            rosEnv = RosEnvParam.load(args.param_path)
+            profile = rosEnv['option'].get("image profile", "desktop")
+            if not args.skip_check and not checkEnvDependencies(rosEnv):
+                print("Fix the dependencies file and run create_from, or build with --skip-check.")
+                sys.exit(1)
+            base = rosEnv['option'].get("base image", {})
+            if base.get("status") and not docker_tools.imageExist(base["tag"]):
+                if not base_image.build(base["tag"]):
+                    sys.exit(1)
+        if not docker_tools.build(args.force, profile):
+            sys.exit(1)
+
+    elif args.command == "status":
+        from env_status import env_status, COLUMNS
+        from fleet import printTable
+        param_paths = RosEnvParam.known()
+        if os.path.exists(args.param_path) and pathlib.Path(args.param_path).resolve() not in param_paths:
+            param_paths.append(pathlib.Path(args.param_path).resolve())
+        if len(param_paths) == 0:
+            print("No environment created yet.")
+            sys.exit(0)
+        status = env_status([{"name": RosEnvParam.load(path)['container_name'], "path": path} for path in param_paths])
+        if args.watch:
+            status.watch(args.interval)
+        else:
+            rows = status.sample()
+            if any(row["state"] == "running" for row in rows):
+                time.sleep(0.5) # The CPU usage is measured between two samples
+                rows = status.sample()
+            printTable(rows, COLUMNS)
+
+    elif args.command == "top":
+        from docker_tools import inspectContainer
+        from resource_sampler import resource_sampler, formatSample
+        rosEnv = RosEnvParam.load(args.param_path)
+        container = inspectContainer(rosEnv['container_name'])
+        if container == None or not container["State"]["Running"]:
+            print("The isolate environment is not running. Start it first.")
+            sys.exit(1)
+
+        sampler = resource_sampler(container["Id"], args.rate, args.buffer)
+        print(f"Sampling {rosEnv['container_name']} from its {sampler.source} at {args.rate:g} Hz, Ctrl+C to stop")
+        sampler.run(args.duration, lambda sample: print("\r" + formatSample(sample), end="\x1b[K", flush=True))
+        sampler.close()
+        print()
+
+        for field, (mean, maximum) in sampler.summary().items():
+            print(f"\t{field:14} mean {mean:14.1f}   max {maximum:14.1f}")
+        if args.csv != None:
+            sampler.exportCSV(args.csv)
+            print(f"{len(sampler.samples)} samples written in {args.csv}")
+
+    elif args.command == "sync":
+        from workspace_sync import workspace_sync
+        rosEnv = RosEnvParam.load(args.param_path)
+        if rosEnv['option']["volume shared"] or not rosEnv['option']["volume path list"]:
+            print("The workspaces are shared with the container (or there is none), nothing to sync.")
+            sys.exit(0)
+        sync = workspace_sync(rosEnv['container_name'], rosEnv['option']["volume path list"])
+        try:
+            host, changed, deleted = sync.diff(args.verify)
+        except RuntimeError as e:
+            print(e)
+            sys.exit(1)
+        if len(changed) == 0 and len(deleted) == 0:
+            sync.save()
+            print("The container is up to date.")
+            sys.exit(0)
+        if args.dry_run:
+            for path in changed:
+                print(f"\tcopy   {path}")
+            for path in deleted:
+                print(f"\tdelete {path}")
+            print(f"{len(changed)} file(s) to copy, {len(deleted)} to delete.")
+            sys.exit(0)
+        size = sum(host[path][0] for path in changed)
+        print(f"Syncing {len(changed)} file(s) ({size/1e3:.1f} kB) and {len(deleted)} deletion(s) into {rosEnv['container_name']} ... ", end="", flush=True)
+        if not sync.apply(host, changed, deleted):
+            print("Failed")
+            sys.exit(1)
+        print("Done")
+
+    elif args.command == "export":
+        from image_bundle import image_bundle
+        rosEnv = RosEnvParam.load(args.param_path)
+        output = args.output if args.output != None else f"{rosEnv['container_name']}.bundle.tar"
+        print(f"Exporting {rosEnv['container_name']} to {output} ... ", end="", flush=True)
+        try:
+            manifest = image_bundle.export(rosEnv, args.param_path, output, args.since, args.level)
+        except (RuntimeError, OSError) as e:
+            print(f"Failed\n{e}")
+            sys.exit(1)
+        print("Done")
+        included = [layer for layer in manifest["layers"] if layer["included"]]
+        size = sum(layer["size"] for layer in included)
+        print(f"\t{len(included)} layer(s) written, {len(manifest['layers']) - len(included)} already on the target")
+        print(f"\t{size/1e6:.1f} MB of layers, bundle of {os.path.getsize(output)/1e6:.1f} MB")
+
+    elif args.command == "import":
+        from image_bundle import image_bundle
+        print(f"Importing {args.bundle} ... ", end="", flush=True)
+        try:
+            manifest = image_bundle.load(args.bundle, args.output)
+        except (RuntimeError, OSError) as e:
+            print(f"Failed\n{e}")
+            sys.exit(1)
+        print("Done")
+        param_path = pathlib.Path(args.output) / manifest["param"]
+        RosEnvParam.register(param_path)
+        print(f"Image {manifest['image']} ready, files written in {pathlib.Path(args.output).resolve()}. Start it with:")
+        print(f"\t./ros-env.py --param-path {param_path} start")
+
+    elif args.command == "daemon":
+        from daemon_client import request
+        from env_daemon import env_daemon, startDaemon, stopDaemon
+        status = request({"control": "status"})
+        if args.action == "status":
+            if status == None:
+                print("The ros-env daemon is not running.")
+                sys.exit(1)
+            containers = status["containers"] if status["containers"] != None else "no"
+            print(f"ros-env daemon {status['pid']} up for {status['uptime']:.0f} s: {status['commands']} command(s) run, "
+                  f"{status['environments']} param file(s) and {containers} container(s) cached")
+        elif args.action == "start":
+            if status != None:
+                print(f"The ros-env daemon is already running ({status['pid']}).")
+                sys.exit(0)
+            print("Starting the ros-env daemon ... ", end="", flush=True)
+            if not startDaemon():
+                print("Failed")
+                sys.exit(1)
+            print("Done")
+        elif args.action == "stop":
+            print("Stopping the ros-env daemon ... ", end="")
+            print("Done" if stopDaemon() else "Not running")
+        elif args.action == "run":
+            try:
+                env_daemon().serve()
+            except (RuntimeError, PermissionError) as e:
+                print(e)
+                sys.exit(1)
+
+    elif args.command == "fleet":
+        from fleet import fleet, printTable
+        environments = fleet.load(args.manifest, args.parallelism)
+        if args.action == "status":
+            printTable(environments.status(), ["name", "container", "image", "path"])
+        else:
+            results = environments.run(args.action)
+            for result in results:
+                result["result"] = "ok" if result["success"] else f"failed ({result['code']})"
+                result["time"] = f"{result['duration']:.1f}s"
+            print()
+            printTable(results, ["name", "command", "result", "time"])
+            if not all(result["success"] for result in results):
+                sys.exit(1)
+
+    elif args.command == "matrix":
+        from docker_tools import inspectImage, getComposeImage
+        from fleet import fleet, printTable
+        rosEnv = RosEnvParam.load(args.param_path)
+        param_paths = []
+        for distro in args.distros:
+            print(f"Generating {distro} environment in {args.output}/{distro} ...")
+            output_dir = pathlib.Path(args.output) / distro
+            gen = generatorFromParam(rosEnv, args.offline,
+                                     name = f"{rosEnv['container_name']}-{distro}",
+                                     iname = f"{rosEnv['image_name']}-{distro}",
+                                     ros_distro = distro,
+                                     ros_type = None,
+                                     output_dir = output_dir)
+            RosEnvParam.generate(str(output_dir / ".ros_env_param.yaml"), gen)
+            param_paths.append(output_dir / ".ros_env_param.yaml")
+
+        if not args.no_build:
+            environments = fleet(param_paths, args.parallelism)
+            results = environments.run("build")
+            for result, distro, param_path in zip(results, args.distros, param_paths):
+                # The image compose tagged, named after the container of the distro
+                image = inspectImage(getComposeImage(param_path.parent / "docker-compose.yaml") or f"{rosEnv['container_name']}-{distro}") if result["success"] else None
+                result["distro"] = distro
+                result["result"] = "ok" if result["success"] else f"failed ({result['code']})"
+                result["time"] = f"{result['duration']:.1f}s"
+                result["size"] = f"{image['Size']/1e9:.2f} GB" if image != None else "-"
+            print()
+            printTable(results, ["distro", "name", "result", "time", "size"])
+            if not all(result["success"] for result in results):
+                sys.exit(1)
+
+    elif args.command == "deps":
+        from rosdistro_cache import rosdistro_cache
+        from package_index import package_index
+        if args.action == "refresh":
+            distro = args.distro if args.distro != None else RosEnvParam.load(args.param_path)["ros"]["distro"]
+            ros_type = rosdistro_cache(offline=args.offline).getType(distro)
+            for index in (package_index.apt(distro, ros_type), package_index.pypi()):
+                print(f"Downloading the {index.name} package index ... ", end="", flush=True)
+                print(f"Done ({index.refresh()} packages)")
+        else:
+            if not checkEnvDependencies(RosEnvParam.load(args.param_path)):
+                sys.exit(1)
+
+    elif args.command == "stats":
+        import statistics
+        from build_stats import build_stats
+        from env_health import env_health
+        rosEnv = RosEnvParam.load(args.param_path)
+        starts = env_health.load(rosEnv['container_name'])
+        if starts:
+            print("Time to ready (healthy starts among the last 50):")
+            for mode in ("create", "snapshot", "start"):
+                durations = [start["duration"] for start in starts[-50:] if start["mode"] == mode and start["status"] == "healthy"]
+                if durations:
+                    print(f"\t{mode:10}median {statistics.median(durations):6.1f}s  last {durations[-1]:6.1f}s  ({len(durations)} start(s))")
+            failed = sum(1 for start in starts[-50:] if start["status"] != "healthy")
+            if failed:
+                print(f"\t{failed} start(s) not ready: unhealthy, stopped or timeout")
+
+        builds = build_stats.load(rosEnv['container_name'])
+        if len(builds) == 0:
+            print(f"No build recorded for {rosEnv['container_name']}.")
+            sys.exit(0)
+
+        print("Last builds:")
+        for build in builds[-args.builds:]:
+            print(f"\t{build['time']}  {build['duration']:8.1f}s  {'ok    ' if build['success'] else 'failed'}  {build['cache hits']}/{len(build['steps'])} cached")
+
+        last = builds[-1]
+        print(f"Slowest steps of the last build ({last['time']}):")
+        for step in sorted(last['steps'], key=lambda step: step['duration'], reverse=True)[:args.top]:
+            size = f"{step['size']/1e6:9.1f} MB" if step['size'] != None else "        ? MB"
+            print(f"\t{step['duration']:8.1f}s  {size}  {'CACHED ' if step['cached'] else '       '}{step['instruction'][:80]}")
+
+        profiles = build_stats.byProfile(builds)
+        if any(build.get("size") != None for build in profiles.values()):
+            print("Last build of each image profile:")
+            for profile, build in sorted(profiles.items()):
+                size = f"{build['size']/1e9:6.2f} GB" if build.get("size") != None else "     ? GB"
+                print(f"\t{profile:10}{size}  {build['duration']:8.1f}s  {build['cache hits']}/{len(build['steps'])} cached  {build['time']}")
+
+        regressions = build_stats.regressions(builds)
+        if regressions:
+            print("Regressions (compared with the median of the previous builds):")
+            for step in regressions:
+                print(f"\t{step['duration']:8.1f}s instead of {step['median']:.1f}s  {step['instruction'][:80]}")
+        else:
+            print("No regression.")
+
+    elif args.command == "jitter":
+        from docker_tools import docker_tools, runProcess, printLine
+        rosEnv = RosEnvParam.load(args.param_path)
+        if not docker_tools.isRunning(rosEnv['container_name']):
+            print("The isolate environment is not running. Start it first.")
+            sys.exit(1)
+        print(f"Measuring jitter in {rosEnv['container_name']} for {args.duration} s ...")
+        # The script is sent on stdin, nothing to install in the image
+        with open(pathlib.Path(__file__).resolve().parent / "rt_jitter.py", "r") as script:
+            result = runProcess(["docker", "exec", "-i", rosEnv['container_name'], "python3", "-",
+                                 "--period", str(args.period), "--duration", str(args.duration), "--priority", str(args.priority)],
+                                onStdout=printLine, onStderr=lambda line: printLine(line, sys.stderr), stdin=script)
+        sys.exit(result.returncode)
+
+    elif args.command == "cache":
+        from colcon_cache import colcon_cache
+        rosEnv = RosEnvParam.load(args.param_path)
+        if not rosEnv['option'].get("colcon cache", False):
+            print("This environment doesn't use the colcon cache. Create it with --colcon-cache.")
+            sys.exit(1)
+        cache = colcon_cache(rosEnv['container_name'], rosEnv['container_name'])
+
+        if args.action == "stats":
+            stats = cache.stats()
+            print(f"ccache hit rate: {stats['hit_rate']*100:.1f} % ({stats['hits']} hits, {stats.get('cache_miss', 0)} misses)")
+            print(f"ccache size: {stats['size']/1e9:.2f} GB / {stats['max_size']/1e9:.2f} GB")
+        elif args.action == "prune":
+            print("Pruning ccache ... ", end="")
+            print("Done" if cache.prune(args.max_size) else "Failed")
+        elif args.action == "clear":
+            print("Clearing ccache ... ", end="")
+            print("Done" if cache.clear() else "Failed")
+
+    elif args.command == "base":
+        from base_image import base_image
+        if args.action == "list":
+            bases = base_image.listBases()
+            if len(bases) == 0:
+                print("No base image.")
+            for base in bases:
+                state = f"{base['size']/1e9:.2f} GB" if base["id"] != None else "not built"
+                print(f"{base['tag']}\t{state}\tused by {base['users']} image(s)")
+
+        elif args.action == "build":
+            tag = args.tag if args.tag != None else RosEnvParam.load(args.param_path)['option'].get("base image", {}).get("tag")
+            if tag == None:
+                print("This environment doesn't use a base image. Use --tag or create it with --base-image.")
+                sys.exit(1)
+            if not base_image.build(tag):
+                sys.exit(1)
+
+        elif args.action == "gc":
+            removed = base_image.gc()
+            for tag in removed:
+                print(f"\t{tag} removed")
+            print(f"{len(removed)} base image(s) removed.")
 
     elif args.command == "start":
         # if never start: docker compose up -d else: docker start and open the bash terminal (without forgetting xhost +)
+        from docker_tools import docker_tools
+        from env_snapshot import env_snapshot
         rosEnv = RosEnvParam.load(args.param_path)
+        begin = time.monotonic()
 
+        started = True
+        mode = None # How the container is started, for the time to ready
         if docker_tools.isRunning(rosEnv['container_name']): # If is already running
             print("Already start ! ")
 
         elif docker_tools.exist(rosEnv['container_name']):
-            print("Already exist so start it")
-            docker_tools.start(rosEnv['container_name'])
+            print("Already exist so start it" + (", the snapshot is only used for a new container (see restore)" if args.snapshot != None else ""))
+            mode = "start"
+            started = docker_tools.start(rosEnv['container_name'])
+
+        elif args.snapshot != None:
+            snapshot = env_snapshot.find(rosEnv, None if args.snapshot == "latest" else args.snapshot)
+            if snapshot == None:
+                print(f"No snapshot {args.snapshot} of {rosEnv['container_name']}. See snapshot list.")
+                sys.exit(1)
+            mode = "snapshot"
+            started = startSnapshot(snapshot)
 
         else: # Does not exist so we create it 
-            print("Doesn't exist ! Creation ... ", end="")
-            process = subprocess.Popen("docker compose up -d", shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-
-            # Read the output in real-time
-            for line in process.stdout:
-                print(line.strip())
-            return_code = process.wait()
-            if return_code != 0:
-                print("Failed")
-                print("return code: ", return_code)
-                print("Error: ", process.stderr)
-            else:
-                print("Done")
+            mode = "create"
+            started = docker_tools.up()
+
+        # The terminal is only opened once the ROS environment can be used
+        if started and not args.no_wait:
+            started = waitReady(rosEnv['container_name'], mode, begin, args.timeout)
+
+        if args.detach:
+            sys.exit(0 if started else 1)
 
         #Connect the terminal stream to the docker
         print("Connection to isolate environment ...")
@@ -152,26 +689,97 @@ if __name__=="__main__":
         print("Exit of the isolate environment.\nHave a nice day ! ;)")
 
     elif args.command == "stop":
+        from docker_tools import docker_tools
         rosEnv = RosEnvParam.load(args.param_path)
 
         if docker_tools.isRunning(rosEnv['container_name']): # If is already running
-            docker_tools.stop(rosEnv['container_name'])
+            if not docker_tools.stop(rosEnv['container_name']):
+                sys.exit(1)
         else:
             print("Already stopped or maybe doesn't exist.")
 
     elif args.command == "kill":
         # docker stop and docker rm
+        from docker_tools import docker_tools
         rosEnv = RosEnvParam.load(args.param_path)
 
         if docker_tools.isRunning(rosEnv['container_name']):
             if docker_tools.stop(rosEnv['container_name']) and docker_tools.rm(rosEnv['container_name']):
                 print("Isolate environment killed.")
+            else:
+                sys.exit(1)
         elif docker_tools.exist(rosEnv['container_name']):
             if docker_tools.rm(rosEnv['container_name']):
                 print("Isolate environment killed.")
+            else:
+                sys.exit(1)
         else:
             print("Isolate environment already killed or has never existed.")
 
+    elif args.command == "snapshot":
+        from docker_tools import inspectImage
+        from env_snapshot import env_snapshot
+        rosEnv = RosEnvParam.load(args.param_path)
+
+        if args.action == "create":
+            print(f"Committing {rosEnv['container_name']} ... ", end="", flush=True)
+            start = time.monotonic()
+            try:
+                snapshot = env_snapshot.create(rosEnv, args.param_path, args.message)
+            except RuntimeError as e:
+                print(f"Failed\n{e}")
+                sys.exit(1)
+            size = inspectImage(snapshot["tag"])["Size"]
+            print(f"Done in {time.monotonic() - start:.1f}s ({snapshot['tag']}, {size/1e9:.2f} GB)")
+
+        elif args.action == "list":
+            snapshots = env_snapshot.listSnapshots(rosEnv)
+            if not snapshots:
+                print(f"No snapshot of {rosEnv['container_name']}.")
+            for snapshot in snapshots:
+                size = f"{snapshot['size']/1e9:6.2f} GB" if snapshot["size"] != None else "removed  "
+                state = "stale" if snapshot["stale"] else "     "
+                print(f"\t{snapshot['tag']}  {snapshot['created']}  {size}  {state}  {snapshot.get('message') or ''}")
+            if any(snapshot["stale"] for snapshot in snapshots):
+                print("stale: the image was built again since the snapshot, it doesn't have the changes of the build.")
+
+        elif args.action == "prune":
+            removed = env_snapshot.prune(rosEnv, args.param_path, args.keep, args.stale)
+            for tag in removed:
+                print(f"\t{tag} removed")
+            print(f"{len(removed)} snapshot(s) removed.")
+
+        elif args.action == "rm":
+            if not args.tag:
+                print("Give the snapshots to remove with --tag.")
+                sys.exit(1)
+            known = {snapshot["tag"] for snapshot in rosEnv.get("snapshots") or []}
+            unknown = [tag for tag in args.tag if tag not in known]
+            if unknown:
+                print(f"Not a snapshot of {rosEnv['container_name']}: {', '.join(unknown)}")
+                sys.exit(1)
+            removed = env_snapshot.remove(rosEnv, args.param_path, args.tag)
+            print(f"{len(removed)} snapshot(s) removed.")
+            if len(removed) != len(args.tag):
+                sys.exit(1)
+
+    elif args.command == "restore":
+        from docker_tools import docker_tools
+        from env_snapshot import env_snapshot
+        rosEnv = RosEnvParam.load(args.param_path)
+        snapshot = env_snapshot.find(rosEnv, args.tag)
+        if snapshot == None:
+            print(f"No snapshot {args.tag if args.tag != None else ''} of {rosEnv['container_name']}. See snapshot list.")
+            sys.exit(1)
+
+        if docker_tools.isRunning(rosEnv['container_name']) and not docker_tools.stop(rosEnv['container_name']):
+            sys.exit(1)
+        if docker_tools.exist(rosEnv['container_name']) and not docker_tools.rm(rosEnv['container_name']):
+            sys.exit(1)
+        begin = time.monotonic()
+        if not startSnapshot(snapshot) or not waitReady(rosEnv['container_name'], "snapshot", begin):
+            sys.exit(1)
+
 
 
 
@@ -0,0 +1,129 @@
+import os
+import time
+import pathlib
+import yaml
+
+
+INDEX_URL = "https://raw.githubusercontent.com/ros/rosdistro/master/index-v4.yaml"
+
+
+def getCacheDir() -> pathlib.Path:
+    """
+    Return the directory used by ros-env to store its cached data. Follow XDG_CACHE_HOME if it is defined.
+
+    :return: path to the cache directory (not created)
+    :rtype: pathlib.Path
+    """
+    base = os.environ.get("XDG_CACHE_HOME")
+    base = pathlib.Path(base) if base else pathlib.Path.home() / ".cache"
+    return base / "ros-env"
+
+
+class rosdistro_cache:
+    """
+    Keep a compact copy of the rosdistro index on disk. Only the table distro -> distribution type is kept,
+    with the HTTP validators (ETag, Last-Modified) to revalidate it without downloading the whole index again.
+    """
+
+    TTL = 24*60*60 # One day, the index change only on new distro release
+
+    def __init__(self, path: pathlib.Path = None, ttl: int = None, offline: bool = False):
+        self.path = path if path != None else getCacheDir() / "rosdistro_index.yaml"
+        self.ttl = ttl if ttl != None else rosdistro_cache.TTL
+        self.offline = offline
+        self.refreshed = False # Fetched by this process, the index can't be newer
+        self.data = self.read()
+
+    def read(self) -> dict:
+        # A broken cache is the same as no cache: it will be fetched again
+        try:
+            with open(self.path, "r") as cache_file:
+                data = yaml.safe_load(cache_file)
+        except (OSError, yaml.YAMLError):
+            return None
+        if not isinstance(data, dict) or not isinstance(data.get("distributions"), dict):
+            return None
+        return data
+
+    def write(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".tmp")
+        with open(tmp, "w") as cache_file:
+            yaml.safe_dump(self.data, cache_file, sort_keys=True)
+        os.replace(tmp, self.path)
+
+    def isFresh(self) -> bool:
+        return self.data != None and time.time() - self.data.get("fetched", 0) < self.ttl
+
+    def refresh(self) -> None:
+        """
+        Fetch the index from the network. If a cache exist the request is conditional, a 304 answer only
+        bump the fetch time of the cache.
+        """
+        import requests
+
+        headers = {}
+        if self.data != None:
+            if self.data.get("etag"):
+                headers["If-None-Match"] = self.data["etag"]
+            if self.data.get("last_modified"):
+                headers["If-Modified-Since"] = self.data["last_modified"]
+
+        response = requests.get(INDEX_URL, headers=headers, timeout=10)
+        self.refreshed = True
+        if response.status_code == 304 and self.data != None:
+            self.data["fetched"] = time.time()
+            self.write()
+            return
+        response.raise_for_status()  # Raise an error for bad status codes
+
+        index = yaml.safe_load(response.text)
+        self.data = {
+            "fetched": time.time(),
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "distributions": {name: distro.get("distribution_type", "ros1")
+                              for name, distro in index["distributions"].items()}
+        }
+        self.write()
+
+    def distributions(self) -> dict:
+        """
+        Return the table distro -> distribution type. Make at most one network round trip, none if the
+        cache is fresh or in offline mode.
+
+        :return: {distro: distribution_type}
+        :rtype: dict
+        """
+        if self.offline:
+            if self.data == None:
+                raise ConnectionError(f"Offline mode but no rosdistro index cached in {self.path}. Run once with network first.")
+            return self.data["distributions"]
+
+        if not self.isFresh():
+            try:
+                self.refresh()
+            except Exception as e:
+                if self.data == None:
+                    raise ConnectionError(f"Error fetching ROS versions: {e}") from e
+                print(f"\nError fetching ROS versions: {e}\nUsing the cached rosdistro index from {self.path}")
+
+        return self.data["distributions"]
+
+    def getType(self, ros_distro: str) -> str:
+        """
+        :param ros_distro: The version of the ros distro ex: humble, noetic
+        :return: "ros2" for a ROS 2 distro else "ros"
+        :raises NameError: if the distro is not in the index
+        """
+        distributions = self.distributions()
+        if not ros_distro in distributions and not self.offline and not self.refreshed:
+            # Released since the cache was fetched: revalidate the cache once before refusing the distro
+            try:
+                self.refresh()
+                distributions = self.data["distributions"]
+            except Exception as e:
+                print(f"\nError fetching ROS versions: {e}")
+        if not ros_distro in distributions:
+            raise NameError(f"{ros_distro} distro is not supported")
+        return "ros2" if distributions[ros_distro] == "ros2" else "ros"
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Measure the wake up jitter of a periodic loop, like a control loop, in the container. ros-env.py jitter pipe this
+script into the running container:
+
+    ./ros-env.py jitter --period 1000 --duration 10
+
+Only the standard library is used, so it run in any image. The loop is switched to SCHED_FIFO when the
+container allow it (rtprio ulimit and SYS_NICE), the latency of a Python loop is higher than a C++ controller
+but the differences between resource profiles are the same.
+"""
+import os
+import sys
+import time
+import argparse
+
+
+def percentile(values: list[int], p: float) -> int:
+    return values[min(len(values) - 1, int(p / 100 * len(values)))]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Wake up latency of a periodic loop.")
+    parser.add_argument("--period", type=int, default=1000, help="period of the loop in microseconds. By default 1000 (1 kHz)")
+    parser.add_argument("--duration", type=float, default=10, help="duration of the measure in seconds")
+    parser.add_argument("--priority", type=int, default=80, help="SCHED_FIFO priority, 0 to stay with the default scheduler")
+    args = parser.parse_args()
+
+    policy = "SCHED_OTHER"
+    if args.priority > 0:
+        try:
+            os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(args.priority))
+            policy = f"SCHED_FIFO {args.priority}"
+        except PermissionError:
+            print("SCHED_FIFO not allowed (set --rtprio on create), measuring with the default scheduler.", file=sys.stderr)
+
+    period = args.period * 1000
+    latencies = []
+    deadline = time.monotonic_ns() + period
+    end = deadline + int(args.duration * 1e9)
+    while deadline < end:
+        remaining = deadline - time.monotonic_ns()
+        if remaining > 0:
+            time.sleep(remaining / 1e9)
+        latencies.append(max(0, time.monotonic_ns() - deadline))
+        deadline += period
+
+    latencies.sort()
+    overruns = sum(1 for latency in latencies if latency > period)
+    print(f"cpus: {sorted(os.sched_getaffinity(0))}, policy: {policy}, period: {args.period} us, samples: {len(latencies)}")
+    print(f"latency (us): min {latencies[0]/1e3:.1f}, avg {sum(latencies)/len(latencies)/1e3:.1f}, "
+          f"p99 {percentile(latencies, 99)/1e3:.1f}, p99.9 {percentile(latencies, 99.9)/1e3:.1f}, max {latencies[-1]/1e3:.1f}")
+    print(f"overruns (latency > period): {overruns}")
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Helper run in the container by ros-env.py sync (docker exec ... python3 -c <this file>), only the standard library
+is used so it run in any image:
+
+    scan ROOT WORKSPACE...   print {path: [size, sha256]} of the files of the workspaces, as json
+    apply ROOT               extract the tar read on stdin in ROOT, then remove the files listed in its
+                             .ros-env-sync.json member and print how many were removed. Run as root, the
+                             written files and folders are given to the owner of ROOT.
+
+The paths are relative to ROOT (~ or ~user for the home of the user), they start with the workspace folder. No
+annotations: the python3 of the Ubuntu focal images (noetic) is 3.8.
+"""
+import os
+import sys
+import json
+import hashlib
+import tarfile
+
+
+DELETED_MEMBER = ".ros-env-sync.json"
+SKIPPED_FOLDERS = ["build", "install", "log"] # colcon artifacts of the container, at the root of a workspace
+SKIPPED_NAMES = [".git", "__pycache__"]
+
+
+def hashFile(path):
+    sha = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(1 << 20), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def scan(root, workspaces):
+    files = {}
+    for workspace in workspaces:
+        top = os.path.join(root, workspace)
+        for dirpath, dirnames, filenames in os.walk(top):
+            dirnames[:] = [name for name in dirnames if name not in SKIPPED_NAMES and not (dirpath == top and name in SKIPPED_FOLDERS)]
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                if os.path.isfile(path) and not os.path.islink(path):
+                    files[os.path.relpath(path, root)] = [os.path.getsize(path), hashFile(path)]
+    return files
+
+
+def chownPath(root, relative, owner):
+    # The path and its folders up to ROOT, the workspaces COPY'd without --chown belong to root
+    parts = relative.split("/")
+    for i in range(1, len(parts) + 1):
+        os.lchown(os.path.join(root, *parts[:i]), *owner)
+
+
+def apply(root):
+    stat = os.stat(root)
+    owner = (stat.st_uid, stat.st_gid) if os.geteuid() == 0 else None
+    deleted = []
+    with tarfile.open(fileobj=sys.stdin.buffer, mode="r|") as tar:
+        for member in tar:
+            if member.name == DELETED_MEMBER:
+                deleted = json.load(tar.extractfile(member))
+                continue
+            # Never write outside of the workspaces
+            if member.name.startswith("/") or ".." in member.name.split("/"):
+                continue
+            if hasattr(tarfile, "data_filter"):
+                tar.extract(member, root, filter="data")
+            else:
+                tar.extract(member, root)
+            if owner != None:
+                chownPath(root, member.name, owner)
+    for relative in deleted:
+        path = os.path.join(root, relative)
+        if ".." not in relative.split("/") and os.path.isfile(path):
+            os.remove(path)
+    return len(deleted)
+
+
+if __name__ == "__main__":
+    root = os.path.expanduser(sys.argv[2])
+    if sys.argv[1] == "scan":
+        json.dump(scan(root, sys.argv[3:]), sys.stdout)
+    elif sys.argv[1] == "apply":
+        print(apply(root))
@@ -0,0 +1,51 @@
+import os
+import sys
+import json
+import pathlib
+import pytest
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from docker_api import docker_api
+
+
+@pytest.fixture(autouse=True)
+def isolated(tmp_path, monkeypatch):
+    """
+    Every test run in its own folder, with its own cache and without the ros-env daemon.
+    """
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    monkeypatch.setenv("ROS_ENV_DAEMON", "0")
+    monkeypatch.setattr(docker_api, "_client", None)
+    return tmp_path
+
+
+@pytest.fixture
+def fake_docker(tmp_path, monkeypatch):
+    """
+    Put the fake docker CLI (fake_docker.py) first in PATH, the Engine API socket doesn't exist.
+
+    :return: function giving the state of the fake docker daemon
+    """
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    (bin_dir / "docker").write_text(f"#!/bin/sh\nexec {sys.executable} {ROOT / 'fake_docker.py'} \"$@\"\n")
+    (bin_dir / "docker").chmod(0o755)
+    state_path = tmp_path / "fake_docker_state.json"
+    monkeypatch.setenv("PATH", f"{bin_dir}:{os.environ['PATH']}")
+    monkeypatch.setenv("FAKE_DOCKER_STATE", str(state_path))
+    monkeypatch.setenv("FAKE_DOCKER_LAYER_SIZE", "1000")
+    monkeypatch.setenv("DOCKER_HOST", f"unix://{tmp_path / 'none.sock'}")
+
+    def state() -> dict:
+        return json.loads(state_path.read_text()) if state_path.exists() else {}
+    return state
+
+
+@pytest.fixture
+def workspace(tmp_path):
+    (tmp_path / "ws" / "src" / "pkg").mkdir(parents=True)
+    (tmp_path / "ws" / "src" / "pkg" / "main.py").write_text("print('hi')\n")
+    return tmp_path / "ws"
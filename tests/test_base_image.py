@@ -0,0 +1,41 @@
+import os
+import json
+import pytest
+from base_image import base_image, getContextDir, BASE_LABEL, BASE_IMAGE_LABEL
+from docker_stub import docker_stub
+
+
+IMAGES = {"ros-env-base:humble-nogazebo-aaa": {"labels": {BASE_LABEL: "1"}, "size": 5000},
+          "ros-env-base:humble-nogazebo-bbb": {"labels": {BASE_LABEL: "1"}, "size": 6000},
+          "rob": {"labels": {BASE_LABEL: "0", BASE_IMAGE_LABEL: "ros-env-base:humble-nogazebo-aaa"}}}
+
+
+@pytest.fixture(params=["api", "cli"])
+def images(request, tmp_path, monkeypatch):
+    """
+    :return: function giving the tags of the images of the Docker daemon, through the API stub or the fake CLI
+    """
+    if request.param == "api":
+        with docker_stub(str(tmp_path / "docker.sock"), images=IMAGES) as stub:
+            monkeypatch.setenv("DOCKER_HOST", f"unix://{stub.socket_path}")
+            yield lambda: sorted(stub.images)
+    else:
+        state = request.getfixturevalue("fake_docker")
+        with open(os.environ["FAKE_DOCKER_STATE"], "w") as state_file:
+            json.dump({"images": IMAGES}, state_file)
+        yield lambda: sorted(state()["images"])
+
+
+def test_list_and_gc_bases(images):
+    for tag in ("ros-env-base:humble-nogazebo-bbb", "ros-env-base:jazzy-nogazebo-ccc"):
+        getContextDir(tag).mkdir(parents=True)
+    bases = {base["tag"]: (base["size"], base["users"], base["id"] != None) for base in base_image.listBases()}
+    assert bases == {"ros-env-base:humble-nogazebo-aaa": (5000, 1, True),
+                     "ros-env-base:humble-nogazebo-bbb": (6000, 0, True),
+                     "ros-env-base:jazzy-nogazebo-ccc": (0, 0, False)}
+
+    # The base never built may be waiting for the first build of its environment
+    assert base_image.gc() == ["ros-env-base:humble-nogazebo-bbb"]
+    assert images() == ["rob", "ros-env-base:humble-nogazebo-aaa"]
+    assert not getContextDir("ros-env-base:humble-nogazebo-bbb").exists()
+    assert getContextDir("ros-env-base:jazzy-nogazebo-ccc").exists()
@@ -0,0 +1,38 @@
+import sys
+import json
+import pytest
+import pathlib
+import subprocess
+from benchmark import compare
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+
+
+def bench(tmp_path, *arguments) -> subprocess.CompletedProcess:
+    return subprocess.run([sys.executable, str(ROOT / "benchmark.py"), "--repeat", "1", "--json", str(tmp_path / "bench.json")] + list(arguments),
+                          capture_output=True, text=True)
+
+
+def test_phases_with_the_fake_backend(tmp_path):
+    result = bench(tmp_path, "--skip-end-to-end")
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.startswith("backend: fake docker, runs: 1")
+    phases = json.loads((tmp_path / "bench.json").read_text())["phases"]
+    assert {"generate Dockerfile", "rosdistro lookup (warm)", "docker isRunning", "docker imageExist"} <= set(phases)
+    assert all(measure["runs"] == 1 for measure in phases.values())
+
+
+# ros-env.py use the f-strings of python 3.12
+@pytest.mark.skipif(sys.version_info < (3, 12), reason="ros-env.py needs python 3.12")
+def test_lifecycle_with_the_fake_backend(tmp_path):
+    result = bench(tmp_path, "--commands", "create", "build", "stop", "kill", "delete")
+    assert result.returncode == 0, result.stderr
+    end_to_end = json.loads((tmp_path / "bench.json").read_text())["end to end"]
+    assert list(end_to_end) == ["create", "build", "stop", "kill", "delete"]
+
+
+def test_regression_against_the_baseline():
+    summary = {"phases": {"fast": {"median": 0.0005}, "build hash": {"median": 0.02}, "new": {"median": 1}}}
+    baseline = {"phases": {"fast": {"median": 0.0001}, "build hash": {"median": 0.01}}}
+    assert compare(summary, baseline, 1.5) == ["phases/build hash: 20.0 ms instead of 10.0 ms"]
+    assert compare(summary, baseline, 3) == []
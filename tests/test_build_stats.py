@@ -0,0 +1,68 @@
+import yaml
+import pytest
+from docker_generator import docker_generator
+from docker_tools import docker_tools
+from build_stats import build_stats, parseTime, normalize
+
+
+@pytest.fixture
+def environment(fake_docker, workspace):
+    docker_generator("rob", None, False, ["./ws"], False, ros_distro="humble", ros_type="ros2", isLayered=True,
+                     dep_content={"apt": ["curl"], "pip": []})
+    return fake_docker
+
+
+def test_build_recorded(environment, monkeypatch):
+    monkeypatch.setenv("FAKE_DOCKER_STEP_TIME", "2")
+    assert docker_tools.build(profile="headless")
+    builds = build_stats.load("rob")
+    assert len(builds) == 1
+    build = builds[0]
+    assert build["success"] and build["profile"] == "headless"
+    assert build["hash"] != None and build["size"] > 0
+    assert build["steps"][0]["instruction"].startswith("FROM osrf/ros:humble-desktop")
+    assert build["cache hits"] == 0
+    assert all(step["duration"] == pytest.approx(2) for step in build["steps"])
+    assert not any(step["name"].startswith("[internal]") for step in build["steps"])
+
+
+def test_cache_hits_after_a_change(environment):
+    assert docker_tools.build()
+    # Only the layers from the user dependencies are built again
+    docker_generator("rob", None, False, ["./ws"], False, ros_distro="humble", ros_type="ros2", isLayered=True,
+                     dep_content={"apt": ["curl", "htop"], "pip": []})
+    assert docker_tools.build()
+    first, second = build_stats.load("rob")
+    user = next(i for i, step in enumerate(second["steps"]) if "curl" in step["instruction"])
+    assert [step["cached"] for step in second["steps"]] == [True] * user + [False] * (len(second["steps"]) - user)
+    assert second["cache hits"] == user
+
+
+def test_up_to_date_image_not_recorded(environment):
+    assert docker_tools.build()
+    assert docker_tools.build()
+    assert len(build_stats.load("rob")) == 1
+
+
+def step(instruction: str, duration: float, cached: bool = False) -> dict:
+    return {"instruction": instruction, "duration": duration, "cached": cached}
+
+
+def test_regressions():
+    builds = [{"steps": [step("RUN a", 10), step("RUN b", 10)]},
+              {"steps": [step("RUN a", 12), step("RUN b", 0, True)]},
+              {"steps": [step("RUN a", 30), step("RUN b", 11), step("RUN c", 60)]}]
+    assert build_stats.regressions(builds) == [{"instruction": "RUN a", "duration": 30, "median": 11}]
+    assert build_stats.regressions(builds[:1]) == []
+
+
+def test_progress_parsing():
+    assert parseTime("2024-05-01T10:00:01.123456789Z") - parseTime("2024-05-01T10:00:00Z") == pytest.approx(1.123456789)
+    assert parseTime("2024-05-01T12:00:00+02:00") == parseTime("2024-05-01T10:00:00Z")
+    stats = build_stats("rob")
+    assert not stats.feed("#1 [internal] load build definition")
+    assert stats.feed('{"vertexes": [{"digest": "d", "name": "[1/2] RUN ls", "cached": true}]}')
+    assert stats.getSteps() == [{"name": "[1/2] RUN ls", "instruction": "RUN ls", "cached": True, "duration": 0.0, "size": None}]
+    # The image history give the layer sizes
+    assert normalize("RUN |2 UID=1000 GID=1000 /bin/sh -c apt-get install -y curl # buildkit") == "RUN apt-get install -y curl"
+    assert normalize("RUN --mount=type=cache,target=/var/cache/apt apt-get install -y curl") == "RUN apt-get install -y curl"
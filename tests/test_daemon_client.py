@@ -0,0 +1,60 @@
+import os
+import socket
+import pytest
+import daemon_client
+from daemon_client import getDaemonSocket, connect, request, forward
+
+
+@pytest.fixture
+def no_runtime_dir(tmp_path, monkeypatch):
+    monkeypatch.delenv("XDG_RUNTIME_DIR", raising=False)
+    # Not the /tmp/ros-env-<uid> of the user
+    monkeypatch.setattr(daemon_client, "FALLBACK_DIR", str(tmp_path))
+
+
+def test_socket_in_a_private_folder(no_runtime_dir):
+    path = getDaemonSocket()
+    assert os.path.dirname(path) == daemon_client.FALLBACK_DIR + f"/ros-env-{os.getuid()}"
+    assert os.stat(os.path.dirname(path)).st_mode & 0o777 == 0o700
+    assert getDaemonSocket() == path
+
+
+def test_refuse_a_folder_other_users_can_write(no_runtime_dir, tmp_path):
+    folder = tmp_path / f"ros-env-{os.getuid()}"
+    folder.mkdir()
+    folder.chmod(0o777)
+    with pytest.raises(PermissionError):
+        getDaemonSocket()
+    # The commands run directly
+    assert connect() == None
+    assert forward(["status"]) == None
+
+
+def test_refuse_a_symlink(no_runtime_dir, tmp_path):
+    (tmp_path / "elsewhere").mkdir(mode=0o700)
+    (tmp_path / f"ros-env-{os.getuid()}").symlink_to(tmp_path / "elsewhere")
+    with pytest.raises(PermissionError):
+        getDaemonSocket()
+
+
+def test_no_daemon(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_RUNTIME_DIR", str(tmp_path))
+    assert connect() == None
+    assert request({"control": "status"}) == None
+    # A socket without permission, or a file which is not a socket
+    (tmp_path / "ros-env.sock").write_text("")
+    assert connect() == None
+
+
+def test_refuse_a_daemon_of_another_user(tmp_path, monkeypatch):
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(str(tmp_path / "ros-env.sock"))
+    server.listen()
+    try:
+        connection = connect(str(tmp_path / "ros-env.sock"))
+        assert connection != None
+        connection.close()
+        monkeypatch.setattr(daemon_client, "getPeerUid", lambda connection: os.getuid() + 1)
+        assert connect(str(tmp_path / "ros-env.sock")) == None
+    finally:
+        server.close()
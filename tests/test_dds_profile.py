@@ -0,0 +1,20 @@
+import xml.etree.ElementTree as ET
+from dds_profile import dds_profile, toBytes
+
+
+NS = {"cdds": "https://cdds.io/config"}
+
+
+def test_cyclonedds_profile_never_require():
+    profile = ET.fromstring(dds_profile("shm", "cyclonedds", "2gb").getCycloneDDSProfile().encode())
+    # No RouDi in the container, the shared memory of Cyclone DDS would stop the nodes
+    assert profile.find(".//cdds:SharedMemory", NS) == None
+    buffer = profile.find(".//cdds:SocketReceiveBufferSize", NS)
+    assert buffer.attrib == {"max": str(2 * 1024**3 // 64)}
+    assert dds_profile("shm", "cyclonedds").getDependencies("humble") == ["ros-humble-rmw-cyclonedds-cpp"]
+
+
+def test_fastdds_segment_fit_in_shm():
+    assert dds_profile("shm", "fastdds", "512mb").getSegmentSize() == 128 * 1024**2
+    assert dds_profile("shm", "fastdds", "4gb").getSegmentSize() == 256 * 1024**2
+    assert toBytes("2gb") == toBytes("2g") == 2 * 1024**3
@@ -0,0 +1,67 @@
+import os
+import json
+import hashlib
+from docker_api import docker_api, getSocketPath
+from docker_stub import docker_stub
+from docker_tools import inspectContainer, inspectImage, getApiVersion
+
+
+def test_inspect_only_exact_names(tmp_path):
+    with docker_stub(str(tmp_path / "docker.sock"), containers={"ros-humble": {"id": "abc123", "running": True}},
+                     images={"ros-humble": {}}) as stub:
+        client = docker_api(stub.socket_path)
+        assert client.inspectContainer("ros-humble")["Id"] == "abc123"
+        assert client.inspectContainer("abc123")["Name"] == "/ros-humble"
+        # The daemon resolve the ID prefixes, not docker_api
+        assert client.inspectContainer("abc") == None
+        assert client.inspectContainer("ros") == None
+        assert client.inspectImage("ros-humble") != None
+        assert client.inspectImage("ros") == None
+
+
+def test_one_connection_for_every_call(tmp_path, monkeypatch):
+    with docker_stub(str(tmp_path / "docker.sock"), containers={"ros-humble": {"running": True}}, images={"ros-humble": {}}) as stub:
+        monkeypatch.setenv("DOCKER_HOST", f"unix://{stub.socket_path}")
+        for _ in range(5):
+            assert inspectContainer("ros-humble")["State"]["Running"]
+            assert inspectImage("ros-humble") != None
+            assert inspectContainer("missing") == None
+        assert stub.requests == 15
+        assert stub.connections == 1
+
+
+def test_tcp_host_use_the_cli(fake_docker, monkeypatch):
+    monkeypatch.setenv("DOCKER_HOST", "tcp://127.0.0.1:2375")
+    with open(os.environ["FAKE_DOCKER_STATE"], "w") as state:
+        json.dump({"containers": {"ros-humble": {"running": True, "image": "ros-humble"}}, "images": {"ros-humble": {}}}, state)
+    assert not docker_api.client().available()
+    assert inspectContainer("ros-humble")["State"]["Running"]
+    assert inspectImage("ros-humble") != None
+    assert inspectContainer("missing") == None
+
+
+def test_socket_of_the_docker_context(tmp_path, monkeypatch):
+    monkeypatch.delenv("DOCKER_HOST", raising=False)
+    monkeypatch.setenv("DOCKER_CONFIG", str(tmp_path / "docker"))
+    (tmp_path / "docker").mkdir()
+    (tmp_path / "docker" / "config.json").write_text(json.dumps({"currentContext": "rootless"}))
+    for name, host in (("rootless", "unix:///run/user/1000/docker.sock"), ("remote", "ssh://robot")):
+        meta = tmp_path / "docker" / "contexts" / "meta" / hashlib.sha256(name.encode()).hexdigest()
+        meta.mkdir(parents=True)
+        (meta / "meta.json").write_text(json.dumps({"Name": name, "Endpoints": {"docker": {"Host": host}}}))
+    assert getSocketPath() == "/run/user/1000/docker.sock"
+
+    monkeypatch.setenv("DOCKER_CONTEXT", "remote")
+    assert not docker_api().available()
+    monkeypatch.setenv("DOCKER_CONTEXT", "default")
+    assert getSocketPath() == "/var/run/docker.sock"
+
+
+def test_api_version(tmp_path, monkeypatch, fake_docker):
+    with docker_stub(str(tmp_path / "docker.sock"), api_version="1.43") as stub:
+        monkeypatch.setenv("DOCKER_HOST", f"unix://{stub.socket_path}")
+        assert getApiVersion() == (1, 43)
+    monkeypatch.setattr(docker_api, "_client", None)
+    monkeypatch.setenv("DOCKER_HOST", "tcp://127.0.0.1:2375")
+    monkeypatch.setenv("FAKE_DOCKER_API_VERSION", "1.47")
+    assert getApiVersion() == (1, 47)
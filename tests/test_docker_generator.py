@@ -0,0 +1,130 @@
+import os
+import yaml
+import pytest
+import subprocess
+from docker_generator import docker_generator
+from docker_api import docker_api
+from docker_tools import docker_tools, getComposeImage, inspectImage, BUILD_HASH_LABEL
+from env_snapshot import getBuildHash
+from rosdistro_cache import rosdistro_cache
+from RosEnvParam import RosEnvParam
+
+
+def generate(volumes=None, shared=False, **options) -> docker_generator:
+    return docker_generator("rob", None, False, volumes, shared, ros_distro="humble", ros_type="ros2", **options)
+
+
+def read(name: str) -> str:
+    with open(name, "r") as file:
+        return file.read()
+
+
+def test_copied_workspaces_are_in_the_build_context(workspace):
+    generate(["./ws"])
+    assert "COPY --chown=${USER}:${GROUP} ./ws /home/${USER}/ws" in read("Dockerfile")
+    assert read(".dockerignore").splitlines()[1:4] == ["*", "!ws", "ws/build"]
+
+
+def test_shared_workspaces_are_not_copied(workspace):
+    generate(["./ws"], shared=True)
+    dockerfile = read("Dockerfile")
+    assert "COPY" not in dockerfile
+    assert "RUN mkdir -p /home/${USER}/ws" in dockerfile
+    assert read(".dockerignore").splitlines()[1:] == ["*"]
+    service = yaml.safe_load(read("docker-compose.yaml"))["services"]["gz_test"]
+    assert "./ws:/home/${USER}/ws" in service["volumes"]
+
+
+def test_cache_folders_are_created_as_root(workspace):
+    generate(["./ws"], isCache=True)
+    lines = read("Dockerfile").splitlines()
+    mkdir = next(i for i, line in enumerate(lines) if "/ccache" in line)
+    assert mkdir < lines.index("USER $USER")
+    assert "sudo" not in lines[mkdir]
+    assert "/home/${USER}/ws /ccache /home/${USER}/ws/build" in lines[mkdir]
+    assert 'RUN echo "$USER ALL=(ALL) NOPASSWD:ALL" >> /etc/sudoers' in lines
+
+
+def healthcheck() -> dict:
+    return yaml.safe_load(read("docker-compose.yaml"))["services"]["gz_test"]["healthcheck"]
+
+
+def test_generation_doesnt_ask_docker(monkeypatch, tmp_path):
+    # create --offline: nothing is run, the files are the same whatever the Docker daemon of the host
+    monkeypatch.setenv("PATH", str(tmp_path))
+    monkeypatch.setattr(docker_api, "client", lambda: pytest.fail("the Docker daemon was asked"))
+    generate()
+    assert healthcheck()["test"][1].endswith("ros2 daemon status")
+    assert "start_interval" not in healthcheck()
+
+
+@pytest.mark.parametrize("api_version, fast_start", [("1.43", False), ("1.44", True)])
+def test_start_interval_given_at_creation(fake_docker, monkeypatch, api_version, fast_start):
+    monkeypatch.setenv("FAKE_DOCKER_API_VERSION", api_version)
+    generate()
+    compose = read("docker-compose.yaml")
+    subprocess.run(["docker", "compose", "build"], check=True)
+    assert docker_tools.up()
+    assert read("docker-compose.yaml") == compose
+    created = fake_docker()["containers"]["rob"]["healthcheck"]
+    assert created["interval"] == "30s"
+    assert created.get("start_interval") == ("1s" if fast_start else None)
+
+
+def test_matrix_image_is_named_after_the_container(workspace):
+    # ros-env.py matrix look the size of this image up after the build
+    docker_generator("rob-humble", "ros-env/rob-humble", False, ["./ws"], False, ros_distro="humble", ros_type="ros2", output_dir="humble")
+    assert getComposeImage("humble/docker-compose.yaml") == "rob-humble"
+    assert getComposeImage("missing/docker-compose.yaml") == None
+
+
+def test_build_hash_label(fake_docker, workspace):
+    generate(["./ws"])
+    service = yaml.safe_load(read("docker-compose.yaml"))["services"]["gz_test"]
+    assert service["build"]["labels"] == {BUILD_HASH_LABEL: "${ROS_ENV_BUILD_HASH:-}"}
+    subprocess.run(["docker", "compose", "build"], env=dict(os.environ, ROS_ENV_BUILD_HASH="abc"), check=True)
+    # Read back by the snapshots to tell whether the image was built again
+    assert getBuildHash(inspectImage("rob")) == "abc"
+
+
+def layers(dockerfile: str) -> list[str]:
+    return dockerfile.split("\n\n")
+
+
+def test_layered_dependencies_only_change_the_user_layer():
+    generate(dep_content={"apt": ["zlib1g-dev", "curl"], "pip": ["numpy"]}, isLayered=True)
+    before = layers(read("Dockerfile"))
+    generate(dep_content={"apt": ["zlib1g-dev", "curl", "htop"], "pip": ["numpy"]}, isLayered=True)
+    after = layers(read("Dockerfile"))
+    user = next(i for i, layer in enumerate(after) if layer.startswith("# User dependencies"))
+    # Everything above the user layer stays in the build cache
+    assert after[:user] == before[:user]
+    assert after[user].splitlines()[-3:] == ["\tcurl \\ ", "\thtop \\ ", "\tzlib1g-dev"]
+    dockerfile = read("Dockerfile")
+    assert dockerfile.count("--mount=type=cache,target=/var/cache/apt,sharing=locked") == 3
+    assert "--mount=type=cache,target=/root/.cache/pip" in dockerfile
+    assert "rm -rf /var/lib/apt/lists" not in dockerfile and "--no-cache-dir" not in dockerfile
+
+
+GENERATED = ["Dockerfile", ".env", ".dockerignore", "docker-compose.yaml", ".ros_env_param.yaml"]
+
+
+def test_generation_is_idempotent(workspace, monkeypatch, capsys):
+    RosEnvParam.generate(".ros_env_param.yaml", generate(["./ws"], dep_content={"apt": ["curl"], "pip": []}))
+    os.chmod("Dockerfile", 0o600)
+    mtimes = {name: os.stat(name).st_mtime_ns for name in GENERATED}
+    capsys.readouterr()
+    # create_from: the type of the distro saved in the param file is used, the rosdistro index isn't read
+    monkeypatch.setattr(rosdistro_cache, "getType", lambda self, distro: pytest.fail("the distro was checked again"))
+    RosEnvParam.generate(".ros_env_param.yaml", generate(["./ws"], dep_content={"apt": ["curl"], "pip": []}))
+    assert {name: os.stat(name).st_mtime_ns for name in GENERATED} == mtimes
+    assert "0 file(s) written, 4 unchanged" in capsys.readouterr().out
+
+    RosEnvParam.generate(".ros_env_param.yaml", generate(["./ws"], dep_content={"apt": ["curl", "htop"], "pip": []}))
+    output = capsys.readouterr().out
+    assert "Generating Dockerfile ... Done (updated, +1 -0 lines)" in output
+    assert "1 file(s) written, 3 unchanged" in output
+    assert ".ros_env_param.yaml  file updated, +1 -0 lines" in output
+    assert os.stat("Dockerfile").st_mode & 0o777 == 0o600
+    assert os.stat("docker-compose.yaml").st_mtime_ns == mtimes["docker-compose.yaml"]
+    assert not any(name.endswith(".tmp") for name in os.listdir("."))
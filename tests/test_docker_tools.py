@@ -0,0 +1,85 @@
+import sys
+import time
+import signal
+import asyncio
+import subprocess
+import pytest
+from docker_tools import docker_tools, runProcess, runProcessAsync, stopProcess, executeSubProcess
+
+
+def python(code: str) -> list[str]:
+    return [sys.executable, "-c", code]
+
+
+def test_both_pipes_read_at_the_same_time():
+    # Much more than a pipe buffer on stderr before anything on stdout
+    result = runProcess(python("import sys\nfor i in range(40001): sys.stderr.write('e' * 99 + '\\n')\nprint('done')"), timeout=30)
+    assert result.returncode == 0
+    assert result.stdout == "done\n"
+    assert len(result.stderr) == 40001 * 100
+
+
+def test_line_callbacks():
+    stdout, stderr = [], []
+    result = runProcess(python("import sys\nfor i in range(30): print(i, flush=True); print(-i, file=sys.stderr, flush=True)\nsys.exit(3)"),
+                        onStdout=stdout.append, onStderr=stderr.append)
+    assert result.returncode == 3
+    assert stdout == [f"{i}\n" for i in range(30)]
+    assert stderr == [f"{-i}\n" for i in range(30)]
+    # With a callback only the last lines are kept, for the error messages
+    assert result.stdout == "".join(stdout[-20:])
+
+
+def test_input():
+    assert runProcess(["cat"], input=b"abc\n" * 100000).stdout == "abc\n" * 100000
+
+
+def isAlive(pid: str) -> bool:
+    # The orphaned child may stay a zombie until init reap it
+    try:
+        with open(f"/proc/{pid}/stat", "r") as stat:
+            return stat.read().rsplit(")", 1)[1].split()[0] != "Z"
+    except FileNotFoundError:
+        return False
+
+
+def test_timeout_stops_the_process_group(tmp_path):
+    start = time.monotonic()
+    with pytest.raises(subprocess.TimeoutExpired):
+        # The shell and its child are both stopped
+        runProcess(f"sleep 30 & echo $! > {tmp_path / 'child'}; wait", timeout=0.5)
+    assert time.monotonic() - start < 5
+    child = (tmp_path / "child").read_text().strip()
+    time.sleep(0.1)
+    assert not isAlive(child)
+
+
+def test_kill_after_the_grace_period():
+    async def main():
+        process = await asyncio.create_subprocess_exec(*python("import signal, time\nsignal.signal(signal.SIGTERM, signal.SIG_IGN)\nprint(flush=True)\ntime.sleep(30)"),
+                                                       stdout=asyncio.subprocess.PIPE, process_group=0)
+        await process.stdout.readline() # SIGTERM is ignored
+        await stopProcess(process, grace=0.2)
+        return process.returncode
+    assert asyncio.run(main()) == -signal.SIGKILL
+
+
+def test_cancellation():
+    async def main():
+        task = asyncio.ensure_future(runProcessAsync(["sleep", "30"]))
+        await asyncio.sleep(0.2)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+    start = time.monotonic()
+    asyncio.run(main())
+    assert time.monotonic() - start < 5
+
+
+def test_error_text_printed(fake_docker, capsys):
+    assert not docker_tools.stop("missing")
+    output = capsys.readouterr().out
+    assert output.startswith("Stopping docker missing ... \nStandard error: ")
+    assert "No such container: missing" in output
+    assert executeSubProcess("sleep 30", timeout=0.2) == -1
+    assert "No answer after 0.2 s, stopped." in capsys.readouterr().out
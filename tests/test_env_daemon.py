@@ -0,0 +1,81 @@
+import time
+import threading
+import pytest
+import env_daemon as env_daemon_module
+from env_daemon import env_daemon
+from docker_stub import docker_stub
+
+
+@pytest.fixture
+def stub(tmp_path, monkeypatch):
+    with docker_stub(str(tmp_path / "docker.sock"), containers={"rob": {"id": "rob-1", "running": True}, "other": {"running": True}}) as stub:
+        monkeypatch.setenv("DOCKER_HOST", f"unix://{stub.socket_path}")
+        yield stub
+
+
+@pytest.fixture
+def daemon(tmp_path, monkeypatch):
+    # A small script instead of ros-env.py, only the cache of the containers is used
+    (tmp_path / "ros-env.py").write_text('COMMAND_MODULES = ["image_profile"]\n')
+    monkeypatch.setattr(env_daemon_module, "SCRIPT", tmp_path / "ros-env.py")
+    return env_daemon(str(tmp_path / "daemon.sock"))
+
+
+def watch(daemon: env_daemon) -> None:
+    threading.Thread(target=daemon.watchContainers, daemon=True).start()
+    deadline = time.time() + 5
+    while daemon.containers == None and time.time() < deadline:
+        time.sleep(0.01)
+    assert daemon.containers != None
+
+
+def test_watcher_follow_the_events(stub, daemon):
+    watch(daemon)
+    assert sorted(daemon.containers) == ["other", "rob"]
+    stub.setRunning("other", False)
+    deadline = time.time() + 5
+    while daemon.containers["other"]["State"]["Running"] and time.time() < deadline:
+        time.sleep(0.01)
+    assert not daemon.containers["other"]["State"]["Running"]
+
+
+def test_resync_after_stop_and_start(stub, daemon):
+    # The watcher is not running: only resync can see what the command did
+    daemon.containers = {"rob": daemon_data(stub, "rob")}
+    daemon.last_event = time.time()
+    stub.containers["rob"]["started_at"] = "2024-05-01T12:00:00Z"
+    stub.setRunning("rob", False)
+    stub.setRunning("rob", True)
+    daemon.resync()
+    assert daemon.containers["rob"]["State"]["StartedAt"] == "2024-05-01T12:00:00Z"
+
+
+def test_resync_after_kill_and_create(stub, daemon):
+    daemon.containers = {"rob": daemon_data(stub, "rob"), "other": daemon_data(stub, "other")}
+    daemon.last_event = time.time()
+    stub.publish({"Type": "container", "Action": "destroy", "Actor": {"ID": "rob-1", "Attributes": {"name": "rob"}}})
+    stub.containers["rob"] = {"id": "rob-2", "running": True}
+    stub.publish({"Type": "container", "Action": "create", "Actor": {"ID": "rob-2", "Attributes": {"name": "rob"}}})
+    daemon.resync()
+    assert daemon.containers["rob"]["Id"] == "rob-2"
+    assert daemon.containers["other"]["Id"] == "other-id"
+
+
+def test_resync_ignore_the_events_already_applied(stub, daemon):
+    stub.setRunning("rob", False)
+    daemon.containers = {"rob": daemon_data(stub, "rob")}
+    daemon.last_event = time.time()
+    requests = stub.requests
+    daemon.resync()
+    assert stub.requests == requests + 1 # Only the events, no inspect
+
+
+def test_cache_dropped_without_docker(stub, daemon):
+    daemon.containers = {"rob": daemon_data(stub, "rob")}
+    stub.stop()
+    daemon.resync()
+    assert daemon.containers == None
+
+
+def daemon_data(stub: docker_stub, name: str) -> dict:
+    return stub.containerData(name)
@@ -0,0 +1,55 @@
+import os
+import json
+import time
+import threading
+from docker_stub import docker_stub
+from env_health import env_health
+
+
+def later(delay: float, action) -> None:
+    threading.Timer(delay, action).start()
+
+
+def test_wait_follow_the_health_events(tmp_path, monkeypatch):
+    with docker_stub(str(tmp_path / "docker.sock"), containers={"rob": {"running": True, "health": "starting"}}) as stub:
+        monkeypatch.setenv("DOCKER_HOST", f"unix://{stub.socket_path}")
+        later(0.3, lambda: stub.setHealth("rob", "healthy"))
+        start = time.time()
+        status, health = env_health.wait("rob", timeout=10)
+        assert (status, health["Status"]) == ("healthy", "healthy")
+        assert time.time() - start < 5
+
+
+def test_wait_stop_on_die_and_timeout(tmp_path, monkeypatch):
+    with docker_stub(str(tmp_path / "docker.sock"), containers={"rob": {"running": True, "health": "starting"}}) as stub:
+        monkeypatch.setenv("DOCKER_HOST", f"unix://{stub.socket_path}")
+        later(0.2, lambda: stub.setRunning("rob", False))
+        assert env_health.wait("rob", timeout=10)[0] == "exited"
+
+        stub.containers["rob"]["running"] = True
+        start = time.time()
+        assert env_health.wait("rob", timeout=1)[0] == "timeout"
+        assert 1 <= time.time() - start < 4
+
+
+def test_wait_without_healthcheck(tmp_path, monkeypatch):
+    with docker_stub(str(tmp_path / "docker.sock"), containers={"rob": {"running": True}}) as stub:
+        monkeypatch.setenv("DOCKER_HOST", f"unix://{stub.socket_path}")
+        assert env_health.wait("rob", timeout=10) == ("none", None)
+
+
+def test_wait_poll_the_cli(fake_docker, monkeypatch):
+    with open(os.environ["FAKE_DOCKER_STATE"], "w") as state:
+        json.dump({"containers": {"rob": {"running": True, "image": "rob", "started": time.time(), "healthcheck": True}}, "images": {"rob": {}}}, state)
+    monkeypatch.setenv("FAKE_DOCKER_READY_DELAY", "0.5")
+    assert env_health.wait("rob", timeout=10)[0] == "healthy"
+    monkeypatch.setenv("FAKE_DOCKER_HEALTH", "unhealthy")
+    status, health = env_health.wait("rob", timeout=10)
+    assert (status, health["FailingStreak"]) == ("unhealthy", 3)
+
+
+def test_starts_are_recorded():
+    env_health.record("rob", "create", "healthy", 1.23456)
+    env_health.record("rob", "start", "timeout", 120)
+    assert [(start["mode"], start["status"], start["duration"]) for start in env_health.load("rob")] == [("create", "healthy", 1.235), ("start", "timeout", 120)]
+    assert env_health.load("other") == []
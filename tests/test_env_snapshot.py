@@ -0,0 +1,118 @@
+import os
+import sys
+import pathlib
+import subprocess
+import pytest
+from docker_generator import docker_generator
+from docker_tools import docker_tools, inspectContainer, inspectImage
+from RosEnvParam import RosEnvParam
+from env_snapshot import env_snapshot
+
+
+PARAM = ".ros_env_param.yaml"
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+
+
+@pytest.fixture(params=["rob", "myimg"])
+def environment(request, fake_docker, workspace):
+    """
+    Environment rob built and started, with an image name (-i) equal to the container name or not.
+    """
+    gen = docker_generator("rob", request.param, False, ["./ws"], False, ros_distro="humble", ros_type="ros2")
+    RosEnvParam.generate(PARAM, gen)
+    build("v1")
+    assert docker_tools.up()
+    return fake_docker
+
+
+def build(build_hash: str) -> None:
+    subprocess.run(["docker", "compose", "build"], env=dict(os.environ, ROS_ENV_BUILD_HASH=build_hash), check=True)
+
+
+def snapshot(message: str = None) -> dict:
+    return env_snapshot.create(RosEnvParam.load(PARAM), PARAM, message)
+
+
+def test_snapshot_keep_the_build_it_comes_from(environment):
+    first = snapshot("deps installed")
+    assert first["build hash"] == "v1"
+    assert inspectImage(first["tag"])["Config"]["Labels"]["ros-env.snapshot"] == "rob"
+    snapshots = env_snapshot.listSnapshots(RosEnvParam.load(PARAM))
+    assert [(item["tag"], item["message"], item["stale"]) for item in snapshots] == [(first["tag"], "deps installed", False)]
+
+
+def test_build_make_the_snapshots_stale(environment):
+    tag = snapshot()["tag"]
+    build("v2")
+    assert env_snapshot.listSnapshots(RosEnvParam.load(PARAM))[0]["stale"]
+    assert env_snapshot.prune(RosEnvParam.load(PARAM), PARAM, keep=3, stale=True) == [tag]
+    assert RosEnvParam.load(PARAM).get("snapshots") == []
+    assert inspectImage(tag) == None
+
+
+def test_prune_keep_the_newest(environment):
+    tags = [snapshot(str(i))["tag"] for i in range(4)]
+    assert len(set(tags)) == 4
+    assert env_snapshot.prune(RosEnvParam.load(PARAM), PARAM, keep=2) == tags[:2]
+    assert [item["tag"] for item in RosEnvParam.load(PARAM)["snapshots"]] == tags[2:]
+    assert env_snapshot.find(RosEnvParam.load(PARAM))["tag"] == tags[3]
+    assert env_snapshot.find(RosEnvParam.load(PARAM), tags[2].rsplit(":", 1)[1])["tag"] == tags[2]
+    assert env_snapshot.find(RosEnvParam.load(PARAM), "snapshot-missing") == None
+
+
+def test_restore_create_the_container_from_the_snapshot(environment):
+    tag = snapshot()["tag"]
+    docker_tools.stop("rob")
+    docker_tools.rm("rob")
+    assert docker_tools.up(env_snapshot.find(RosEnvParam.load(PARAM))["tag"])
+    assert inspectContainer("rob")["Image"] == inspectImage(tag)["Id"]
+
+
+def test_snapshot_needs_the_container(fake_docker, workspace):
+    RosEnvParam.generate(PARAM, docker_generator("rob", "rob", False, ["./ws"], False, ros_distro="humble", ros_type="ros2"))
+    with pytest.raises(RuntimeError, match="The container rob doesn't exist"):
+        snapshot()
+
+
+def test_image_of_a_container_not_removed(environment, capsys):
+    tag = snapshot()["tag"]
+    docker_tools.stop("rob")
+    docker_tools.rm("rob")
+    assert docker_tools.up(tag)
+    assert env_snapshot.remove(RosEnvParam.load(PARAM), PARAM, [tag]) == []
+    assert f"{tag} kept: Error response from daemon: conflict" in capsys.readouterr().out
+    assert [item["tag"] for item in RosEnvParam.load(PARAM)["snapshots"]] == [tag]
+
+
+def test_snapshots_kept_by_create_from(environment):
+    rosEnv = RosEnvParam.load(PARAM)
+    tag = snapshot()["tag"]
+    RosEnvParam.generate(PARAM, docker_generator("rob", rosEnv["image_name"], False, ["./ws"], False, ros_distro="humble", ros_type="ros2", isLayered=True))
+    assert [item["tag"] for item in RosEnvParam.load(PARAM)["snapshots"]] == [tag]
+    # Another image: the snapshots are not of it
+    RosEnvParam.generate(PARAM, docker_generator("rob", "other", False, ["./ws"], False, ros_distro="humble", ros_type="ros2"))
+    assert "snapshots" not in RosEnvParam.load(PARAM)
+
+
+def rosEnv(*arguments) -> subprocess.CompletedProcess:
+    return subprocess.run([sys.executable, str(ROOT / "ros-env.py")] + list(arguments), capture_output=True, text=True)
+
+
+@pytest.mark.skipif(sys.version_info < (3, 12), reason="ros-env.py needs python 3.12")
+def test_commands(environment):
+    result = rosEnv("snapshot", "-m", "built")
+    assert result.returncode == 0, result.stdout + result.stderr
+    tag = RosEnvParam.load(PARAM)["snapshots"][0]["tag"]
+    assert f"({tag}, " in result.stdout
+    assert tag in rosEnv("snapshot", "list").stdout
+
+    assert rosEnv("kill").returncode == 0
+    result = rosEnv("start", "-d", "--snapshot")
+    assert result.returncode == 0, result.stdout + result.stderr
+    assert f"Using snapshot {tag}" in result.stdout
+    assert inspectContainer("rob")["Image"] == inspectImage(tag)["Id"]
+
+    result = rosEnv("restore", "snapshot-missing")
+    assert result.returncode == 1 and "No snapshot snapshot-missing of rob" in result.stdout
+    assert rosEnv("restore").returncode == 0
+    assert rosEnv("snapshot", "rm", "-t", tag).returncode == 1 # Used by the container
@@ -0,0 +1,59 @@
+import os
+import pytest
+import subprocess
+from env_status import env_status, formatDuration, parseCreatedAt
+from docker_stub import docker_stub
+from docker_generator import docker_generator
+
+
+@pytest.fixture
+def environments(tmp_path):
+    res = []
+    for name in ("rob", "sim", "old"):
+        (tmp_path / name).mkdir()
+        (tmp_path / name / "Dockerfile").write_text("FROM osrf/ros:humble-desktop\n")
+        res.append({"name": name, "path": tmp_path / name / ".ros_env_param.yaml"})
+        # Generated in 2020, before the images were built. old is generated again after its build
+        if name != "old":
+            os.utime(tmp_path / name / "Dockerfile", (1.6e9, 1.6e9))
+    return res
+
+
+def test_one_request_per_list(tmp_path, monkeypatch, environments):
+    containers = {"rob": {"id": "rob-1", "running": True, "usage": {"cpu": 10.0, "memory": 200 * 2**20}},
+                  "old": {"id": "old-1", "running": False}}
+    images = {"rob": {"created": "2024-05-01T12:00:00Z"}, "old": {"created": "2024-05-01T12:00:00Z"}}
+    with docker_stub(str(tmp_path / "docker.sock"), containers=containers, images=images) as stub:
+        monkeypatch.setenv("DOCKER_HOST", f"unix://{stub.socket_path}")
+        status = env_status(environments)
+        rows = {row["name"]: row for row in status.sample()}
+        # The containers, the images and the stats of the running container
+        assert stub.requests == 3
+        assert (rows["rob"]["state"], rows["rob"]["memory"], rows["rob"]["cpu"]) == ("running", "200 MiB", "-")
+        assert rows["rob"]["image"].endswith("old") and "Dockerfile newer" not in rows["rob"]["image"]
+        assert (rows["sim"]["state"], rows["sim"]["image"]) == ("absent", "not built")
+        assert (rows["old"]["state"], rows["old"]["memory"]) == ("exited", "-")
+        assert rows["old"]["image"].endswith("Dockerfile newer")
+
+        # The CPU usage is measured from the previous sample of the same object
+        stub.containers["rob"]["usage"]["cpu"] = 10.5
+        assert float(status.sample()[0]["cpu"].removesuffix(" %")) > 0
+        assert stub.requests == 6
+
+
+def test_with_the_cli(fake_docker, workspace, tmp_path):
+    docker_generator("rob", None, False, ["./ws"], False, ros_distro="humble", ros_type="ros2", output_dir="rob")
+    subprocess.run(["docker", "compose", "build"], cwd=tmp_path / "rob", check=True)
+    subprocess.run(["docker", "compose", "up", "-d"], cwd=tmp_path / "rob", check=True)
+    rows = env_status([{"name": "rob", "path": tmp_path / "rob" / ".ros_env_param.yaml"}, {"name": "sim", "path": tmp_path / "sim.yaml"}]).sample()
+    # No cgroup nor API to read the usage from
+    assert [(row["state"], row["cpu"], row["memory"]) for row in rows] == [("running", "-", "-"), ("absent", "-", "-")]
+    # The image of the fake docker is from 2024, before the generated Dockerfile
+    assert rows[0]["image"].endswith("old, Dockerfile newer")
+
+
+def test_formats():
+    assert parseCreatedAt("2024-05-01 12:00:00 +0200 CEST") == parseCreatedAt("2024-05-01 10:00:00 +0000 UTC")
+    assert formatDuration(30) == "30 seconds"
+    assert formatDuration(60) == "1 minute"
+    assert formatDuration(3 * 86400 + 5) == "3 days"
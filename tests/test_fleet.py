@@ -0,0 +1,70 @@
+import sys
+import time
+import threading
+import subprocess
+import pytest
+import fleet as fleet_module
+from fleet import fleet, formatTable
+from docker_generator import docker_generator
+from RosEnvParam import RosEnvParam
+
+
+@pytest.fixture
+def manifest(fake_docker, workspace, tmp_path):
+    lines = ["parallelism: 2", "environments:"]
+    for name in ("rob_a", "rob_b", "rob_c"):
+        gen = docker_generator(name, None, False, ["./ws"], False, ros_distro="humble", ros_type="ros2", output_dir=name)
+        RosEnvParam.generate(f"{name}/.ros_env_param.yaml", gen)
+        lines.append(f"    - {name}/.ros_env_param.yaml")
+    (tmp_path / "ros_env_fleet.yaml").write_text("\n".join(lines) + "\n")
+    return tmp_path / "ros_env_fleet.yaml"
+
+
+def test_load(manifest):
+    environments = fleet.load(manifest)
+    assert environments.parallelism == 2
+    assert [environment["name"] for environment in environments.environments] == ["rob_a", "rob_b", "rob_c"]
+    assert environments.environments[1]["path"] == manifest.parent / "rob_b" / ".ros_env_param.yaml"
+    assert fleet.load(manifest, 8).parallelism == 8
+
+
+def test_status(manifest):
+    subprocess.run(["docker", "compose", "build"], cwd=manifest.parent / "rob_b", check=True)
+    subprocess.run(["docker", "compose", "up", "-d"], cwd=manifest.parent / "rob_b", check=True)
+    rows = fleet.load(manifest).status()
+    assert [(row["name"], row["container"], row["image"]) for row in rows] == [("rob_a", "absent", "not built"), ("rob_b", "running", "built"), ("rob_c", "absent", "not built")]
+
+
+def test_parallelism_bound(manifest, monkeypatch, capsys):
+    running = []
+    maximum = []
+    lock = threading.Lock()
+
+    def runProcess(command, onStdout, onStderr, cwd, env):
+        with lock:
+            running.append(cwd.name)
+            maximum.append(len(running))
+        onStdout(f"{command[-1]} in {cwd.name}\n")
+        time.sleep(0.2)
+        with lock:
+            running.remove(cwd.name)
+        return subprocess.CompletedProcess(command, 1 if cwd.name == "rob_b" else 0)
+    monkeypatch.setattr(fleet_module, "runProcess", runProcess)
+
+    results = fleet.load(manifest).run("stop")
+    assert max(maximum) == 2
+    assert [(result["name"], result["success"], result["code"]) for result in results] == [("rob_a", True, 0), ("rob_b", False, 1), ("rob_c", True, 0)]
+    # The lines of each environment are prefixed with its name
+    assert sorted(capsys.readouterr().out.splitlines()) == ["[rob_a] stop in rob_a", "[rob_b] stop in rob_b", "[rob_c] stop in rob_c"]
+
+
+@pytest.mark.skipif(sys.version_info < (3, 12), reason="ros-env.py needs python 3.12")
+def test_build_every_environment(manifest, fake_docker):
+    results = fleet.load(manifest).run("build")
+    assert all(result["success"] for result in results)
+    assert {"rob_a", "rob_b", "rob_c"} <= set(fake_docker()["images"])
+
+
+def test_table():
+    assert formatTable([{"name": "rob_a", "result": "ok"}, {"name": "b", "result": "failed (1)"}], ["name", "result"]) == [
+        "NAME   RESULT    ", "rob_a  ok        ", "b      failed (1)"]
@@ -0,0 +1,92 @@
+import os
+import json
+import tarfile
+import subprocess
+import pytest
+import image_bundle as image_bundle_module
+from image_bundle import image_bundle
+from docker_generator import docker_generator
+from docker_tools import inspectImage
+
+
+# The param file give another image name: the image is the one compose tagged, named after the container
+ROS_ENV = {"image_name": "ros-env/rob", "container_name": "rob"}
+
+
+@pytest.fixture
+def project(fake_docker, workspace, tmp_path):
+    docker_generator("rob", None, False, ["./ws"], False, ros_distro="humble", ros_type="ros2")
+    (tmp_path / ".ros_env_param.yaml").write_text("container_name: rob\n")
+    return tmp_path
+
+
+def build(build_hash: str) -> None:
+    subprocess.run(["docker", "compose", "build"], env=dict(os.environ, ROS_ENV_BUILD_HASH=build_hash), check=True)
+
+
+def useNewDaemon(monkeypatch, path) -> None:
+    # The target computer: another state, without the image
+    monkeypatch.setenv("FAKE_DOCKER_STATE", str(path))
+
+
+def test_export_and_import(project, monkeypatch):
+    build("v1")
+    manifest = image_bundle.export(ROS_ENV, ".ros_env_param.yaml", "rob.tar")
+    assert manifest["image"] == "rob"
+    assert all(layer["included"] for layer in manifest["layers"])
+    assert "docker-compose.yaml" in manifest["files"]
+
+    useNewDaemon(monkeypatch, project / "target.json")
+    assert inspectImage("rob") == None
+    image_bundle.load("rob.tar", "target")
+    assert inspectImage("rob")["RootFS"]["Layers"] == [layer["diff_id"] for layer in manifest["layers"]]
+    assert (project / "target" / ".ros_env_param.yaml").read_text() == "container_name: rob\n"
+    assert (project / "target" / "Dockerfile").read_text() == (project / "Dockerfile").read_text()
+
+
+@pytest.mark.parametrize("save_format", ["oci", "legacy"])
+def test_since_skip_the_layers_already_imported(project, monkeypatch, save_format):
+    monkeypatch.setenv("FAKE_DOCKER_SAVE_FORMAT", save_format)
+    compressed = []
+    compressLayer = image_bundle_module.compressLayer
+    monkeypatch.setattr(image_bundle_module, "compressLayer", lambda *args: compressed.append(args[1]) or compressLayer(*args))
+    build("v1")
+    image_bundle.export(ROS_ENV, ".ros_env_param.yaml", "v1.tar")
+    build("v2")
+    compressed.clear()
+    manifest = image_bundle.export(ROS_ENV, ".ros_env_param.yaml", "v2.tar", since=["v1.tar"])
+    assert [layer["included"] for layer in manifest["layers"]] == [False, False, True]
+    # The shared layers are never compressed, even when their digest is only known once read
+    assert len(compressed) == 1
+    with tarfile.open("v2.tar") as bundle:
+        assert [name for name in bundle.getnames() if name.startswith("image/layers/")] == [f"image/layers/{manifest['layers'][2]['diff_id']}.tar.zst"]
+    assert not list(project.glob("v2.tar.*"))
+
+    useNewDaemon(monkeypatch, project / "target.json")
+    with pytest.raises(RuntimeError, match="import one of these bundles first: v1.tar"):
+        image_bundle.load("v2.tar", "target")
+    image_bundle.load("v1.tar", "target")
+    image_bundle.load("v2.tar", "target")
+    assert inspectImage("rob")["RootFS"]["Layers"] == [layer["diff_id"] for layer in manifest["layers"]]
+
+
+def test_export_without_image(project):
+    with pytest.raises(RuntimeError, match="The image rob doesn't exist"):
+        image_bundle.export(ROS_ENV, ".ros_env_param.yaml", "rob.tar")
+
+
+def test_import_of_a_damaged_bundle(project, monkeypatch):
+    build("v1")
+    image_bundle.export(ROS_ENV, ".ros_env_param.yaml", "rob.tar")
+    data = (project / "rob.tar").read_bytes()
+    (project / "truncated.tar").write_bytes(data[:len(data) // 2])
+    (project / "garbage.tar").write_bytes(b"not a bundle" * 100)
+    (project / "empty.tar").write_bytes(b"")
+
+    with pytest.raises(RuntimeError, match="garbage.tar is not a readable bundle"):
+        image_bundle.export(ROS_ENV, ".ros_env_param.yaml", "v2.tar", since=["garbage.tar"])
+
+    useNewDaemon(monkeypatch, project / "target.json")
+    for name in ("truncated.tar", "garbage.tar", "empty.tar"):
+        with pytest.raises(RuntimeError, match=f"{name} is not a readable bundle"):
+            image_bundle.load(name, "target")
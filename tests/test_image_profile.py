@@ -0,0 +1,54 @@
+import re
+import yaml
+import pytest
+from docker_generator import docker_generator
+from docker_tools import docker_tools
+from image_profile import image_profile, IMAGE_PROFILES
+from RosEnvParam import RosEnvParam
+
+
+def generate(profile: str) -> docker_generator:
+    gen = docker_generator("rob", None, False, ["./ws"], False, ros_distro="humble", ros_type="ros2", profile=profile)
+    RosEnvParam.generate(".ros_env_param.yaml", gen)
+    return gen
+
+
+@pytest.mark.parametrize("profile, base, gui, ros, gazebo", [
+    ("desktop", "osrf/ros:humble-desktop", True, True, False),
+    ("sim", "osrf/ros:humble-desktop-full", True, True, True),
+    ("base", "ros:humble-ros-base", False, True, False),
+    ("headless", "ros:humble-ros-base", False, False, False)])
+def test_profiles(workspace, profile, base, gui, ros, gazebo):
+    generate(profile)
+    with open("Dockerfile", "r") as dockerfile_file:
+        dockerfile = dockerfile_file.read()
+    assert dockerfile.splitlines()[0] == f"FROM {base} "
+    assert "build-essential" in dockerfile and "python3-rosdep" in dockerfile
+    assert ("ffmpeg" in dockerfile) == gui and ("matplotlib" in dockerfile) == gui
+    assert ("ros-humble-ros2-control" in dockerfile) == ros
+    assert bool(re.search(r"gz|gazebo", dockerfile)) == gazebo
+    with open("docker-compose.yaml", "r") as compose_file:
+        service = yaml.safe_load(compose_file)["services"]["gz_test"]
+    assert ("/tmp/.X11-unix:/tmp/.X11-unix" in service["volumes"]) == gui
+    # Saved in the param file for create_from
+    assert RosEnvParam.load(".ros_env_param.yaml")["option"]["image profile"] == profile
+
+
+def test_unknown_profile():
+    assert IMAGE_PROFILES == ["desktop", "base", "headless", "sim"]
+    with pytest.raises(ValueError):
+        image_profile("full")
+
+
+def test_build_compared_with_the_other_profiles(fake_docker, workspace, capsys):
+    generate("desktop")
+    assert docker_tools.build(profile="desktop")
+    generate("headless")
+    capsys.readouterr()
+    assert docker_tools.build(profile="headless")
+    lines = capsys.readouterr().out.splitlines()
+    size = next(line for line in lines if line.startswith("Image size: "))
+    assert size.endswith("GB (headless profile)")
+    desktop = next(line for line in lines if line.startswith("\tdesktop: "))
+    # The fake images are bigger with a bigger Dockerfile
+    assert re.search(r"\(-\d+\.\d\d GB\), built in \d+\.\ds on ", desktop)
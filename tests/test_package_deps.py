@@ -0,0 +1,97 @@
+import os
+import time
+import pytest
+import package_deps
+from package_deps import rosdep_cache, workspace_scan, getWorkspaceDependencies, resolveRule, isConditionTrue
+from docker_generator import docker_generator
+
+PACKAGE_XML = """<?xml version="1.0"?>
+<package format="3">
+  <name>{name}</name>
+  {depends}
+  <test_depend>ament_lint_auto</test_depend>
+</package>
+"""
+
+
+def addPackage(folder, name: str, *depends: str) -> None:
+    (folder / name).mkdir(parents=True, exist_ok=True)
+    (folder / name / "package.xml").write_text(PACKAGE_XML.format(name=name, depends="\n  ".join(depends)))
+
+
+@pytest.fixture
+def packages(workspace):
+    src = workspace / "src"
+    addPackage(src, "driver", "<depend>rclcpp</depend>", "<depend>msgs</depend>", "<exec_depend>python3-serial</exec_depend>",
+               '<depend condition="$ROS_VERSION == 1">roscpp</depend>', "<build_depend>unknown_key</build_depend>")
+    addPackage(src, "msgs", "<buildtool_depend>rosidl_default_generators</buildtool_depend>")
+    addPackage(src, "ignored", "<depend>boost</depend>")
+    (src / "ignored" / "COLCON_IGNORE").write_text("")
+    addPackage(workspace / "build", "copy", "<depend>boost</depend>")
+    return workspace
+
+
+@pytest.fixture
+def rosdep():
+    # The cached database of humble, nothing is downloaded
+    cache = rosdep_cache("humble")
+    cache.data = {"fetched": time.time(), "release": "jammy", "ros packages": ["rclcpp", "rosidl_default_generators"],
+                  "keys": {"python3-serial": {"apt": ["python3-serial"], "pip": []}, "boost": {"apt": ["libboost-all-dev"], "pip": []}}}
+    cache.write()
+    return cache
+
+
+def test_resolve_rule():
+    assert resolveRule({"ubuntu": ["libfoo-dev"]}, "jammy") == {"apt": ["libfoo-dev"], "pip": []}
+    assert resolveRule({"ubuntu": {"focal": ["a"], "*": ["b"]}}, "jammy") == {"apt": ["b"], "pip": []}
+    assert resolveRule({"ubuntu": {"jammy": None}}, "jammy") == {"apt": [], "pip": []}
+    assert resolveRule({"ubuntu": {"pip": {"packages": ["pyfoo"]}}}, "jammy") == {"apt": [], "pip": ["pyfoo"]}
+    assert resolveRule({"ubuntu": {"focal": ["a"]}}, "jammy") == None
+    assert resolveRule({"fedora": ["a"]}, "jammy") == None
+
+
+def test_conditions():
+    assert isConditionTrue(None, "ros2")
+    assert isConditionTrue("$ROS_VERSION == 2", "ros2")
+    assert not isConditionTrue("$ROS_VERSION == 2", "ros")
+    assert isConditionTrue("$ROS_VERSION == 1 or $ROS_PYTHON_VERSION == 3", "ros2")
+    assert not isConditionTrue("$ROS_VERSION != 2 and $ROS_PYTHON_VERSION == 3", "ros2")
+
+
+def test_workspace_dependencies(packages, rosdep):
+    resolved, unresolved = getWorkspaceDependencies([str(packages)], "humble", "ros2", offline=True)
+    # msgs is in the workspace, roscpp is for ROS 1, the ignored folders are not scanned
+    assert resolved == {"apt": ["python3-serial", "ros-humble-rclcpp", "ros-humble-rosidl-default-generators"], "pip": []}
+    assert unresolved == ["unknown_key"]
+
+
+def test_scan_cached_by_mtime(packages, monkeypatch):
+    parsed = []
+    parse = package_deps.parsePackageXML
+    monkeypatch.setattr(package_deps, "parsePackageXML", lambda path: parsed.append(path.parent.name) or parse(path))
+    assert sorted(workspace_scan(str(packages)).scan()) == ["driver", "msgs"]
+    assert sorted(parsed) == ["driver", "msgs"]
+
+    parsed.clear()
+    assert sorted(workspace_scan(str(packages)).scan()) == ["driver", "msgs"]
+    assert parsed == []
+
+    xml = packages / "src" / "msgs" / "package.xml"
+    xml.write_text(xml.read_text().replace("</package>", "  <depend>boost</depend>\n</package>"))
+    os.utime(xml, ns=(time.time_ns() + 10**9, time.time_ns() + 10**9))
+    assert ["boost", None] in workspace_scan(str(packages)).scan()["msgs"]
+    assert parsed == ["msgs"]
+
+
+def test_offline_without_database():
+    with pytest.raises(ConnectionError):
+        rosdep_cache("humble", offline=True).load()
+    with pytest.raises(NameError):
+        rosdep_cache("unknown")
+
+
+def test_layer_of_the_package_dependencies(packages, rosdep):
+    docker_generator("rob", None, False, [str(packages)], False, ros_distro="humble", ros_type="ros2", offline=True, isPackageDeps=True)
+    with open("Dockerfile", "r") as dockerfile:
+        lines = dockerfile.read().split("# Dependencies of the workspace packages (package.xml)\n")[1].splitlines()
+    assert lines[:4] == ["RUN apt-get update && apt-get install -y \\ ", "\tpython3-serial \\ ", "\tros-humble-rclcpp \\ ", "\tros-humble-rosidl-default-generators \\ "]
@@ -0,0 +1,15 @@
+from package_index import getAptName, getPipName
+
+
+def test_apt_name():
+    assert getAptName("nano=6.2-1") == "nano"
+    assert getAptName(" libc6:amd64 ") == "libc6"
+    assert getAptName("nano/jammy-updates") == "nano"
+    assert getAptName("ros-humble-rclcpp") == "ros-humble-rclcpp"
+
+
+def test_pip_name():
+    assert getPipName("numpy==1.26") == "numpy"
+    assert getPipName("opencv-python[contrib]>=4") == "opencv-python"
+    assert getPipName("https://example.com/pkg.whl") == None
+    assert getPipName("-r requirements.txt") == None
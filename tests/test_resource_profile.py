@@ -0,0 +1,46 @@
+import sys
+import yaml
+import pytest
+import pathlib
+import subprocess
+from docker_generator import docker_generator
+from resource_profile import resource_profile
+from RosEnvParam import RosEnvParam
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+
+
+def test_profile_in_compose_and_param_file(workspace):
+    resources = resource_profile("2-3", 90, -1, 2048, "4g")
+    gen = docker_generator("rob", None, False, ["./ws"], False, ros_distro="humble", ros_type="ros2", resources=resources)
+    RosEnvParam.generate(".ros_env_param.yaml", gen)
+    with open("docker-compose.yaml", "r") as compose_file:
+        service = yaml.safe_load(compose_file)["services"]["gz_test"]
+    assert service["cpuset"] == "2-3"
+    assert service["cpu_shares"] == 2048
+    assert service["mem_limit"] == "4g"
+    assert service["ulimits"] == {"rtprio": {"soft": 90, "hard": 90}, "memlock": {"soft": -1, "hard": -1}}
+    assert service["cap_add"] == ["SYS_NICE"]
+    # create_from gives the saved profile back to the generator
+    saved = resource_profile.fromDict(RosEnvParam.load(".ros_env_param.yaml")["option"]["resources"])
+    assert saved.toDict() == resources.toDict()
+
+
+def test_no_profile_keep_the_docker_defaults():
+    assert not resource_profile.fromDict(None).isEnabled()
+    assert resource_profile().getCompose() == {}
+
+
+@pytest.mark.parametrize("cpuset, rtprio", [("2-", None), ("a", None), (None, 100)])
+def test_invalid_profile(cpuset, rtprio):
+    with pytest.raises(ValueError):
+        resource_profile(cpuset, rtprio)
+
+
+def test_jitter_script():
+    result = subprocess.run([sys.executable, str(ROOT / "rt_jitter.py"), "--duration", "0.05", "--priority", "0"],
+                            capture_output=True, text=True, check=True)
+    lines = result.stdout.splitlines()
+    assert "policy: SCHED_OTHER, period: 1000 us" in lines[0]
+    assert lines[1].startswith("latency (us): min ")
+    assert lines[2].startswith("overruns (latency > period): ")
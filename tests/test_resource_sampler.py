@@ -0,0 +1,62 @@
+import csv
+import time
+import types
+import pytest
+import cgroup_stats
+import resource_sampler as resource_sampler_module
+from resource_sampler import resource_sampler, FIELDS, formatSample
+from docker_stub import docker_stub
+
+
+@pytest.fixture
+def cgroup(tmp_path, monkeypatch):
+    # cgroup v2 folder of a container with the cgroupfs driver
+    monkeypatch.setattr(cgroup_stats, "CGROUP_ROOT", tmp_path / "cgroup")
+    path = tmp_path / "cgroup" / "docker" / "rob-1"
+    path.mkdir(parents=True)
+
+    def write(cpu_usec: int, memory: int, read: int, write: int) -> None:
+        (path / "cpu.stat").write_text(f"usage_usec {cpu_usec}\nuser_usec 0\nsystem_usec 0\n")
+        (path / "memory.current").write_text(f"{memory}\n")
+        (path / "io.stat").write_text(f"8:0 rbytes={read} wbytes={write} rios=1 wios=1\n259:0 rbytes=0 wbytes={write} rios=0 wios=1\n")
+    write(0, 100, 0, 0)
+    return write
+
+
+def test_cgroup_samples(cgroup, monkeypatch):
+    ticks = iter([10.0, 12.0])
+    monkeypatch.setattr(resource_sampler_module, "time", types.SimpleNamespace(monotonic=lambda: next(ticks), time=time.time))
+    sampler = resource_sampler("rob-1")
+    assert sampler.source == "cgroup"
+    assert sampler.sample() == None # Nothing to compare with
+    # The files are kept open and read again
+    cgroup(1_000_000, 2**20, 4000, 1000)
+    sample = sampler.sample()
+    sampler.close()
+    assert sample[1:] == (50.0, 2**20, 2000.0, 1000.0)
+    assert formatSample(sample) == "cpu   50.0 %   memory       1 MiB   read    0.00 MB/s   write    0.00 MB/s"
+
+
+def test_ring_buffer_and_csv(cgroup, tmp_path):
+    sampler = resource_sampler("rob-1", rate=200, size=3)
+    sampler.run(0.1)
+    sampler.close()
+    assert len(sampler.samples) == 3
+    sampler.exportCSV(str(tmp_path / "top.csv"))
+    with open(tmp_path / "top.csv", "r", newline="") as csv_file:
+        rows = list(csv.reader(csv_file))
+    assert rows[0] == FIELDS
+    assert len(rows) == 4 and rows[1][2] == "100"
+    assert sampler.summary()["memory bytes"] == (100, 100)
+
+
+def test_docker_stats_api_until_the_container_stop(tmp_path, monkeypatch):
+    containers = {"rob": {"id": "rob-1", "running": True, "usage": {"cpu": 1.0, "memory": 2**20}}}
+    with docker_stub(str(tmp_path / "docker.sock"), containers=containers) as stub:
+        monkeypatch.setenv("DOCKER_HOST", f"unix://{stub.socket_path}")
+        sampler = resource_sampler("rob-1", rate=50)
+        assert sampler.source == "docker stats API"
+        samples = []
+        sampler.run(5, lambda sample: samples.append(sample) or (len(samples) == 2 and stub.containers.pop("rob")))
+    assert sampler.stopped
+    assert len(samples) == 2 and samples[0][2] == 2**20
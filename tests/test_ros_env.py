@@ -0,0 +1,23 @@
+import re
+import ast
+import sys
+import pathlib
+import subprocess
+
+SCRIPT = pathlib.Path(__file__).resolve().parent.parent / "ros-env.py"
+
+
+def test_parser_modules_are_light():
+    # What ros-env.py imports before running a command, stop and kill then only add docker_tools
+    code = "import sys, RosEnvParam, dds_profile, image_profile; print(sorted({'docker_tools', 'docker_generator', 'asyncio'} & set(sys.modules)))"
+    result = subprocess.run([sys.executable, "-c", code], cwd=SCRIPT.parent, capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == "[]"
+
+
+def test_daemon_imports_the_modules_of_every_command():
+    source = SCRIPT.read_text()
+    listed = re.search(r"COMMAND_MODULES = (\[.*?\])", source, re.DOTALL).group(1)
+    modules = set(ast.literal_eval(listed))
+    imported = set(re.findall(r"^ +(?:from (\w+) import|import (\w+))", source, re.MULTILINE))
+    imported = {module for names in imported for module in names if module}
+    assert imported - modules == set()
@@ -0,0 +1,119 @@
+import sys
+import time
+import types
+import pytest
+from rosdistro_cache import rosdistro_cache
+from docker_generator import docker_generator
+
+
+INDEX = """
+distributions:
+  noetic: {distribution_type: ros1}
+  humble: {distribution_type: ros2}
+"""
+NEW_INDEX = INDEX + "  kilted: {distribution_type: ros2}\n"
+
+
+class Response:
+    def __init__(self, status_code: int, text: str = "", headers: dict = None):
+        self.status_code = status_code
+        self.text = text
+        self.headers = headers or {}
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise OSError(f"HTTP {self.status_code}")
+
+
+@pytest.fixture
+def server(monkeypatch):
+    """
+    The rosdistro index server, in place of the requests module: it answers 304 to the ETag of its index.
+
+    :return: the server state: index, etag and the headers of each request
+    """
+    server = types.SimpleNamespace(index=INDEX, etag='"v1"', last_modified=None, down=False, requests=[])
+
+    def get(url, headers=None, timeout=None):
+        if server.down:
+            raise OSError("Connection refused")
+        headers = dict(headers or {})
+        server.requests.append(headers)
+        if (server.etag != None and headers.get("If-None-Match") == server.etag) or \
+           (server.last_modified != None and headers.get("If-Modified-Since") == server.last_modified):
+            return Response(304)
+        validators = {"ETag": server.etag, "Last-Modified": server.last_modified}
+        return Response(200, server.index, {key: value for key, value in validators.items() if value != None})
+    monkeypatch.setitem(sys.modules, "requests", types.SimpleNamespace(get=get))
+    return server
+
+
+def test_fetched_once_per_ttl(server):
+    assert rosdistro_cache().getType("humble") == "ros2"
+    assert rosdistro_cache().getType("noetic") == "ros"
+    assert len(server.requests) == 1
+
+
+def test_expired_cache_is_revalidated(server):
+    rosdistro_cache().getType("humble")
+    cache = rosdistro_cache(ttl=0)
+    fetched = cache.data["fetched"]
+    time.sleep(0.01)
+    assert cache.getType("humble") == "ros2"
+    assert server.requests[1] == {"If-None-Match": '"v1"'}
+    assert rosdistro_cache().data["fetched"] > fetched
+
+
+def test_new_distro_within_the_ttl(server):
+    rosdistro_cache().getType("humble")
+    server.index, server.etag = NEW_INDEX, '"v2"'
+    assert rosdistro_cache().getType("kilted") == "ros2"
+    assert server.requests[1] == {"If-None-Match": '"v1"'}
+    # Still unknown once the cache is up to date: one request only
+    with pytest.raises(NameError, match="rolling distro is not supported"):
+        rosdistro_cache().getType("rolling")
+    assert len(server.requests) == 3
+
+
+def test_offline(server):
+    with pytest.raises(ConnectionError, match="Offline mode but no rosdistro index cached"):
+        rosdistro_cache(offline=True).getType("humble")
+    rosdistro_cache().getType("humble")
+    server.index, server.etag = NEW_INDEX, '"v2"'
+    assert rosdistro_cache(ttl=0, offline=True).getType("humble") == "ros2"
+    with pytest.raises(NameError):
+        rosdistro_cache(offline=True).getType("kilted")
+    assert len(server.requests) == 1
+
+
+def test_broken_cache_is_fetched_again(server):
+    rosdistro_cache().path.parent.mkdir(parents=True)
+    rosdistro_cache().path.write_text("{not yaml")
+    assert rosdistro_cache().getType("humble") == "ros2"
+    assert server.requests == [{}]
+
+
+def test_last_modified(server):
+    server.etag, server.last_modified = None, "Wed, 01 May 2024 12:00:00 GMT"
+    rosdistro_cache().getType("humble")
+    assert rosdistro_cache(ttl=0).getType("humble") == "ros2"
+    assert server.requests[1] == {"If-Modified-Since": "Wed, 01 May 2024 12:00:00 GMT"}
+
+
+def test_network_down(server, capsys):
+    server.down = True
+    with pytest.raises(ConnectionError, match="Error fetching ROS versions: Connection refused"):
+        rosdistro_cache().getType("humble")
+    server.down = False
+    rosdistro_cache().getType("humble")
+    server.down = True
+    # The expired cache is used
+    assert rosdistro_cache(ttl=0).getType("humble") == "ros2"
+    assert "Using the cached rosdistro index" in capsys.readouterr().out
+
+
+def test_one_request_for_many_environments(server, workspace):
+    for name in ("rob_a", "rob_b", "rob_c"):
+        gen = docker_generator(name, None, False, ["./ws"], False, ros_distro="humble", output_dir=name)
+        assert gen.ros_type == "ros2"
+    assert len(server.requests) == 1
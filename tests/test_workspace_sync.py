@@ -0,0 +1,94 @@
+import io
+import os
+import sys
+import json
+import shutil
+import tarfile
+import subprocess
+import pytest
+from conftest import ROOT
+from docker_generator import docker_generator
+from workspace_sync import workspace_sync, getContainerRoot
+import sync_agent
+
+
+def makeTar(files: dict, deleted: list[str] = ()) -> bytes:
+    with io.BytesIO() as buffer:
+        with tarfile.open(fileobj=buffer, mode="w") as tar:
+            for name, data in list(files.items()) + [(".ros-env-sync.json", json.dumps(list(deleted)).encode())]:
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+                tar.addfile(info, io.BytesIO(data))
+        return buffer.getvalue()
+
+
+@pytest.mark.skipif(os.geteuid() != 0, reason="chown needs root")
+def test_apply_as_root_give_the_files_to_the_user(tmp_path):
+    # Workspace COPY'd without --chown: the files belong to root, the home to the user
+    home = tmp_path / "home"
+    (home / "ws" / "src").mkdir(parents=True)
+    (home / "ws" / "src" / "a.py").write_text("old\n")
+    (home / "ws" / "src" / "gone.py").write_text("old\n")
+    os.chown(home, 1000, 1000)
+
+    result = subprocess.run([sys.executable, str(ROOT / "sync_agent.py"), "apply", str(home)],
+                            input=makeTar({"ws/src/a.py": b"new\n", "ws/src/pkg/b.py": b"b\n"}, ["ws/src/gone.py"]), capture_output=True)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == b"1"
+    assert (home / "ws" / "src" / "a.py").read_text() == "new\n"
+    assert not (home / "ws" / "src" / "gone.py").exists()
+    for path in ("ws", "ws/src", "ws/src/a.py", "ws/src/pkg", "ws/src/pkg/b.py"):
+        assert (os.stat(home / path).st_uid, os.stat(home / path).st_gid) == (1000, 1000), path
+
+
+def test_container_root_is_the_home_of_its_user():
+    assert getContainerRoot({"Config": {"User": "alice"}}) == "~alice"
+    assert getContainerRoot({"Config": {"User": "alice:alice"}}) == "~alice"
+    assert getContainerRoot({"Config": {"User": ""}}) == "~"
+    assert getContainerRoot({"Config": {"User": "1000"}}) == "~"
+
+
+def test_sync_send_only_the_changes(fake_docker, workspace, tmp_path, monkeypatch):
+    docker_generator("rob", None, False, ["./ws"], False, ros_distro="humble", ros_type="ros2")
+    home = tmp_path / "home"
+    shutil.copytree(workspace, home / "ws")
+    monkeypatch.setenv("FAKE_DOCKER_HOME", str(home))
+    with open(os.environ["FAKE_DOCKER_STATE"], "w") as state:
+        json.dump({"containers": {"rob": {"running": True, "image": "rob"}}, "images": {"rob": {}}}, state)
+
+    sync = workspace_sync("rob", ["./ws"])
+    host, changed, deleted = sync.diff()
+    assert (changed, deleted) == ([], [])
+    assert sync.apply(host, changed, deleted)
+
+    (workspace / "src" / "pkg" / "main.py").write_text("print('changed')\n")
+    (workspace / "src" / "pkg" / "new.py").write_text("")
+    (workspace / "build").mkdir()
+    (workspace / "build" / "artifact").write_text("")
+    sync = workspace_sync("rob", ["./ws"])
+    host, changed, deleted = sync.diff()
+    assert changed == ["ws/src/pkg/main.py", "ws/src/pkg/new.py"]
+    assert sync.apply(host, changed, deleted)
+    assert (home / "ws" / "src" / "pkg" / "main.py").read_text() == "print('changed')\n"
+
+    (workspace / "src" / "pkg" / "new.py").unlink()
+    sync = workspace_sync("rob", ["./ws"])
+    host, changed, deleted = sync.diff()
+    assert (changed, deleted) == ([], ["ws/src/pkg/new.py"])
+    assert sync.apply(host, changed, deleted)
+    assert not (home / "ws" / "src" / "pkg" / "new.py").exists()
+
+
+def test_sync_need_a_running_container(fake_docker, workspace):
+    docker_generator("rob", None, False, ["./ws"], False, ros_distro="humble", ros_type="ros2")
+    with pytest.raises(RuntimeError):
+        workspace_sync("rob", ["./ws"]).diff()
+
+
+def test_host_hashes_match_the_agent(workspace):
+    # Bigger than a chunk: the host and the container hash the files the same way
+    (workspace / "src" / "pkg" / "model.bin").write_bytes(os.urandom(3 << 20))
+    docker_generator("rob", None, False, ["./ws"], False, ros_distro="humble", ros_type="ros2")
+    files = workspace_sync("rob", ["./ws"]).scanHost()
+    assert files["ws/src/pkg/model.bin"] == [3 << 20, sync_agent.hashFile(workspace / "src" / "pkg" / "model.bin")]
+    assert files["ws/src/pkg/main.py"][1] == sync_agent.hashFile(workspace / "src" / "pkg" / "main.py")
@@ -0,0 +1,152 @@
+import io
+import os
+import json
+import pathlib
+import tarfile
+import hashlib
+from docker_tools import runProcess, getBuildContext, walkContext, readDockerignore, isIgnored, inspectContainer, hashFile, QUERY_TIMEOUT
+from rosdistro_cache import getCacheDir
+
+
+AGENT_PATH = pathlib.Path(__file__).resolve().parent / "sync_agent.py"
+DELETED_MEMBER = ".ros-env-sync.json" # Same name as in sync_agent.py
+CONTAINER_ROOT = "~" # The workspaces are copied in the home of the user of the image
+
+
+class workspace_sync:
+    """
+    Copy the changes of the workspaces COPY'd in the image into the running container, instead of building the
+    image again. A manifest of the files (size and sha256) of the container is kept in the cache: only the changed
+    files and the list of the deleted ones are sent, as one tar to one docker exec.
+    """
+
+    def __init__(self, container_name: str, volumes_path_list: list[str], compose_path: str = "docker-compose.yaml"):
+        """
+        :param volumes_path_list: the workspaces given to create, relative to the build context
+        :param compose_path: the compose file of the environment, which give the build context and the .dockerignore
+        """
+        self.container_name = container_name
+        self.root = CONTAINER_ROOT
+        self.context, self.dockerfile = getBuildContext(compose_path)
+        self.rules = readDockerignore(self.context, self.dockerfile)
+        # Name in the home of the container -> folder relative to the build context
+        self.workspaces = {}
+        for volume in volumes_path_list:
+            path = (self.context / volume).resolve()
+            self.workspaces[path.name] = path.relative_to(self.context.resolve()).as_posix()
+        self.path = getCacheDir() / "sync" / f"{container_name}.json"
+        try:
+            with open(self.path, "r") as manifest_file:
+                self.manifest = json.load(manifest_file)
+        except (OSError, json.JSONDecodeError):
+            self.manifest = {}
+
+    def save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".tmp")
+        with open(tmp, "w") as manifest_file:
+            json.dump(self.manifest, manifest_file)
+        os.replace(tmp, self.path)
+
+    def toContext(self, path: str) -> str:
+        """
+        :param path: path in the home of the container, starting with the workspace name
+        :return: the same path relative to the build context
+        """
+        name, _, relative = path.partition("/")
+        return f"{self.workspaces[name]}/{relative}"
+
+    def scanHost(self) -> dict:
+        """
+        Hash the files the build would copy. A file is hashed again only if its modification time or size changed.
+
+        :return: {path in the container home: [size, sha256]}
+        """
+        cached = self.manifest.get("host", {})
+        host = {}
+        files = {}
+        for name, folder in self.workspaces.items():
+            for relative, path in walkContext(self.context, self.context / folder, self.dockerfile):
+                stat = path.stat()
+                entry = cached.get(relative)
+                if entry == None or entry[0] != stat.st_mtime_ns or entry[1] != stat.st_size:
+                    sha = hashlib.sha256()
+                    hashFile(sha, path)
+                    entry = [stat.st_mtime_ns, stat.st_size, sha.hexdigest()]
+                host[relative] = entry
+                files[f"{name}/{relative.removeprefix(folder + '/')}"] = entry[1:]
+        self.manifest["host"] = host
+        return files
+
+    def scanContainer(self) -> dict:
+        """
+        Hash the files of the workspaces in the container, the ones the .dockerignore exclude are not managed.
+
+        :return: {path in the container home: [size, sha256]}
+        """
+        with open(AGENT_PATH, "r") as agent:
+            script = agent.read()
+        result = runProcess(["docker", "exec", "-u", "0", self.container_name, "python3", "-c", script, "scan", self.root, *self.workspaces],
+                            timeout=QUERY_TIMEOUT)
+        if result.returncode != 0:
+            raise RuntimeError(f"Can't list the files of the container: {result.stderr.strip()}")
+        return {path: entry for path, entry in json.loads(result.stdout).items() if not isIgnored(self.rules, self.toContext(path))}
+
+    def diff(self, verify: bool = False) -> tuple[dict, list[str], list[str]]:
+        """
+        Compare the host with the manifest of the container. The container is scanned when the manifest belong to
+        another container (created again) or with verify.
+
+        :return: the host files, the changed or new paths and the deleted paths
+        """
+        container = inspectContainer(self.container_name)
+        if container == None or not container["State"]["Running"]:
+            raise RuntimeError("The isolate environment is not running. Start it first.")
+        self.root = getContainerRoot(container)
+        if verify or self.manifest.get("container") != container["Id"]:
+            self.manifest = {"container": container["Id"], "files": self.scanContainer(), "host": self.manifest.get("host", {})}
+        host = self.scanHost()
+        remote = self.manifest["files"]
+        changed = sorted(path for path, entry in host.items() if remote.get(path) != entry)
+        deleted = sorted(path for path in remote if path not in host)
+        return host, changed, deleted
+
+    def pack(self, changed: list[str], deleted: list[str]) -> bytes:
+        """
+        :return: a tar of the changed files, with the list of the deleted ones as last member
+        """
+        with io.BytesIO() as buffer:
+            with tarfile.open(fileobj=buffer, mode="w") as tar:
+                for path in changed:
+                    tar.add(self.context / self.toContext(path), arcname=path, recursive=False)
+                data = json.dumps(deleted).encode()
+                info = tarfile.TarInfo(DELETED_MEMBER)
+                info.size = len(data)
+                tar.addfile(info, io.BytesIO(data))
+            return buffer.getvalue()
+
+    def apply(self, host: dict, changed: list[str], deleted: list[str]) -> bool:
+        """
+        Send the changes in one docker exec, the manifest is only updated if they were applied.
+        """
+        with open(AGENT_PATH, "r") as agent:
+            script = agent.read()
+        # As root: the files COPY'd without --chown belong to root, the agent give the written files to the user
+        result = runProcess(["docker", "exec", "-i", "-u", "0", self.container_name, "python3", "-c", script, "apply", self.root],
+                            input=self.pack(changed, deleted))
+        if result.returncode != 0:
+            print("\nStandard error:", result.stderr)
+            return False
+        self.manifest["files"] = {path: host[path] for path in host}
+        self.save()
+        return True
+
+
+def getContainerRoot(container: dict) -> str:
+    """
+    :return: the home of the user of the container (~user), the commands of sync run as root
+    """
+    user = (container.get("Config") or {}).get("User", "").split(":")[0]
+    if not user or user == "root" or user.isdigit():
+        return CONTAINER_ROOT
+    return f"~{user}"